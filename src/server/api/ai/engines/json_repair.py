@@ -0,0 +1,166 @@
+import json
+import logging
+import re
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from api.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Which tier produced the parsed result: strict, repaired, regex, reprompt or failed
+json_parse_total = REGISTRY.counter(
+    "llm_json_parse_total",
+    "LLM JSON completions by the parse path that succeeded",
+    ("pipeline", "path"),
+)
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*([\s\S]*?)(?:```|$)", re.IGNORECASE)
+_ARRAY_START_RE = re.compile(r"\[\s*\{")
+_WORD_RE = re.compile(r"\w+")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def _as_array(data: Any) -> List[Any]:
+    if isinstance(data, list):
+        return data
+    # Models sometimes wrap the array, e.g. {"results": [...]}
+    if isinstance(data, dict):
+        lists = [value for value in data.values() if isinstance(value, list)]
+        if len(lists) == 1:
+            return lists[0]
+    raise ValueError("Parsed response is not a JSON array")
+
+
+def strip_code_fences(text: str) -> str:
+    match = _FENCE_RE.search(text)
+    return match.group(1) if match else text
+
+
+def repair_json_array(text: str) -> str:
+    """
+    Lenient single pass over a JSON-ish array: drops trailing commas, maps
+    Python True/False/None to JSON literals and, if the array was cut off,
+    keeps only the elements that were closed. Raises ValueError if nothing
+    usable is left.
+    """
+    match = _ARRAY_START_RE.search(text)
+    start = match.start() if match else text.find("[")
+    if start == -1:
+        raise ValueError("No JSON array found in response")
+
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    last_complete: Optional[int] = None
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            i += 1
+            continue
+
+        if ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in "[{":
+            stack.append("]" if ch == "[" else "}")
+            out.append(ch)
+        elif ch in "]}":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if not stack:
+                break
+            out.append(stack.pop())
+            if len(stack) == 1:
+                last_complete = len(out)
+            elif not stack:
+                break
+        elif ch.isalpha() or ch == "_":
+            word = _WORD_RE.match(text, i).group(0)
+            out.append(_PY_LITERALS.get(word, word))
+            i += len(word)
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if stack:
+        if last_complete is None:
+            raise ValueError("Truncated JSON array has no complete element")
+        logger.warning("JSON array was truncated, keeping the complete elements only")
+        return "".join(out[:last_complete]) + "]"
+    return "".join(out)
+
+
+def extract_json_array(response_text: str) -> List[Any]:
+    try:
+        json_match = re.search(r'\[\s*{[\s\S]*?}\s*\]', response_text)
+        if not json_match:
+            logger.error("No JSON array found in response: %s", response_text[:200])
+            raise ValueError("No valid JSON array found in response")
+
+        json_data = json.loads(json_match.group(0))
+        if not isinstance(json_data, list):
+            logger.error("Parsed response is not a JSON array: %s", json_data)
+            raise ValueError("Parsed response is not a JSON array")
+
+        logger.info("Successfully extracted JSON array with %d items", len(json_data))
+        return json_data
+    except json.JSONDecodeError as e:
+        logger.error("JSON parsing failed: %s", str(e))
+        raise ValueError(f"Invalid JSON format: {str(e)}")
+
+
+def parse_json_array(text: str) -> Tuple[List[Any], str]:
+    """Tries strict, lenient and regex parsing in turn; returns (data, path)."""
+    try:
+        return _as_array(json.loads(text.strip())), "strict"
+    except ValueError as e:
+        error = e
+    try:
+        return _as_array(json.loads(repair_json_array(strip_code_fences(text)))), "repaired"
+    except ValueError as e:
+        error = e
+    try:
+        return extract_json_array(text), "regex"
+    except ValueError:
+        raise error
+
+
+async def parse_json_array_with_repair(
+    raw_response: str,
+    reprompt: Callable[[str, str], Awaitable[str]],
+    pipeline: str,
+) -> List[Any]:
+    """
+    Parses a completion with the local tiers and only calls `reprompt(raw, error)`
+    for a corrected reply when all of them fail.
+    """
+    try:
+        data, path = parse_json_array(raw_response)
+        json_parse_total.inc(pipeline=pipeline, path=path)
+        if path != "strict":
+            logger.info(f"Parsed {pipeline} JSON via {path} path")
+        return data
+    except ValueError as e:
+        logger.warning(f"Local JSON parsing failed for {pipeline}: {str(e)}, re-prompting for valid JSON")
+        error = str(e)
+
+    retry_response = await reprompt(raw_response, error)
+    try:
+        data, _ = parse_json_array(retry_response)
+    except ValueError:
+        json_parse_total.inc(pipeline=pipeline, path="failed")
+        raise
+    json_parse_total.inc(pipeline=pipeline, path="reprompt")
+    return data
@@ -0,0 +1,82 @@
+import time
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from api.services.metrics import REGISTRY
+
+llm_request_seconds = REGISTRY.histogram("llm_request_seconds", "Time from sending an LLM call to its last token, by model", ("model", "outcome"))
+llm_time_to_first_token_seconds = REGISTRY.histogram("llm_time_to_first_token_seconds", "Time to the first streamed token of an LLM call", ("model",))
+llm_tokens_total = REGISTRY.counter("llm_tokens_total", "Tokens reported by the LLM provider", ("model", "kind"))
+
+
+def _model_name(serialized: Optional[Dict[str, Any]], kwargs: Dict[str, Any]) -> str:
+    params = kwargs.get("invocation_params") or {}
+    metadata = kwargs.get("metadata") or {}
+    name = params.get("model_name") or params.get("model") or metadata.get("ls_model_name")
+    if not name and serialized:
+        name = (serialized.get("kwargs") or {}).get("model_name")
+    return str(name or "unknown")
+
+
+def _usage(response: LLMResult) -> Tuple[Optional[int], Optional[int]]:
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens"), usage.get("output_tokens")
+    # ChatGroq reports non-streamed usage here instead
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens"), usage.get("completion_tokens")
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    Records latency and token usage per model for every call a chat model
+    makes, streamed or not. One instance is shared by all models.
+    """
+
+    # Called directly on the event loop instead of via a thread, as it only updates counters
+    run_inline = True
+
+    def __init__(self):
+        # run_id -> [model, started, tokens streamed so far]
+        self._runs: Dict[UUID, list] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs[run_id] = [_model_name(serialized, kwargs), time.perf_counter(), 0]
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs[run_id] = [_model_name(serialized, kwargs), time.perf_counter(), 0]
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        if not run[2]:
+            llm_time_to_first_token_seconds.observe(time.perf_counter() - run[1], model=run[0])
+        run[2] += 1
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        model, started, streamed = run
+        llm_request_seconds.observe(time.perf_counter() - started, model=model, outcome="ok")
+        prompt_tokens, completion_tokens = _usage(response)
+        # Streamed replies often come without usage; each streamed chunk is about one token
+        completion_tokens = completion_tokens or streamed
+        if prompt_tokens:
+            llm_tokens_total.inc(prompt_tokens, model=model, kind="prompt")
+        if completion_tokens:
+            llm_tokens_total.inc(completion_tokens, model=model, kind="completion")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            llm_request_seconds.observe(time.perf_counter() - run[1], model=run[0], outcome="error")
+
+
+llm_metrics_callback = LLMMetricsCallback()
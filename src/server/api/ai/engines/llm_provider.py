@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# LLM_PROVIDER selects the backend when models are built: "groq" (default) talks to
+# the Groq API, "local" is an offline stand-in for load tests and benchmarks.
+# Stand-in settings:
+#   LOCAL_LLM_LATENCY            time to first token: "fixed:<ms>", "uniform:<min_ms>:<max_ms>",
+#                                "normal:<mean_ms>:<sd_ms>" or "lognormal:<median_ms>:<sigma>"
+#   LOCAL_LLM_TOKENS_PER_SECOND  simulated generation rate after the first token
+#   LOCAL_LLM_SEED               varies the replies and the latency sequence
+#   LOCAL_LLM_PASS_RATE          share of checklist items marked as satisfied
+
+_VOCABULARY = (
+    "device", "intended", "use", "patients", "clinical", "performance", "predicate", "equivalent", "safety",
+    "effectiveness", "testing", "demonstrated", "design", "technological", "characteristics", "indications",
+    "population", "results", "verification", "validation", "study", "sensitivity", "specificity", "agreement",
+    "analytical", "accuracy", "precision", "labeling", "risk", "controls", "substantially", "regulatory",
+)
+_CHECKLIST_ITEM_RE = re.compile(r"^- (.+?) \(ID: ([^)]+)\)\s*$", re.MULTILINE)
+_SUBSECTION_BLOCK_RE = re.compile(r"^=== Subsection (\S+) ===$", re.MULTILINE)
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+SOP_HEADINGS = ["Purpose", "Scope", "Materials", "Procedure", "Quality Control", "Safety Considerations", "References", "Revision History"]
+PDF_FIELDS = [
+    "device_name", "k_number", "product_code", "regulation_number", "manufacturer", "clearance_date",
+    "indications_for_use", "intended_use", "technology", "performance_claims",
+]
+
+
+def _sample_latency(spec: str, rng: random.Random) -> float:
+    kind, *args = spec.split(":")
+    values = [float(a) for a in args]
+    if kind == "fixed":
+        ms = values[0]
+    elif kind == "uniform":
+        ms = rng.uniform(values[0], values[1])
+    elif kind == "normal":
+        ms = rng.gauss(values[0], values[1])
+    elif kind == "lognormal":
+        ms = values[0] * rng.lognormvariate(0.0, values[1])
+    else:
+        raise ValueError(f"Unknown latency distribution {spec!r}")
+    return max(ms, 0.0) / 1000
+
+
+def _seed_for(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+def _words(rng: random.Random, count: int) -> str:
+    sentences, words = [], []
+    for i in range(count):
+        words.append(rng.choice(_VOCABULARY))
+        if len(words) >= rng.randint(10, 18) or i == count - 1:
+            sentences.append(" ".join(words).capitalize() + ".")
+            words = []
+    return " ".join(sentences)
+
+
+def _validation_results(prompt: str, rng: random.Random, pass_rate: float) -> List[Dict[str, Any]]:
+    blocks = _SUBSECTION_BLOCK_RE.split(prompt)
+    # Batched prompts come back as [preamble, id, block, id, block, ...]
+    sections = list(zip(blocks[1::2], blocks[2::2])) if len(blocks) > 1 else [(None, prompt)]
+    results = []
+    for subsection_id, block in sections:
+        checklist = block.split("Content to validate:")[0]
+        for question, item_id in _CHECKLIST_ITEM_RE.findall(checklist):
+            validated = rng.random() < pass_rate
+            result = {
+                "id": item_id,
+                "question": question,
+                "validated": validated,
+                "status": "complete" if validated else "missing",
+                "comments": f"The content {'addresses' if validated else 'does not address'}: {question}",
+                "suggestion": "" if validated else f"Include specific details about {question.lower()} in the content.",
+                "tooltip": f"{'Addressed' if validated else 'Please address'}: {question}",
+            }
+            if subsection_id:
+                result = {"subsectionId": subsection_id, **result}
+            results.append(result)
+    return results
+
+
+def _render(prompt: str, rng: random.Random, pass_rate: float) -> str:
+    """Pick a schema-valid reply for the prompt families used in this service."""
+    if "Previous reply:" in prompt and "JSON array" in prompt:
+        # Repair follow-up: echo whatever array can be salvaged from the broken reply
+        from api.ai.engines.json_repair import parse_json_array
+        try:
+            data, _ = parse_json_array(prompt.split("Previous reply:", 1)[1])
+        except ValueError:
+            data = []
+        return json.dumps(data)
+    if "Return a JSON array of validation results" in prompt or "Return one JSON array covering every checklist item" in prompt:
+        return json.dumps(_validation_results(prompt, rng, pass_rate), indent=2)
+    if "Return a JSON object with these fields" in prompt:
+        return json.dumps({field: "N/A" for field in PDF_FIELDS})
+    if "Standard Operating Procedure" in prompt:
+        parts = ["# Standard Operating Procedure (SOP): Laboratory Procedure"]
+        for heading in SOP_HEADINGS:
+            parts.append(f"## {heading}\n{_words(rng, rng.randint(30, 70))}")
+        return "\n\n".join(parts)
+    if "150–300 words" in prompt or "150-300 words" in prompt:
+        return _words(rng, rng.randint(170, 280))
+    if "Intended Use Statement" in prompt:
+        return (
+            "The [deviceName] is intended to [intended_use]. It is intended for use with [targetPopulation]. "
+            "The device is indicated for [indications] in [clinicalSetting]. It is contraindicated for [contraindications]."
+        )
+    return _words(rng, rng.randint(60, 140))
+
+
+class LocalChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatGroq. Replies are a deterministic function of the
+    prompt and seed; latency follows `latency` plus `tokens_per_second`, so
+    benchmarks measure our own overhead rather than the provider's.
+    """
+
+    model_name: str = "llama3-8b-8192"
+    temperature: float = 0.0
+    max_tokens: Optional[int] = None
+    latency: str = "lognormal:250:0.5"
+    tokens_per_second: float = 400.0
+    seed: int = 0
+    pass_rate: float = 0.8
+    _latency_rng: random.Random = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        # Latency differs per call but the sequence is reproducible for a given seed
+        self._latency_rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "local-stand-in"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "latency": self.latency, "tokens_per_second": self.tokens_per_second}
+
+    def _prepare(self, messages: List[BaseMessage]):
+        prompt = "\n".join(m.content if isinstance(m.content, str) else str(m.content) for m in messages)
+        text = _render(prompt, random.Random(_seed_for(prompt) ^ self.seed), self.pass_rate)
+        tokens = _TOKEN_RE.findall(text)
+        if self.max_tokens:
+            tokens = tokens[:self.max_tokens]
+            text = "".join(tokens)
+        first_token = _sample_latency(self.latency, self._latency_rng)
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": len(tokens), "total_tokens": len(prompt) // 4 + len(tokens)}
+        return text, tokens, first_token, usage
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text, tokens, first_token, usage = self._prepare(messages)
+        time.sleep(first_token + len(tokens) * self._token_delay())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage, response_metadata={"model_name": self.model_name}))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text, tokens, first_token, usage = self._prepare(messages)
+        await asyncio.sleep(first_token + len(tokens) * self._token_delay())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage, response_metadata={"model_name": self.model_name}))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        text, tokens, first_token, usage = self._prepare(messages)
+        time.sleep(first_token)
+        for token in tokens:
+            time.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        text, tokens, first_token, usage = self._prepare(messages)
+        await asyncio.sleep(first_token)
+        for token in tokens:
+            await asyncio.sleep(self._token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def get_chat_model(model_name: str, temperature: float = 0.7, max_tokens: Optional[int] = None) -> BaseChatModel:
+    """
+    Build the chat model for `model_name` from the configured LLM_PROVIDER.
+
+    Provider retries are disabled because the LLM scheduler owns retry and backoff.
+    Every model reports latency and token usage through llm_metrics_callback.
+    """
+    from api.ai.engines.llm_metrics import llm_metrics_callback
+    provider = os.getenv("LLM_PROVIDER", "groq").lower()
+    if provider == "local":
+        model = LocalChatModel(
+            model_name=model_name,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            latency=os.getenv("LOCAL_LLM_LATENCY", "lognormal:250:0.5"),
+            tokens_per_second=float(os.getenv("LOCAL_LLM_TOKENS_PER_SECOND", "400")),
+            seed=int(os.getenv("LOCAL_LLM_SEED", "0")),
+            pass_rate=float(os.getenv("LOCAL_LLM_PASS_RATE", "0.8")),
+            callbacks=[llm_metrics_callback],
+        )
+        logger.info(f"Using local LLM stand-in for {model_name} (latency {model.latency}, {model.tokens_per_second} tokens/s)")
+        return model
+    if provider != "groq":
+        raise ValueError(f"Unknown LLM_PROVIDER {provider!r}, expected 'groq' or 'local'")
+
+    from langchain_groq import ChatGroq
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        logger.error("GROQ_API_KEY not found in environment variables")
+        raise ValueError("GROQ_API_KEY not set in environment variables")
+    kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+    return ChatGroq(api_key=api_key, model_name=model_name, temperature=temperature, max_retries=0, callbacks=[llm_metrics_callback], **kwargs)
+
+
+_shared_models: Dict[tuple, "Component[BaseChatModel]"] = {}
+
+
+def shared_chat_model(model_name: str, temperature: float = 0.7, max_tokens: Optional[int] = None) -> "Component[BaseChatModel]":
+    """
+    A lazily built chat model shared by every caller asking for the same
+    settings; call `.get()` (or `await .aget()`) on the result where the model is used.
+    """
+    from api.services import components
+    key = (model_name, temperature, max_tokens)
+    if key not in _shared_models:
+        name = f"llm:{model_name}@{temperature}" + (f"/{max_tokens}" if max_tokens else "")
+        _shared_models[key] = components.register(name, lambda: get_chat_model(model_name, temperature, max_tokens))
+    return _shared_models[key]
@@ -0,0 +1,384 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException
+
+from api.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Priority classes: lower value is served first
+PRIORITY_INTERACTIVE = 0  # chat, checklist fixes, suggestions a user is waiting on
+PRIORITY_BULK = 1         # generation and validation
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+# Requests/tokens per minute per model, overridable with
+# LLM_RATE_LIMITS="llama3-8b-8192=30:30000,llama-3.1-8b-instant=30:6000"
+DEFAULT_RATE_LIMITS = {
+    "llama3-8b-8192": (30, 30000),
+    "llama-3.1-8b-instant": (30, 6000),
+}
+DEFAULT_MODEL_LIMIT = (30, 6000)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+LLM_COMPLETION_TOKENS = int(os.getenv("LLM_COMPLETION_TOKENS", "1024"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+queue_depth = REGISTRY.gauge("llm_scheduler_queue_depth", "LLM calls waiting for a rate-limit slot", ["model", "priority"])
+inflight_gauge = REGISTRY.gauge("llm_scheduler_inflight", "LLM calls currently holding a slot", ["model"])
+wait_seconds = REGISTRY.histogram("llm_scheduler_wait_seconds", "Time spent queued before an LLM call was dispatched", ["model", "priority"])
+rejected_total = REGISTRY.counter("llm_scheduler_rejected_total", "LLM calls rejected with 429", ["model", "priority", "reason"])
+retries_total = REGISTRY.counter("llm_scheduler_retries_total", "LLM calls retried after a provider error", ["model", "status"])
+
+
+def estimate_tokens(*texts: str, completion_tokens: int = LLM_COMPLETION_TOKENS) -> int:
+    # Rough 4-characters-per-token estimate plus the completion budget
+    prompt_chars = sum(len(t) for t in texts if t)
+    return prompt_chars // 4 + completion_tokens
+
+
+def _parse_rate_limits(raw: Optional[str]) -> Dict[str, Tuple[int, int]]:
+    limits = dict(DEFAULT_RATE_LIMITS)
+    if not raw:
+        return limits
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            model, values = entry.rsplit("=", 1)
+            rpm, tpm = values.split(":")
+            limits[model.strip()] = (int(rpm), int(tpm))
+        except ValueError:
+            logger.warning(f"Ignoring malformed LLM_RATE_LIMITS entry: {entry}")
+    return limits
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a Retry-After / x-ratelimit-reset-* header value into seconds.
+    Accepts plain seconds ("7", "7.5") and Go-style durations ("1m30.5s", "250ms").
+    """
+    if not value:
+        return None
+    value = str(value).strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+def provider_status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def provider_retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    for header in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        parsed = parse_retry_after(headers.get(header))
+        if parsed is not None:
+            return parsed
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    status = provider_status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    name = type(exc).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = float(capacity)
+        self.rate = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+    def consume(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def drain(self, now: float) -> None:
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _Waiter:
+    __slots__ = ("future", "tokens", "priority", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, tokens: int, priority: int):
+        self.future = future
+        self.tokens = tokens
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+
+
+class _ModelLane:
+    def __init__(self, model: str, rpm: int, tpm: int, max_concurrency: int):
+        self.model = model
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm, rpm / 60.0)
+        self.tokens = TokenBucket(tpm, tpm / 60.0)
+        self.max_concurrency = max_concurrency
+        self.inflight = 0
+        self.paused_until = 0.0
+        self.waiters: List[Tuple[int, int, _Waiter]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.timer_due = math.inf
+
+    def pending(self) -> int:
+        return sum(1 for _, _, w in self.waiters if not w.future.done())
+
+    def pending_by_priority(self) -> Dict[int, int]:
+        counts = {p: 0 for p in PRIORITY_NAMES}
+        for priority, _, w in self.waiters:
+            if not w.future.done():
+                counts[priority] = counts.get(priority, 0) + 1
+        return counts
+
+
+class LLMScheduler:
+    """
+    Central admission control for LLM calls: per-model token buckets for
+    requests and tokens per minute, strict priority between interactive and
+    bulk work, a bounded wait queue, and retries with jittered backoff.
+    """
+
+    def __init__(
+        self,
+        rate_limits: Optional[Dict[str, Tuple[int, int]]] = None,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue: int = LLM_MAX_QUEUE,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+    ):
+        self.rate_limits = rate_limits or dict(DEFAULT_RATE_LIMITS)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self._lanes: Dict[str, _ModelLane] = {}
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        return cls(rate_limits=_parse_rate_limits(os.getenv("LLM_RATE_LIMITS")))
+
+    def _lane(self, model: str) -> _ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            rpm, tpm = self.rate_limits.get(model, DEFAULT_MODEL_LIMIT)
+            lane = _ModelLane(model, rpm, tpm, self.max_concurrency)
+            self._lanes[model] = lane
+        return lane
+
+    def _update_queue_gauges(self, lane: _ModelLane) -> None:
+        for priority, count in lane.pending_by_priority().items():
+            queue_depth.set(count, model=lane.model, priority=PRIORITY_NAMES.get(priority, str(priority)))
+        inflight_gauge.set(lane.inflight, model=lane.model)
+
+    def _estimated_wait(self, lane: _ModelLane) -> float:
+        now = time.monotonic()
+        backlog = lane.pending() + 1
+        return max(lane.paused_until - now, 0.0) + backlog * 60.0 / max(lane.rpm, 1)
+
+    def _schedule_pump(self, lane: _ModelLane, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        due = loop.time() + delay
+        if lane.timer is not None and lane.timer_due <= due:
+            return
+        if lane.timer is not None:
+            lane.timer.cancel()
+        lane.timer_due = due
+        lane.timer = loop.call_later(delay, self._on_timer, lane)
+
+    def _on_timer(self, lane: _ModelLane) -> None:
+        lane.timer = None
+        lane.timer_due = math.inf
+        self._pump(lane)
+
+    def _pump(self, lane: _ModelLane) -> None:
+        delay = 0.0
+        while lane.waiters and lane.inflight < lane.max_concurrency:
+            _, _, waiter = lane.waiters[0]
+            if waiter.future.done():
+                heapq.heappop(lane.waiters)
+                continue
+            now = time.monotonic()
+            delay = max(
+                lane.paused_until - now,
+                lane.requests.time_until(1, now),
+                lane.tokens.time_until(waiter.tokens, now),
+            )
+            if delay > 0:
+                break
+            heapq.heappop(lane.waiters)
+            lane.requests.consume(1, now)
+            lane.tokens.consume(waiter.tokens, now)
+            lane.inflight += 1
+            wait_seconds.observe(now - waiter.enqueued_at, model=lane.model, priority=PRIORITY_NAMES.get(waiter.priority, str(waiter.priority)))
+            waiter.future.set_result(None)
+        if delay > 0 and lane.waiters:
+            self._schedule_pump(lane, delay)
+        self._update_queue_gauges(lane)
+
+    def admit(self, model: str, priority: int = PRIORITY_BULK) -> None:
+        # Raises 429 when the wait queue is full; used up front by streaming
+        # endpoints so saturation is reported before the response starts
+        lane = self._lane(model)
+        if lane.pending() >= self.max_queue:
+            priority_name = PRIORITY_NAMES.get(priority, str(priority))
+            rejected_total.inc(model=model, priority=priority_name, reason="queue_full")
+            logger.warning(f"LLM queue for {model} is full ({lane.pending()} waiting), rejecting {priority_name} call")
+            raise too_many_requests(f"LLM capacity for {model} is saturated, please retry later", self._estimated_wait(lane))
+
+    async def acquire(self, model: str, tokens: int, priority: int = PRIORITY_BULK) -> None:
+        lane = self._lane(model)
+        priority_name = PRIORITY_NAMES.get(priority, str(priority))
+        self.admit(model, priority)
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(future, tokens, priority)
+        heapq.heappush(lane.waiters, (priority, next(self._seq), waiter))
+        self._pump(lane)
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(lane, future)
+            rejected_total.inc(model=model, priority=priority_name, reason="queue_timeout")
+            logger.warning(f"LLM call for {model} waited more than {self.queue_timeout}s for a slot")
+            raise too_many_requests(f"Timed out waiting for LLM capacity for {model}", self._estimated_wait(lane))
+        except BaseException:
+            self._abandon(lane, future)
+            raise
+
+    def _abandon(self, lane: _ModelLane, future: asyncio.Future) -> None:
+        # A slot may have been granted in the same tick the waiter gave up
+        if future.done() and not future.cancelled() and future.exception() is None:
+            self.release(lane.model)
+        else:
+            self._update_queue_gauges(lane)
+
+    def release(self, model: str) -> None:
+        lane = self._lane(model)
+        lane.inflight = max(lane.inflight - 1, 0)
+        self._pump(lane)
+
+    def penalize(self, model: str, retry_after: Optional[float]) -> None:
+        # Provider said we are over the limit: stop dispatching until it resets
+        lane = self._lane(model)
+        now = time.monotonic()
+        lane.requests.drain(now)
+        if retry_after:
+            lane.paused_until = max(lane.paused_until, now + retry_after)
+
+    @asynccontextmanager
+    async def slot(self, model: str, tokens: int, priority: int = PRIORITY_BULK):
+        await self.acquire(model, tokens, priority)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    async def run(
+        self,
+        model: str,
+        call: Callable[[], Awaitable[T]],
+        priority: int = PRIORITY_BULK,
+        tokens: int = LLM_COMPLETION_TOKENS,
+    ) -> T:
+        attempt = 0
+        while True:
+            async with self.slot(model, tokens, priority):
+                try:
+                    return await call()
+                except Exception as e:
+                    error = e
+                    status = provider_status_code(e)
+                    retry_after = provider_retry_after(e)
+                    if status == 429:
+                        self.penalize(model, retry_after)
+                    if not is_retryable(e) or attempt >= self.max_retries:
+                        if status == 429:
+                            rejected_total.inc(model=model, priority=PRIORITY_NAMES.get(priority, str(priority)), reason="provider_rate_limit")
+                            raise too_many_requests(f"LLM provider rate limit reached for {model}", retry_after or self._estimated_wait(self._lane(model)))
+                        raise
+            retries_total.inc(model=model, status=str(status or type(error).__name__))
+            backoff = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+            delay = max(retry_after or 0.0, backoff)
+            logger.warning(f"LLM call to {model} failed ({status or type(error).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        for lane in self._lanes.values():
+            lane.requests.time_until(0, now)
+            lane.tokens.time_until(0, now)
+        return {
+            model: {
+                "inflight": lane.inflight,
+                "queued": {PRIORITY_NAMES.get(p, str(p)): c for p, c in lane.pending_by_priority().items()},
+                "requests_available": round(lane.requests.tokens, 2),
+                "tokens_available": round(lane.tokens.tokens, 2),
+                "paused_for": round(max(lane.paused_until - now, 0.0), 2),
+                "limits": {"rpm": lane.rpm, "tpm": lane.tpm},
+            }
+            for model, lane in self._lanes.items()
+        }
+
+
+scheduler = LLMScheduler.from_env()
@@ -4,34 +4,27 @@ from fastapi import HTTPException, UploadFile
 from pydantic import BaseModel
 from typing import List, Optional
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
-from fuzzywuzzy import fuzz
-import pdfplumber
+import asyncio
 import re
 import os
 import json
-from dotenv import load_dotenv
+import numpy as np
 from api.ai.schema import IntendedUseRequest, IntendedUseResponse, PredicateSuggestResponse, PredicateDevice
+from api.ai.engines.llm_provider import shared_chat_model
+from api.ai.engines.pdf_510k_extractor import extract_510k_fields
+from api.ai.engines.predicate_ranker import rank as rank_predicates, get_encoder
+from api.services import predicate_index
+from api.ai.engines.llm_scheduler import scheduler, estimate_tokens, PRIORITY_INTERACTIVE, PRIORITY_BULK
 
 # Configure logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-# Load environment variables
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Environment variables are loaded from .env by api.services.db
 FDA_API_KEY = os.getenv("FDA_API_KEY", "4GDeXmlPiVhbLaPgD5sYUfJu0uKAGS5iokXIokwJ")
 
-if not GROQ_API_KEY:
-    logger.error("GROQ_API_KEY not found in environment variables")
-    raise ValueError("GROQ_API_KEY not set")
-
-# Initialize Grok LLM
-llm = ChatGroq(
-    api_key=GROQ_API_KEY,
-    model_name="llama3-8b-8192",
-    temperature=0.7
-)
+# Grok LLM (or the local stand-in when LLM_PROVIDER=local), built on first use and shared with api.main
+generation_llm = shared_chat_model("llama3-8b-8192", temperature=0.7)
 
 # Pydantic model for PDF parsing
 class PDFParseResponse(BaseModel):
@@ -71,16 +64,95 @@ async def generate_intended_use(payload: IntendedUseRequest) -> IntendedUseRespo
             ("system", system_prompt),
             ("user", "Generate the Intended Use Statement.")
         ])
-        chain = prompt | llm
-        result = await chain.ainvoke({})
+        chain = prompt | generation_llm.get()
+        result = await scheduler.run(
+            generation_llm.get().model_name,
+            lambda: chain.ainvoke({}),
+            priority=PRIORITY_INTERACTIVE,
+            tokens=estimate_tokens(system_prompt)
+        )
         intended_use = result.content if hasattr(result, 'content') else str(result)
         logger.info(f"Generated intended use statement: {intended_use[:100]}...")
         return IntendedUseResponse(intended_use=intended_use)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating intended use statement: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate intended use statement: {str(e)}")
 
 
+def _predicate_from_item(item: dict) -> Optional[PredicateDevice]:
+    device_name = item.get("device_name", "Unknown Device")
+    k_number_result = item.get("k_number", "Unknown")
+    regulation_number = item.get("regulation_number") or "Unknown"
+
+    # Normalize regulation number
+    if regulation_number and regulation_number != "Unknown":
+        regulation_number = re.sub(r"21 CFR\s*", "", regulation_number).strip()
+        if not re.match(r"^\d{3}\.\d{4}$", regulation_number):
+            logger.warning(f"Invalid regulation_number format for {k_number_result}: {regulation_number}")
+            regulation_number = "Unknown"
+
+    if not isinstance(device_name, str) or not isinstance(k_number_result, str):
+        logger.warning(f"Invalid data for item: {item}")
+        return None
+    return PredicateDevice(
+        name=device_name,
+        k_number=k_number_result,
+        manufacturer=item.get("applicant", "Unknown Manufacturer"),
+        clearance_date=item.get("decision_date", "Unknown"),
+        confidence=0.95,
+        regulation_number=regulation_number,
+    )
+
+def _rank_predicates(items: List[dict], description: str, k_number: Optional[str], query_vector=None, name_vectors=None) -> List[PredicateDevice]:
+    """
+    :param name_vectors: (K number -> row, matrix) from predicate_index.name_vectors, matched
+        to items by their _id.
+    """
+    candidates = []
+    for item in items:
+        try:
+            device = _predicate_from_item(item)
+        except Exception as e:
+            logger.warning(f"Error processing item {item}: {str(e)}")
+            continue
+        if device:
+            candidates.append((device, item.get("_id")))
+    if not description or k_number:
+        return [device for device, _ in candidates][:10]
+
+    vectors = None
+    if query_vector is not None and name_vectors is not None and len(name_vectors[0]):
+        index, matrix = name_vectors
+        rows = np.array([index.get(record_id, -1) for _, record_id in candidates], dtype=np.intp)
+        vectors = matrix[np.maximum(rows, 0)]
+        vectors[rows < 0] = np.nan
+    ranked = rank_predicates(
+        description,
+        [device.name for device, _ in candidates],
+        top_k=10,
+        query_vector=query_vector if vectors is not None else None,
+        vectors=vectors,
+    )
+    devices = []
+    for result in ranked:
+        device = candidates[result.index][0]
+        device.confidence = result.score
+        device.score_breakdown = result.components
+        devices.append(device)
+    return devices
+
+async def _embed_query(description: str) -> Optional[List[float]]:
+    encoder = get_encoder()
+    if not encoder or not description:
+        return None
+    try:
+        return list((await asyncio.to_thread(encoder, [description]))[0])
+    except Exception as e:
+        logger.warning(f"Could not embed predicate query, ranking on names only: {str(e)}")
+        return None
+
 async def suggest_predicate_devices(product_code: str, description: str, k_number: Optional[str] = None) -> PredicateSuggestResponse:
     logger.info(f"Suggesting predicates for product_code: {product_code}, description: {description}, k_number: {k_number or 'Not provided'}")
     base_url = "https://api.fda.gov/device/510k.json"
@@ -96,10 +168,30 @@ async def suggest_predicate_devices(product_code: str, description: str, k_numbe
             params["search"] = f"k_number:{k_number}"
         else:
             logger.warning(f"Invalid K-number format: {k_number}. Ignoring K-number in search.")
+            k_number = None
     if description and not k_number:
         keywords = "+".join([word for word in description.split()[:3] if len(word) > 3])
         params["search"] += f"+AND+{keywords}"
 
+    # The local index covers every clearance under the product code; openFDA is only asked
+    # for product codes (or K numbers) the index does not have yet
+    try:
+        if k_number or await predicate_index.has_product_code(product_code):
+            # The ranker scores every clearance under the product code, so no text prefilter is needed
+            records = await predicate_index.search(product_code=product_code, k_number=k_number)
+            if records:
+                query_vector = name_vectors = None
+                if description and not k_number and get_encoder() is not None:
+                    # Name vectors come from an in-memory matrix, not with every record
+                    query_vector, name_vectors = await asyncio.gather(
+                        _embed_query(description), predicate_index.name_vectors(product_code)
+                    )
+                devices = _rank_predicates(records, description, k_number, query_vector, name_vectors)
+                logger.info(f"Found {len(devices)} predicate devices in the local index for product_code: {product_code}, k_number: {k_number or 'Not provided'}")
+                return PredicateSuggestResponse(devices=devices)
+    except Exception as e:
+        logger.warning(f"Local predicate index unavailable, querying openFDA: {str(e)}")
+
     devices = []
     async with aiohttp.ClientSession() as session:
         try:
@@ -115,40 +207,7 @@ async def suggest_predicate_devices(product_code: str, description: str, k_numbe
                     logger.warning("No predicate devices found.")
                     return PredicateSuggestResponse(devices=[])
                 
-                for item in data["results"]:
-                    try:
-                        device_name = item.get("device_name", "Unknown Device")
-                        k_number_result = item.get("k_number", "Unknown")
-                        applicant = item.get("applicant", "Unknown Manufacturer")
-                        decision_date = item.get("decision_date", "Unknown")
-                        regulation_number = item.get("regulation_number", "Unknown")
-                        
-                        # Normalize regulation number
-                        if regulation_number and regulation_number != "Unknown":
-                            regulation_number = re.sub(r"21 CFR\s*", "", regulation_number).strip()
-                            if not re.match(r"^\d{3}\.\d{4}$", regulation_number):
-                                logger.warning(f"Invalid regulation_number format for {k_number_result}: {regulation_number}")
-                                regulation_number = "Unknown"
-                        
-                        if not isinstance(device_name, str) or not isinstance(k_number_result, str):
-                            logger.warning(f"Invalid data for item: {item}")
-                            continue
-                        relevance = 0.95
-                        if description and not k_number:
-                            relevance = fuzz.partial_ratio(description.lower(), device_name.lower()) / 100.0
-                        devices.append(PredicateDevice(
-                            name=device_name,
-                            k_number=k_number_result,
-                            manufacturer=applicant,
-                            clearance_date=decision_date,
-                            confidence=relevance,
-                            regulation_number=regulation_number,
-                        ))
-                    except Exception as e:
-                        logger.warning(f"Error processing item {item}: {str(e)}")
-                        continue
-                
-                devices = sorted(devices, key=lambda x: x.confidence, reverse=True)[:10]
+                devices = _rank_predicates(data["results"], description, k_number)
                 logger.info(f"Found {len(devices)} predicate devices for product_code: {product_code}, k_number: {k_number or 'Not provided'}")
                 
         except aiohttp.ClientError as e:
@@ -163,149 +222,81 @@ async def suggest_predicate_devices(product_code: str, description: str, k_numbe
 async def parse_510k_pdf(file: UploadFile) -> PDFParseResponse:
     logger.info(f"Parsing 510(k) PDF: {file.filename}")
     try:
-        with pdfplumber.open(file.file) as pdf:
-            text = "".join(page.extract_text() or "" for page in pdf.pages)
-            logger.debug(f"Extracted text: {text[:1000]}...")
-
-            if len(text.strip()) < 100:
-                logger.error("PDF contains insufficient text for parsing")
-                raise HTTPException(status_code=400, detail="PDF contains insufficient text for 510(k) parsing")
-
-            # Initialize variables
-            device_name = None
-            k_number = None
-            product_code = None
-            regulation_number = None
-            manufacturer = None
-            clearance_date = None
-            indications_for_use = None
-            intended_use = None
-            technology = None
-            performance_claims = None
-
-            # Extract Device Name
-            device_name_match = re.search(r"(?:Trade/Device Name|Device Name|Trade Name):\s*(.+?)(?:\n|$)", text, re.IGNORECASE)
-            device_name = device_name_match.group(1).strip() if device_name_match and device_name_match.group(1) else None
-            if not device_name:
-                device_name_match = re.search(r"(?:\b[A-Z][\w\s\-\(\)]{5,}\b)", text, re.IGNORECASE)
-                device_name = device_name_match.group(0).strip() if device_name_match and device_name_match.group(0) else "Unknown Device"
-            logger.debug(f"Device name extracted: {device_name}")
+        extracted = await extract_510k_fields(file)
+        text = extracted.excerpt
+        logger.debug(f"Extracted text: {text[:1000]}...")
 
-            # Extract K Number
-            k_number_match = re.search(r"(?:Re:\s*K(\d{6})|K\d{6})", text, re.IGNORECASE)
-            k_number = f"K{k_number_match.group(1)}" if k_number_match and k_number_match.group(1) else "Unknown"
-            logger.debug(f"K number extracted: {k_number}")
+        if extracted.text_chars < 100:
+            logger.error("PDF contains insufficient text for parsing")
+            raise HTTPException(status_code=400, detail="PDF contains insufficient text for 510(k) parsing")
 
-            # Extract Product Code
-            product_code_match = re.search(r"Product Code[s]?:\s*([\w;,\s]+?)(?:\n|$)", text, re.IGNORECASE)
-            product_code = product_code_match.group(1).strip().rstrip(";") if product_code_match and product_code_match.group(1) else "Unknown"
-            logger.debug(f"Product code extracted: {product_code}")
+        fields = extracted.fields
+        device_name = fields.get("device_name", "Unknown Device")
+        k_number = fields.get("k_number", "Unknown")
+        product_code = fields.get("product_code", "Unknown")
+        regulation_number = fields.get("regulation_number", "Unknown")
+        manufacturer = fields.get("manufacturer", "Unknown")
+        clearance_date = fields.get("clearance_date", "Unknown")
+        indications_for_use = fields.get("indications_for_use")
+        intended_use = fields.get("intended_use") or indications_for_use or "N/A"
+        technology = fields.get("technology", "N/A")
+        performance_claims = fields.get("performance_claims", "N/A")
+        logger.debug(f"Regex fields extracted: {sorted(fields)}")
 
-            # Extract Regulation Number
-            regulation_number_match = re.search(
-                r"(?:Regulation Number|CFR Number|Regulation No\.|21 CFR)\s*:?\s*(\d{3}\.\d{4}|\d{2}\.\d{3}\.\d{4})(?:\s|$|\n)",
-                text,
-                re.IGNORECASE
-            )
-            regulation_number = regulation_number_match.group(1).strip() if regulation_number_match and regulation_number_match.group(1) else "Unknown"
-            logger.debug(f"Regulation number extracted: {regulation_number}")
-            # Extract Manufacturer
-            manufacturer_match = re.search(r"(?:Applicant|Manufacturer):\s*(.+?)(?:\n|$|510\(k\))", text, re.IGNORECASE)
-            manufacturer = manufacturer_match.group(1).strip() if manufacturer_match and manufacturer_match.group(1) else "Unknown"
-            logger.debug(f"Manufacturer extracted: {manufacturer}")
+        # Fallback to Grok LLM for missing fields
+        if not indications_for_use or not technology or not performance_claims or indications_for_use == "N/A" or technology == "N/A" or performance_claims == "N/A":
+            logger.info("Falling back to Grok LLM for missing fields")
+            prompt = f"""
+            You are an expert in FDA 510(k) submissions. Extract the following fields from the provided 510(k) document text:
+            - Device Name
+            - K Number
+            - Product Code
+            - Regulation Number
+            - Manufacturer
+            - Clearance Date
+            - Indications for Use
+            - Intended Use
+            - Technology
+            - Performance Claims
+            Return a JSON object with these fields. If a field cannot be identified, return "N/A" for that field. Ensure the output is valid JSON.
+            Text (first 4000 characters): {text[:4000]}...
+            """
+            chain = ChatPromptTemplate.from_template(prompt) | generation_llm.get()
+            try:
+                result = await scheduler.run(generation_llm.get().model_name, lambda: chain.ainvoke({}), priority=PRIORITY_BULK, tokens=estimate_tokens(prompt))
+                logger.debug(f"Grok raw response: {result.content}")
+                grok_data = json.loads(result.content)
+                device_name = device_name if device_name and device_name != "Unknown Device" else grok_data.get("device_name", "Unknown Device")
+                k_number = k_number if k_number and k_number != "Unknown" else grok_data.get("k_number", "Unknown")
+                product_code = product_code if product_code and product_code != "Unknown" else grok_data.get("product_code", "Unknown")
+                regulation_number = regulation_number if regulation_number and regulation_number != "Unknown" else grok_data.get("regulation_number", "Unknown")
+                manufacturer = manufacturer if manufacturer and manufacturer != "Unknown" else grok_data.get("manufacturer", "Unknown")
+                clearance_date = clearance_date if clearance_date and clearance_date != "Unknown" else grok_data.get("clearance_date", "Unknown")
+                indications_for_use = indications_for_use or grok_data.get("indications_for_use", "N/A")
+                intended_use = intended_use or grok_data.get("intended_use", indications_for_use or "N/A")
+                technology = technology or grok_data.get("technology", "N/A")
+                performance_claims = performance_claims or grok_data.get("performance_claims", "N/A")
+            except json.JSONDecodeError as e:
+                logger.warning(f"Failed to parse Grok response: {result.content}")
+                grok_data = {}
+            except HTTPException as e:
+                # LLM capacity is saturated; keep the regex results rather than failing the upload
+                logger.warning(f"Skipping Grok fallback for missing fields: {e.detail}")
 
-            # Extract Clearance Date
-            clearance_date_match = re.search(r"(?:Decision Date|Clearance Date|Date of Decision):\s*(\w{3}\s+\d{1,2},\s+\d{4})", text, re.IGNORECASE)
-            clearance_date = clearance_date_match.group(1).strip() if clearance_date_match and clearance_date_match.group(1) else "Unknown"
-            logger.debug(f"Clearance date extracted: {clearance_date}")
-
-            # Extract Indications for Use
-            indications_match = re.search(
-                r"(?:Statement of Indications? for Use|Indications? for Use)\s*:?\s*(.+?)(?:\n\n|Enclosure|\Z|510\(k\)|Substantial Equivalence)",
-                text, re.IGNORECASE | re.DOTALL
-            )
-            indications_for_use = indications_match.group(1).strip() if indications_match and indications_match.group(1) else None
-            if indications_for_use:
-                indications_for_use = re.sub(r"\(Division Sign-off\).*", "", indications_for_use, flags=re.DOTALL).strip()
-                logger.debug(f"Indications for use extracted: {indications_for_use[:100]}...")
-            else:
-                logger.debug("No indications for use found via regex")
-
-            # Extract Intended Use
-            intended_use_match = re.search(
-                r"(?:Intended Use|Intended Purpose|Intended Use Statement)\s*:?\s*(.+?)(?:\n\n|Enclosure|\Z|510\(k\)|Substantial Equivalence)",
-                text, re.IGNORECASE | re.DOTALL
-            )
-            intended_use = intended_use_match.group(1).strip() if intended_use_match and intended_use_match.group(1) else indications_for_use or "N/A"
-            logger.debug(f"Intended use extracted: {intended_use[:100]}...")
-
-            # Extract Technology
-            technology_match = re.search(
-                r"(?:Technological Characteristics|Technology|Device Description)\s*:?\s*(.+?)(?:\n\n|Enclosure|\Z|510\(k\)|Substantial Equivalence)",
-                text, re.IGNORECASE | re.DOTALL
-            )
-            technology = technology_match.group(1).strip() if technology_match and technology_match.group(1) else "N/A"
-            logger.debug(f"Technology extracted: {technology[:100]}...")
-
-            # Extract Performance Claims
-            performance_claims_match = re.search(
-                r"(?:Performance Data|Performance Claims|Clinical Performance|Test Results)\s*:?\s*(.+?)(?:\n\n|Enclosure|\Z|510\(k\)|Substantial Equivalence)",
-                text, re.IGNORECASE | re.DOTALL
-            )
-            performance_claims = performance_claims_match.group(1).strip() if performance_claims_match and performance_claims_match.group(1) else "N/A"
-            logger.debug(f"Performance claims extracted: {performance_claims[:100]}...")
-
-            # Fallback to Grok LLM for missing fields
-            if not indications_for_use or not technology or not performance_claims or indications_for_use == "N/A" or technology == "N/A" or performance_claims == "N/A":
-                logger.info("Falling back to Grok LLM for missing fields")
-                prompt = f"""
-                You are an expert in FDA 510(k) submissions. Extract the following fields from the provided 510(k) document text:
-                - Device Name
-                - K Number
-                - Product Code
-                - Regulation Number
-                - Manufacturer
-                - Clearance Date
-                - Indications for Use
-                - Intended Use
-                - Technology
-                - Performance Claims
-                Return a JSON object with these fields. If a field cannot be identified, return "N/A" for that field. Ensure the output is valid JSON.
-                Text (first 4000 characters): {text[:4000]}...
-                """
-                chain = ChatPromptTemplate.from_template(prompt) | llm
-                try:
-                    result = await chain.ainvoke({})
-                    logger.debug(f"Grok raw response: {result.content}")
-                    grok_data = json.loads(result.content)
-                    device_name = device_name if device_name and device_name != "Unknown Device" else grok_data.get("device_name", "Unknown Device")
-                    k_number = k_number if k_number and k_number != "Unknown" else grok_data.get("k_number", "Unknown")
-                    product_code = product_code if product_code and product_code != "Unknown" else grok_data.get("product_code", "Unknown")
-                    regulation_number = regulation_number if regulation_number and regulation_number != "Unknown" else grok_data.get("regulation_number", "Unknown")
-                    manufacturer = manufacturer if manufacturer and manufacturer != "Unknown" else grok_data.get("manufacturer", "Unknown")
-                    clearance_date = clearance_date if clearance_date and clearance_date != "Unknown" else grok_data.get("clearance_date", "Unknown")
-                    indications_for_use = indications_for_use or grok_data.get("indications_for_use", "N/A")
-                    intended_use = intended_use or grok_data.get("intended_use", indications_for_use or "N/A")
-                    technology = technology or grok_data.get("technology", "N/A")
-                    performance_claims = performance_claims or grok_data.get("performance_claims", "N/A")
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Failed to parse Grok response: {result.content}")
-                    grok_data = {}
-
-            response = PDFParseResponse(
-                device_name=device_name,
-                k_number=k_number,
-                intended_use=intended_use,
-                indications_for_use=indications_for_use,
-                technology=technology,
-                performance_claims=performance_claims,
-                product_code=product_code,
-                regulation_number=regulation_number,
-                manufacturer=manufacturer,
-                clearance_date=clearance_date
-            )
-            logger.info(f"Parsed PDF: {response.dict()}")
-            return response
+        response = PDFParseResponse(
+            device_name=device_name,
+            k_number=k_number,
+            intended_use=intended_use,
+            indications_for_use=indications_for_use,
+            technology=technology,
+            performance_claims=performance_claims,
+            product_code=product_code,
+            regulation_number=regulation_number,
+            manufacturer=manufacturer,
+            clearance_date=clearance_date
+        )
+        logger.info(f"Parsed PDF: {response.dict()}")
+        return response
     except Exception as e:
         logger.error(f"Error parsing PDF: {str(e)}")
         raise HTTPException(
@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import pdfplumber
+from fastapi import UploadFile
+
+from api.services.content_extractor import run_in_pool
+from api.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 510(k) summaries put the fields on the first few pages. Those are read first,
+# and later pages only when none of the key fields were found there.
+PDF_510K_FRONT_PAGES = int(os.getenv("PDF_510K_FRONT_PAGES", "6"))
+PDF_510K_MAX_PAGES = int(os.getenv("PDF_510K_MAX_PAGES", "30"))
+PDF_510K_CACHE_SIZE = int(os.getenv("PDF_510K_CACHE_SIZE", "256"))
+# Text handed to the LLM when regex extraction leaves fields missing
+LLM_EXCERPT_CHARS = 4000
+
+pdf_510k_parse_total = REGISTRY.counter("pdf_510k_parse_total", "510(k) PDF field extractions by cache outcome", ("outcome",))
+pdf_510k_parse_seconds = REGISTRY.histogram("pdf_510k_parse_seconds", "Time to read and scan a 510(k) PDF that was not cached")
+
+# Every field label, in one alternation, so the text is scanned once for all of them.
+# Labels that the original per-field patterns only accepted with a colon keep it.
+_LABELS = {
+    "device_name": r"(?:Trade/Device Name|Device Name|Trade Name):",
+    "k_number": r"Re:\s*K\d{6}|\bK\d{6}\b",
+    "product_code": r"Product Codes?:",
+    "regulation_number": r"Regulation Number|CFR Number|Regulation No\.|21 CFR",
+    "manufacturer": r"(?:Applicant|Manufacturer):",
+    "clearance_date": r"(?:Decision Date|Clearance Date|Date of Decision):",
+    "indications_for_use": r"Statement of Indications? for Use|Indications? for Use",
+    "intended_use": r"Intended Use Statement|Intended Use|Intended Purpose",
+    "technology": r"Technological Characteristics|Technology|Device Description",
+    "performance_claims": r"Performance Data|Performance Claims|Clinical Performance|Test Results",
+}
+_LABEL_RE = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in _LABELS.items()), re.IGNORECASE)
+
+# What follows a label, matched anchored at the label's end
+_INLINE_VALUES = {
+    "device_name": re.compile(r"\s*(.+)"),
+    "product_code": re.compile(r"\s*([\w;,\s]+?)(?:\n|$)"),
+    "regulation_number": re.compile(r"\s*:?\s*(\d{3}\.\d{4}|\d{2}\.\d{3}\.\d{4})(?:\s|$)"),
+    "manufacturer": re.compile(r"\s*(.+?)(?:\n|$|510\(k\))", re.IGNORECASE),
+    "clearance_date": re.compile(r"\s*(\w{3}\s+\d{1,2},\s+\d{4})"),
+}
+# Free-text sections run from the label to the first of these
+_BLOCK_START_RE = re.compile(r"\s*:?\s*")
+_BLOCK_END_RE = re.compile(r"\n\n|Enclosure|510\(k\)|Substantial Equivalence", re.IGNORECASE)
+_K_DIGITS_RE = re.compile(r"\d{6}")
+_DIVISION_SIGN_OFF_RE = re.compile(r"\(Division Sign-off\).*", re.DOTALL)
+_DEVICE_NAME_FALLBACK_RE = re.compile(r"\b[A-Z][\w\s\-\(\)]{5,}\b", re.IGNORECASE)
+_KEY_FIELDS = ("device_name", "indications_for_use", "intended_use")
+
+
+@dataclass
+class Extracted510k:
+    sha256: str
+    page_count: int
+    pages_read: int
+    text_chars: int
+    # Raw regex results; fields that were not found are absent
+    fields: Dict[str, str] = field(default_factory=dict)
+    excerpt: str = ""
+
+
+def _field_value(name: str, text: str, end: int, label: str) -> Optional[str]:
+    if name == "k_number":
+        return f"K{_K_DIGITS_RE.search(label).group(0)}"
+    if name in _INLINE_VALUES:
+        match = _INLINE_VALUES[name].match(text, end)
+        if not match or not match.group(1):
+            return None
+        value = match.group(1).strip()
+        return value.rstrip(";") if name == "product_code" else value
+    start = _BLOCK_START_RE.match(text, end).end()
+    # At least one character belongs to the section, as with the original lazy `.+?`
+    stop = _BLOCK_END_RE.search(text, start + 1)
+    value = text[start:stop.start() if stop else len(text)].strip()
+    if name == "indications_for_use":
+        value = _DIVISION_SIGN_OFF_RE.sub("", value).strip()
+    return value or None
+
+
+def parse_fields(text: str, device_name_fallback: bool = True) -> Dict[str, str]:
+    """
+    Locate every field label in one pass over `text` and read each field's
+    value from its first label occurrence that has one.
+
+    :param device_name_fallback: Without a device name label, use the first capitalised run of words.
+    """
+    fields: Dict[str, str] = {}
+    for match in _LABEL_RE.finditer(text):
+        name = match.lastgroup
+        if name in fields:
+            continue
+        value = _field_value(name, text, match.end(), match.group(0))
+        if value:
+            fields[name] = value
+            if len(fields) == len(_LABELS):
+                break
+    if device_name_fallback and "device_name" not in fields:
+        fallback = _DEVICE_NAME_FALLBACK_RE.search(text)
+        if fallback:
+            fields["device_name"] = fallback.group(0).strip()
+    return fields
+
+
+def _read_pages(data: bytes, start: int, stop: int) -> Tuple[int, str]:
+    """Runs in a worker process; text of pages [start, stop) and the page count."""
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        pages = pdf.pages[start:stop]
+        return len(pdf.pages), "\n".join(page.extract_text() or "" for page in pages)
+
+
+def _read_and_parse(data: bytes, front_pages: int, max_pages: int) -> Tuple[int, int, str, Dict[str, str]]:
+    page_count, text = _read_pages(data, 0, front_pages)
+    pages_read = min(page_count, front_pages)
+    fields = parse_fields(text, device_name_fallback=False)
+    if not any(name in fields for name in _KEY_FIELDS) and page_count > pages_read and max_pages > pages_read:
+        _, more = _read_pages(data, pages_read, max_pages)
+        text = f"{text}\n{more}"
+        pages_read = min(page_count, max_pages)
+    return page_count, pages_read, text, parse_fields(text)
+
+
+class _LRUCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Extracted510k]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Extracted510k]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, value: Extracted510k) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = _LRUCache(PDF_510K_CACHE_SIZE)
+
+
+def clear_cache() -> None:
+    _cache.clear()
+
+
+async def extract_510k_fields(file: UploadFile) -> Extracted510k:
+    """
+    Read a 510(k) summary PDF and pull out its fields with regexes.
+
+    Parsing runs in the extraction process pool and reads only the front
+    pages unless they hold none of the key fields. Results are cached by the
+    sha256 of the file, so re-uploading the same PDF skips parsing.
+
+    :param file: The uploaded PDF.
+    :return: The fields found, plus the text excerpt used for the LLM fallback.
+    """
+    data = await file.read()
+    sha256 = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+    cached = _cache.get(sha256)
+    if cached is not None:
+        pdf_510k_parse_total.inc(outcome="hit")
+        logger.info(f"Using cached 510(k) fields for {file.filename} ({sha256[:12]})")
+        return cached
+
+    pdf_510k_parse_total.inc(outcome="miss")
+    started = time.perf_counter()
+    page_count, pages_read, text, fields = await run_in_pool(_read_and_parse, data, PDF_510K_FRONT_PAGES, PDF_510K_MAX_PAGES)
+    pdf_510k_parse_seconds.observe(time.perf_counter() - started)
+    result = Extracted510k(
+        sha256=sha256,
+        page_count=page_count,
+        pages_read=pages_read,
+        text_chars=len(text.strip()),
+        fields=fields,
+        excerpt=text[:LLM_EXCERPT_CHARS],
+    )
+    _cache.put(sha256, result)
+    logger.info(f"Read {pages_read} of {page_count} pages of {file.filename}, found {sorted(fields)}")
+    return result
@@ -0,0 +1,117 @@
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+try:
+    from rapidfuzz import fuzz as _fuzz, process as _process, utils as _utils
+    RAPIDFUZZ = True
+except ImportError:  # pragma: no cover - rapidfuzz is in requirements.txt
+    from fuzzywuzzy import fuzz as _fuzz
+    RAPIDFUZZ = False
+
+logger = logging.getLogger(__name__)
+
+# How much each signal counts towards a candidate's score. A candidate without a
+# name embedding is scored on the fuzzy signals alone, renormalised.
+PREDICATE_WEIGHT_PARTIAL = float(os.getenv("PREDICATE_WEIGHT_PARTIAL", "0.5"))
+PREDICATE_WEIGHT_TOKEN_SET = float(os.getenv("PREDICATE_WEIGHT_TOKEN_SET", "0.2"))
+PREDICATE_WEIGHT_EMBEDDING = float(os.getenv("PREDICATE_WEIGHT_EMBEDDING", "0.3"))
+
+Encoder = Callable[[List[str]], Sequence[Sequence[float]]]
+_encoder: Optional[Encoder] = None
+
+
+@dataclass
+class RankedCandidate:
+    index: int
+    score: float
+    # partial_ratio, token_set_ratio and, when vectors were given, embedding; each 0-1
+    components: Dict[str, float] = field(default_factory=dict)
+
+
+def register_encoder(encoder: Encoder) -> None:
+    """Embed query text for ranking; main.py registers its sentence-transformer."""
+    global _encoder
+    _encoder = encoder
+
+
+def get_encoder() -> Optional[Encoder]:
+    return _encoder
+
+
+def _fuzzy(query: str, names: List[str], scorer) -> np.ndarray:
+    if RAPIDFUZZ:
+        # One C call over every name, on all cores
+        return _process.cdist([query], names, scorer=scorer, processor=_utils.default_process, workers=-1)[0] / 100.0
+    query = query.lower()
+    return np.array([scorer(query, name.lower()) for name in names], dtype=float) / 100.0
+
+
+def _cosine(query_vector: Sequence[float], vectors: Union[np.ndarray, Sequence[Optional[Sequence[float]]]]) -> np.ndarray:
+    """Cosine similarity per candidate, clipped to 0-1; NaN where a candidate has no vector."""
+    if isinstance(vectors, np.ndarray):
+        # Already a matrix, with NaN rows for candidates without a vector
+        if vectors.ndim != 2 or vectors.shape[1] != len(query_vector):
+            return np.full(len(vectors), np.nan)
+        query = np.asarray(query_vector, dtype=vectors.dtype)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        return np.clip(vectors @ query / np.where(norms == 0, 1, norms), 0.0, 1.0)
+    scores = np.full(len(vectors), np.nan)
+    present = [i for i, vector in enumerate(vectors) if vector is not None and len(vector) == len(query_vector)]
+    if not present:
+        return scores
+    matrix = np.asarray([vectors[i] for i in present], dtype=np.float32)
+    query = np.asarray(query_vector, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    similarity = matrix @ query / np.where(norms == 0, 1, norms)
+    scores[present] = np.clip(similarity, 0.0, 1.0)
+    return scores
+
+
+def rank(
+    query: str,
+    names: List[str],
+    top_k: int = 10,
+    query_vector: Optional[Sequence[float]] = None,
+    vectors: Optional[Union[np.ndarray, Sequence[Optional[Sequence[float]]]]] = None,
+) -> List[RankedCandidate]:
+    """
+    Score a description against every candidate device name at once.
+
+    :param query: The user's device description.
+    :param names: Candidate device names.
+    :param top_k: How many candidates to return.
+    :param query_vector: Embedding of `query`; blends in embedding similarity when given with `vectors`.
+    :param vectors: Precomputed name embeddings, aligned with `names`: a list with None entries
+        allowed, or a matrix with NaN rows for names without one.
+    :return: The best `top_k` candidates, best first, with their sub-scores.
+    """
+    if not names:
+        return []
+    partial = _fuzzy(query, names, _fuzz.partial_ratio)
+    token_set = _fuzzy(query, names, _fuzz.token_set_ratio)
+    score = PREDICATE_WEIGHT_PARTIAL * partial + PREDICATE_WEIGHT_TOKEN_SET * token_set
+    weight = np.full(len(names), PREDICATE_WEIGHT_PARTIAL + PREDICATE_WEIGHT_TOKEN_SET)
+
+    embedding = None
+    if query_vector is not None and vectors is not None and PREDICATE_WEIGHT_EMBEDDING > 0:
+        embedding = _cosine(query_vector, vectors)
+        has_vector = ~np.isnan(embedding)
+        score = score + np.where(has_vector, PREDICATE_WEIGHT_EMBEDDING * np.nan_to_num(embedding), 0.0)
+        weight = weight + np.where(has_vector, PREDICATE_WEIGHT_EMBEDDING, 0.0)
+    score = score / np.where(weight == 0, 1, weight)
+
+    top_k = min(top_k, len(names))
+    best = np.argpartition(-score, top_k - 1)[:top_k]
+    best = best[np.argsort(-score[best], kind="stable")]
+
+    ranked = []
+    for i in best:
+        components = {"partial_ratio": round(float(partial[i]), 4), "token_set_ratio": round(float(token_set[i]), 4)}
+        if embedding is not None and not np.isnan(embedding[i]):
+            components["embedding"] = round(float(embedding[i]), 4)
+        ranked.append(RankedCandidate(index=int(i), score=round(float(score[i]), 4), components=components))
+    return ranked
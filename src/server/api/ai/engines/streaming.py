@@ -0,0 +1,111 @@
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+# Headers that keep proxies (nginx, Netlify) from buffering the event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, data: Any) -> str:
+    payload = json.dumps(data, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def chunk_text(chunk: Any) -> str:
+    # astream yields strings after StrOutputParser and message chunks otherwise
+    if isinstance(chunk, str):
+        return chunk
+    content = getattr(chunk, "content", "")
+    return content if isinstance(content, str) else ""
+
+
+class PlaceholderRewriter:
+    """
+    Applies the post-processing used by the non-streaming endpoints to a token
+    stream: strips a leading "Here is ..." preamble and replaces "[key]" /
+    "[specific key]" placeholders. Text that could still turn into a
+    placeholder (an unclosed "[") is held back until it is resolved.
+    """
+
+    def __init__(self, replacements: Dict[str, str], prefix_pattern: Optional[str] = None, prefix_window: int = 400):
+        self.replacements: Dict[str, str] = {}
+        for key, value in replacements.items():
+            self.replacements[f"[{key}]"] = str(value)
+            self.replacements[f"[specific {key}]"] = str(value)
+        self.max_placeholder = max((len(p) for p in self.replacements), default=0)
+        self.prefix_pattern = re.compile(prefix_pattern, re.IGNORECASE) if prefix_pattern else None
+        self.prefix_window = prefix_window
+        self._prefix_done = self.prefix_pattern is None
+        self._started = False
+        self._pending = ""
+        self._parts: List[str] = []
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def _replace(self, text: str) -> str:
+        if "[" not in text:
+            return text
+        for placeholder, value in self.replacements.items():
+            text = text.replace(placeholder, value)
+        return text
+
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        self._parts.append(text)
+        return text
+
+    def feed(self, chunk: str) -> str:
+        self._pending += chunk
+        if not self._prefix_done:
+            head = self._pending.lstrip()
+            # Wait for the first full line so the preamble regex sees all of it
+            if "\n" not in head and len(head) < self.prefix_window:
+                return ""
+            self._pending = self.prefix_pattern.sub("", self._pending.lstrip(), count=1)
+            self._prefix_done = True
+
+        release_upto = len(self._pending)
+        open_idx = self._pending.rfind("[")
+        if open_idx != -1 and "]" not in self._pending[open_idx:] and len(self._pending) - open_idx < self.max_placeholder:
+            release_upto = open_idx
+        ready, self._pending = self._pending[:release_upto], self._pending[release_upto:]
+        return self._emit(self._replace(ready)) if ready else ""
+
+    def flush(self) -> str:
+        if not self._prefix_done:
+            self._pending = self.prefix_pattern.sub("", self._pending.lstrip(), count=1)
+            self._prefix_done = True
+        ready, self._pending = self._pending, ""
+        return self._emit(self._replace(ready)) if ready else ""
+
+
+class HeadingTracker:
+    """Reports required markdown headings as they first appear in a stream."""
+
+    def __init__(self, required: List[str]):
+        self.required = required
+        self.seen: List[str] = []
+        self._buffer = ""
+
+    def feed(self, chunk: str) -> List[str]:
+        self._buffer += chunk
+        new = [h for h in self.required if h not in self.seen and h in self._buffer]
+        self.seen.extend(new)
+        # Only a heading-length tail is needed to catch headings split across chunks
+        keep = max((len(h) for h in self.required), default=0)
+        self._buffer = self._buffer[-keep:]
+        return new
+
+    @property
+    def missing(self) -> List[str]:
+        return [h for h in self.required if h not in self.seen]
@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from api.ai.engines.json_repair import parse_json_array_with_repair
+from api.ai.engines.llm_scheduler import scheduler, estimate_tokens, PRIORITY_BULK
+from api.ai.prompts.json_repair import get_json_repair_prompt
+from api.services.log_pipeline import truncated
+from api.services.checklist_validator import prevalidate, DECISION_UNCERTAIN
+from api.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Prompt plus expected completion for one batched call; llama3-8b has an 8k context
+VALIDATION_BATCH_TOKEN_BUDGET = int(os.getenv("VALIDATION_BATCH_TOKEN_BUDGET", "6000"))
+# Rough completion size of one validation result object
+TOKENS_PER_RESULT = 90
+# Fail checklist items whose concepts the content never mentions and only send the rest to the LLM
+CHECKLIST_PREVALIDATION = os.getenv("CHECKLIST_PREVALIDATION", "true").lower() == "true"
+
+checklist_items_total = REGISTRY.counter(
+    "checklist_items_validated_total", "Checklist items by the tier that decided them", ("tier",)
+)
+validations_total = REGISTRY.counter(
+    "checklist_validations_total", "Subsection validations by whether they needed the LLM", ("outcome",)
+)
+escalation_ratio = REGISTRY.histogram(
+    "checklist_escalation_ratio", "Share of a subsection's checklist items escalated to the LLM",
+    buckets=(0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+)
+
+VALIDATION_RULES = """For each checklist item, perform a contextual and semantic analysis to determine if the content fully addresses the requirement. Focus on the meaning and intent of the content, ensuring it aligns with FDA 510(k) submission requirements for clarity, specificity, and completeness. Avoid requiring exact phrasing; instead, evaluate whether the content conveys the necessary information."""
+
+RESULT_FIELDS = """- id: string (checklist item ID)
+- question: string (checklist item text)
+- validated: boolean (true if the content satisfies the checklist item, false otherwise)
+- status: string ("complete" or "missing")
+- comments: string (explanation of validation result, e.g., why it was marked complete or missing)
+- suggestion: string (specific suggestion for addressing missing items, empty if validated)
+- tooltip: string (brief description for UI display, summarizing the validation result)"""
+
+# The instruction is passed as a variable so braces in user content are not read as template fields
+_VALIDATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "{instruction}"),
+    ("user", "Validate the content now.")
+])
+
+
+def _checklist_str(checklist_items: List[Dict]) -> str:
+    return "\n".join(f"- {item['question']} (ID: {item['id']})" for item in checklist_items)
+
+
+def build_validation_prompt(subsection_id: str, checklist_items: List[Dict], content: str) -> str:
+    return f"""
+You are a compliance checker for FDA 510(k) submissions. Validate the following content against each checklist item for subsection {subsection_id}.
+{VALIDATION_RULES}
+Return a JSON array of validation results, where each result includes:
+{RESULT_FIELDS}
+
+Checklist:
+{_checklist_str(checklist_items)}
+
+Content to validate:
+{content}
+
+Return only the JSON array of validation results, without any additional text.
+"""
+
+
+def build_batch_validation_prompt(entries: List[Dict]) -> str:
+    blocks = "\n".join(
+        f"""
+=== Subsection {entry['subsection_id']} ===
+Checklist:
+{_checklist_str(entry['checklist'])}
+
+Content to validate:
+{entry['content']}
+"""
+        for entry in entries
+    )
+    return f"""
+You are a compliance checker for FDA 510(k) submissions. Validate the content of each subsection below against the checklist items of that same subsection only.
+{VALIDATION_RULES}
+Return one JSON array covering every checklist item of every subsection, where each result includes:
+- subsectionId: string (the subsection the checklist item belongs to)
+{RESULT_FIELDS}
+{blocks}
+Return only the JSON array of validation results, without any additional text.
+"""
+
+
+def merge_validation_results(subsection_id: str, checklist_items: List[Dict], validation_results: List[Any]) -> List[Dict]:
+    # One entry per checklist item, in checklist order, with defaults for anything the model skipped
+    final_results = []
+    for item in checklist_items:
+        item_id = item["id"]
+        item_text = item["question"]
+        validation_item = next((v for v in validation_results if isinstance(v, dict) and v.get("id") == item_id), None)
+
+        if validation_item and validation_item.get("validated") is not None:
+            final_results.append({
+                "id": item_id,
+                "question": item_text,
+                "validated": validation_item.get("validated", False),
+                "status": validation_item.get("status", "missing"),
+                "comments": validation_item.get("comments", f"Content does not address: {item_text}"),
+                "suggestion": validation_item.get("suggestion", f"Include specific details about {item_text.lower()} in the content."),
+                "tooltip": validation_item.get("tooltip", f"Please address: {item_text}")
+            })
+        else:
+            logger.warning(f"No validation result for checklist item {item_id} in subsection {subsection_id}")
+            final_results.append({
+                "id": item_id,
+                "question": item_text,
+                "validated": False,
+                "status": "missing",
+                "comments": f"Content does not address: {item_text}",
+                "suggestion": f"Include specific details about {item_text.lower()} in the content.",
+                "tooltip": f"Please address: {item_text}"
+            })
+    return final_results
+
+
+async def _complete(llm, instruction: str) -> str:
+    chain = _VALIDATION_PROMPT | llm | StrOutputParser()
+    return await scheduler.run(
+        llm.model_name,
+        lambda: chain.ainvoke({"instruction": instruction}),
+        priority=PRIORITY_BULK,
+        tokens=estimate_tokens(instruction)
+    )
+
+
+async def _complete_json_array(llm, instruction: str, pipeline: str) -> List[Any]:
+    async def reprompt(raw_response: str, error: str) -> str:
+        repair_prompt = get_json_repair_prompt(raw_response, error)
+        chain = ChatPromptTemplate.from_template("{prompt}") | llm | StrOutputParser()
+        return await scheduler.run(
+            llm.model_name,
+            lambda: chain.ainvoke({"prompt": repair_prompt}),
+            priority=PRIORITY_BULK,
+            tokens=estimate_tokens(repair_prompt)
+        )
+
+    raw_response = await _complete(llm, instruction)
+    return await parse_json_array_with_repair(raw_response, reprompt, pipeline=pipeline)
+
+
+async def _validate_with_llm(llm, subsection_id: str, checklist_items: List[Dict], content: str) -> List[Dict]:
+    instruction = build_validation_prompt(subsection_id, checklist_items, content)
+    logger.debug("Validation prompt for %s:\n%s", subsection_id, truncated(instruction))
+    validation_results = await _complete_json_array(llm, instruction, pipeline="validate")
+    logger.debug("Raw LLM validation results for %s: %s", subsection_id, truncated(validation_results))
+    return merge_validation_results(subsection_id, checklist_items, validation_results)
+
+
+def _rule_result(verdict: Dict) -> Dict:
+    # The rule tier only ever fails items, and only for content too short to address them
+    question = verdict["question"]
+    return {
+        "id": verdict["id"],
+        "question": question,
+        "validated": False,
+        "status": "missing",
+        "comments": f"Content is too short to address: {question}",
+        "suggestion": f"Include specific details about {question.lower()} in the content.",
+        "tooltip": f"Please address: {question}"
+    }
+
+
+def _prevalidate(subsection_id: str, checklist_items: List[Dict], content: str) -> Tuple[List[Optional[Dict]], List[Dict]]:
+    """Returns rule results in checklist order (None where undecided) and the items left for the LLM."""
+    if not CHECKLIST_PREVALIDATION:
+        return [None] * len(checklist_items), list(checklist_items)
+    decided: List[Optional[Dict]] = []
+    uncertain: List[Dict] = []
+    for item, verdict in zip(checklist_items, prevalidate(subsection_id, checklist_items, content)):
+        if verdict["decision"] == DECISION_UNCERTAIN:
+            decided.append(None)
+            uncertain.append(item)
+            checklist_items_total.inc(tier="llm")
+        else:
+            decided.append(_rule_result(verdict))
+            checklist_items_total.inc(tier=f"rules_{verdict['decision']}")
+    if checklist_items:
+        escalation_ratio.observe(len(uncertain) / len(checklist_items))
+    validations_total.inc(outcome="escalated" if uncertain else "rules_only")
+    logger.info(f"Rule tier decided {len(checklist_items) - len(uncertain)}/{len(checklist_items)} items for {subsection_id}")
+    return decided, uncertain
+
+
+def _combine(decided: List[Optional[Dict]], llm_results: List[Dict]) -> List[Dict]:
+    # LLM results come back in the order of the escalated items, which is checklist order
+    remaining = iter(llm_results)
+    return [result if result is not None else next(remaining) for result in decided]
+
+
+async def validate_subsection(llm, subsection_id: str, checklist_items: List[Dict], content: str) -> List[Dict]:
+    """
+    Validate one subsection's content against its checklist. Keyword rules fail
+    the items the content never mentions; the rest go to the LLM in a single call.
+
+    :param llm: Chat model to run the validation on.
+    :param subsection_id: Subsection the checklist belongs to, e.g. "A2".
+    :param checklist_items: Checklist items with "id" and "question".
+    :param content: Content to validate.
+    :return: One validation result per checklist item.
+    """
+    decided, uncertain = _prevalidate(subsection_id, checklist_items, content)
+    llm_results = await _validate_with_llm(llm, subsection_id, uncertain, content) if uncertain else []
+    return _combine(decided, llm_results)
+
+
+def _entry_tokens(entry: Dict) -> int:
+    return estimate_tokens(entry["content"], _checklist_str(entry["checklist"]), completion_tokens=TOKENS_PER_RESULT * len(entry["checklist"]))
+
+
+def pack_batches(entries: List[Dict], token_budget: int = VALIDATION_BATCH_TOKEN_BUDGET) -> List[List[Dict]]:
+    # Greedy in input order; an entry that alone exceeds the budget gets its own batch
+    overhead = estimate_tokens(build_batch_validation_prompt([]), completion_tokens=0)
+    batches: List[List[Dict]] = []
+    current: List[Dict] = []
+    used = overhead
+    for entry in entries:
+        cost = _entry_tokens(entry)
+        if current and used + cost > token_budget:
+            batches.append(current)
+            current, used = [], overhead
+        current.append(entry)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def _validate_batch_once(llm, batch: List[Dict]) -> Dict[str, List[Dict]]:
+    if len(batch) == 1:
+        entry = batch[0]
+        return {entry["subsection_id"]: await _validate_with_llm(llm, entry["subsection_id"], entry["checklist"], entry["content"])}
+
+    instruction = build_batch_validation_prompt(batch)
+    subsection_ids = [entry["subsection_id"] for entry in batch]
+    logger.info(f"Batch validation prompt for {subsection_ids} ({estimate_tokens(instruction, completion_tokens=0)} tokens)")
+    try:
+        validation_results = await _complete_json_array(llm, instruction, pipeline="validate_batch")
+    except ValueError as e:
+        logger.warning(f"Batch validation for {subsection_ids} could not be parsed: {str(e)}, validating per subsection")
+        return await _validate_individually(llm, batch)
+
+    grouped: Dict[str, List[Any]] = {sid: [] for sid in subsection_ids}
+    for result in validation_results:
+        if isinstance(result, dict) and result.get("subsectionId") in grouped:
+            grouped[result["subsectionId"]].append(result)
+
+    # Subsections the model skipped entirely (e.g. a truncated reply) are retried on their own
+    missing = [entry for entry in batch if not grouped[entry["subsection_id"]] and entry["checklist"]]
+    results = {
+        entry["subsection_id"]: merge_validation_results(entry["subsection_id"], entry["checklist"], grouped[entry["subsection_id"]])
+        for entry in batch if entry not in missing
+    }
+    if missing:
+        logger.warning(f"Batch validation returned nothing for {[e['subsection_id'] for e in missing]}, validating per subsection")
+        results.update(await _validate_individually(llm, missing))
+    return results
+
+
+async def _validate_individually(llm, entries: List[Dict]) -> Dict[str, List[Dict]]:
+    results = await asyncio.gather(*(
+        _validate_with_llm(llm, entry["subsection_id"], entry["checklist"], entry["content"]) for entry in entries
+    ))
+    return {entry["subsection_id"]: result for entry, result in zip(entries, results)}
+
+
+async def validate_batch(llm, entries: List[Dict], token_budget: int = VALIDATION_BATCH_TOKEN_BUDGET) -> Dict[str, List[Dict]]:
+    """
+    Validate several subsections with as few LLM calls as the token budget allows.
+    Keyword rules fail the items the content never mentions first; only the rest are batched.
+
+    :param llm: Chat model to run the validation on.
+    :param entries: Dicts with "subsection_id", "content" and "checklist" (items with "id" and "question").
+    :param token_budget: Prompt plus expected completion tokens per call.
+    :return: Validation results keyed by subsection ID, one result per checklist item.
+    """
+    entries = [entry for entry in entries if entry["checklist"]]
+    if not entries:
+        return {}
+    decided: Dict[str, List[Optional[Dict]]] = {}
+    escalated: List[Dict] = []
+    for entry in entries:
+        decided[entry["subsection_id"]], uncertain = _prevalidate(entry["subsection_id"], entry["checklist"], entry["content"])
+        if uncertain:
+            escalated.append({**entry, "checklist": uncertain})
+
+    llm_results: Dict[str, List[Dict]] = {}
+    if escalated:
+        batches = pack_batches(escalated, token_budget)
+        logger.info(f"Validating {len(escalated)} of {len(entries)} subsections in {len(batches)} LLM call(s)")
+        for batch_results in await asyncio.gather(*(_validate_batch_once(llm, batch) for batch in batches)):
+            llm_results.update(batch_results)
+    return {sid: _combine(results, llm_results.get(sid, [])) for sid, results in decided.items()}
@@ -0,0 +1,23 @@
+def get_json_repair_prompt(raw_response: str, error: str) -> str:
+    """
+    Build a compact follow-up asking the model to re-emit a malformed JSON array.
+
+    Only the broken reply is sent back, not the original instruction, so the
+    retry costs roughly the size of the reply instead of the whole prompt.
+
+    Args:
+        raw_response (str): The completion that could not be parsed.
+        error (str): Parser error to point the model at the problem.
+
+    Returns:
+        str: Prompt text for the repair call.
+    """
+    return f"""
+Your previous reply was supposed to be a JSON array but it could not be parsed ({error}).
+Return the same data as a single valid JSON array: double-quoted keys and strings, lowercase true/false, no trailing commas, no comments.
+If the reply was cut off, drop the incomplete last item.
+Return only the JSON array, without any additional text or code fences.
+
+Previous reply:
+{raw_response}
+"""
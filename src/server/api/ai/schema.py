@@ -1,6 +1,6 @@
 # schema.py
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 class IntendedUseRequest(BaseModel):
     product_code: str
@@ -21,6 +21,7 @@ class PredicateDevice(BaseModel):
     clearance_date: str
     confidence: float
     regulation_number: Optional[str] = None  # Add regulation_number field
+    score_breakdown: Optional[Dict[str, float]] = None  # Ranker sub-scores behind confidence
 
 class PredicateSuggestResponse(BaseModel):
     devices: List[PredicateDevice]
\ No newline at end of file
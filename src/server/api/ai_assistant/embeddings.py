@@ -15,9 +15,9 @@ class EmbeddingGenerator:
         """
         self.logger = get_logger()
         try:
-            self.logger.info(f"Initializing the embedding model")
+            self.logger.debug("Initializing the embedding model")
             self.model = model
-            self.logger.info("Model initialized successfully.")
+            self.logger.debug("Model initialized successfully.")
         except Exception as e:
             self.logger.error(f"Error initializing model: {e}")
             raise
@@ -30,9 +30,9 @@ class EmbeddingGenerator:
         :return: List of vector embeddings.
         """
         try:
-            self.logger.info(f"Generating embedding for data: {data[:50]}...")  # Log first 50 characters
+            self.logger.debug("Generating embedding for data: %s", data[:50])
             embedding = self.model.encode(data,normalize_embeddings=True)
-            self.logger.info("Embedding generated successfully.")
+            self.logger.debug("Embedding generated successfully.")
             return embedding.tolist()
         except Exception as e:
             self.logger.error(f"Error generating embedding: {e}")
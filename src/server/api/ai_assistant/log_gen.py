@@ -17,10 +17,10 @@ def get_logger(log_file: str = ".\\logs\\application.log"):
         os.makedirs(log_dir)
 
     logger = logging.getLogger("ApplicationLogger")
-    logger.setLevel(logging.DEBUG)
 
     # Avoid adding multiple handlers if the logger is already configured
     if not logger.handlers:
+        # The logger level is left to LOG_LEVEL / LOG_LEVELS (api.services.log_pipeline)
         # File handler
         file_handler = logging.FileHandler(log_file)
         file_handler.setLevel(logging.DEBUG)
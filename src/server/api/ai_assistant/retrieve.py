@@ -3,8 +3,8 @@ import os
 import sys
 import re
 from motor.motor_asyncio import AsyncIOMotorCollection
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, List, Dict, Optional
+import asyncio
 import logging
 
 # Ensure script path is included
@@ -16,13 +16,17 @@ from configparser import ConfigParser
 from embeddings import EmbeddingGenerator
 from log_gen import get_logger
 
+if TYPE_CHECKING:
+    # Only a type hint here; importing it pulls in torch and transformers
+    from sentence_transformers import SentenceTransformer
+
 logger = get_logger("./logs/retrieval.log")
 
 class HybridRetriever:
     def __init__(
         self,
         collection: AsyncIOMotorCollection,
-        model: SentenceTransformer,
+        model: "SentenceTransformer",
         index_name: str,
         logger: logging.Logger = logger
     ):
@@ -102,12 +106,13 @@ class HybridRetriever:
         :param top_k: Number of results to return
         :return: List of documents
         """
-        self.logger.info(f"Hybrid search: '{query_text}' | Filters: {filters}")
+        self.logger.info("Hybrid search: '%s' | Filters: %s", query_text[:200], filters)
         try:
-            pipeline = self.build_pipeline(query_text, filters, top_k)
+            # Encoding the query is CPU-bound; keep it off the event loop
+            pipeline = await asyncio.to_thread(self.build_pipeline, query_text, filters, top_k)
             cursor = self.collection.aggregate(pipeline)
             results = await cursor.to_list(length=top_k)
-            self.logger.info(f"{len(results)} results found")
+            self.logger.debug("%d results found", len(results))
             return results
         except Exception as e:
             self.logger.error(f"Error in hybrid retrieval: {e}", exc_info=True)
@@ -1,12 +1,8 @@
-import motor.motor_asyncio
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+from api.services.db import client, db as default_db
 
-MONGO_URI = os.getenv("MONGO_URI")
+# Shares the pool of api.services.db; DB_NAME still selects another database on it
 DB_NAME = os.getenv("DB_NAME")
 
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
-db = client[DB_NAME]
-
+db = client[DB_NAME] if DB_NAME else default_db
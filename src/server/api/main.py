@@ -1,32 +1,39 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.inmemory import InMemoryBackend
 from fastapi_cache.decorator import cache
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
-from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
-from sentence_transformers import SentenceTransformer
+from langchain_core.output_parsers import StrOutputParser
+import asyncio
 import datetime
 import re
 import os
 import json
-from dotenv import load_dotenv
 import logging
 from logging.handlers import RotatingFileHandler
 import aiohttp
-from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo.errors import OperationFailure
 from api.routers import submissions, templates, files, document_hub
 from api.ai.services import suggest_intended_use, suggest_predicate
-from api.services.db import client, db, rag_db, checklist_collection, rag_collection
+from api.services.db import client, db, read_db, rag_db, checklist_collection, rag_collection
 from api.models.submission import SubstantialEquivalenceRequest, PerformanceSummaryRequest
 from api.models.document_editor import FDARequest
 from api.ai.prompts.doc_edit_prompt import build_fda_prompt
 from api.ai_assistant.retrieve import HybridRetriever
 from api.ai_assistant.log_gen import get_logger
+from api.ai.engines.llm_scheduler import scheduler, estimate_tokens, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from api.ai.engines.llm_provider import shared_chat_model
+from api.ai.engines.validation import validate_subsection, validate_batch
+from api.ai.engines.streaming import SSE_HEADERS, sse_event, chunk_text, PlaceholderRewriter, HeadingTracker
+from api.ai.engines.predicate_ranker import register_encoder as register_predicate_encoder
+from api.services.metrics import render_prometheus, PROMETHEUS_CONTENT_TYPE
+from api.services.concurrency import gather_named
+from api.services.embedding_client import EmbeddingClient, EMBEDDING_SERVER_SOCKET
+from api.services.instrumentation import RequestMetricsMiddleware, TimedEncoder
+from api.services import blob_store, components, log_pipeline, content_extractor, predicate_index, product_code_index, product_code_sync, response_cache
+from api.services.job_queue import JobQueue, STATUS_QUEUED, STATUS_SUCCEEDED, STATUS_FAILED
 
 # Configure logging with rotatio
 log_dir = os.path.join(os.path.dirname(__file__), "logs")
@@ -44,9 +51,7 @@ logger.addHandler(handler)
 # Initialize FastAPI
 app = FastAPI()
 
-# Load environment variable
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Environment variables are loaded from .env by api.services.db
 MONGODB_URI = os.getenv("MONGODB_URI")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "fignos")
 MONGODB_VECTOR_INDEX = os.getenv("MONGODB_VECTOR_INDEX", "510_index")
@@ -55,11 +60,10 @@ RAG_COLLECTION = os.getenv("RAG_COLLECTION", "documents")
 MODEL_NAME = os.getenv("MODEL_NAME", "nomic-ai/nomic-embed-text-v1")
 RAG_PROMPT = os.getenv("RAG_PROMPT", "You are a helpful assistant for FDA 510(k) submissions. Use the provided context to answer the query accurately.")
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
+# Background workers for /api/ai/jobs in this process; 0 leaves the work to api.worker processes
+AI_JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", "2"))
 
-# Validate environment variables
-if not GROQ_API_KEY:
-    logger.error("GROQ_API_KEY not found in environment variables")
-    raise ValueError("GROQ_API_KEY not set in environment variables")
+# Validate environment variables; GROQ_API_KEY is checked by the LLM provider
 if not MONGODB_URI:
     logger.error("MONGODB_URI not found in environment variables")
     raise ValueError("MONGODB_URI not set in environment variables")
@@ -72,26 +76,26 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-# Initialize MongoDB client
-client = AsyncIOMotorClient(MONGODB_URI)
-db = client[MONGODB_DB_NAME]
-rag_db = client[RAG_DB_NAME]
-rag_collection = rag_db[RAG_COLLECTION]
-
-# Initialize SentenceTransformer model and Grok LLM
-model = SentenceTransformer(MODEL_NAME, trust_remote_code=True)
-llm = ChatGroq(
-    api_key=GROQ_API_KEY,
-    model_name="llama3-8b-8192",
-    temperature=0.7
-)
-llm_chat = ChatGroq(
-    api_key=GROQ_API_KEY,
-    model_name="llama-3.1-8b-instant",
-    temperature=0.3,
-    max_tokens=4096
-)
+# Outermost, so the recorded latency covers every other middleware; applies to all routers
+app.add_middleware(RequestMetricsMiddleware)
+
+# MongoDB client, db and rag_collection come from api.services.db, the process's one connection pool
+job_queue = JobQueue(db.ai_jobs)
+content_extractor.register(job_queue)
+
+# The SentenceTransformer model and Groq LLMs are built on first use, or by the warm-up after startup.
+# With EMBEDDING_SERVER_SOCKET set, the model lives in api.services.embedding_server, shared by every
+# worker on the host, and this process only holds a client with the same encode().
+def _load_embedding_model():
+    if EMBEDDING_SERVER_SOCKET:
+        return TimedEncoder(EmbeddingClient(EMBEDDING_SERVER_SOCKET), backend="server")
+    from sentence_transformers import SentenceTransformer
+    return TimedEncoder(SentenceTransformer(MODEL_NAME, trust_remote_code=True), backend="local")
+
+embedding_model = components.register("embedding_model", _load_embedding_model)
+register_predicate_encoder(lambda texts: embedding_model.get().encode(texts, normalize_embeddings=True))
+generation_llm = shared_chat_model("llama3-8b-8192", temperature=0.7)
+chat_llm = shared_chat_model("llama-3.1-8b-instant", temperature=0.3, max_tokens=4096)
 
 # Initialize vector search index
 async def create_vector_search_index(collection, embed_column="embedding", similarity_metric="cosine", index_name="510_index", num_dimensions=768):
@@ -125,20 +129,28 @@ async def create_vector_search_index(collection, embed_column="embedding", simil
 
 @app.on_event("startup")
 async def startup_event():
+    # Every module has attached its handlers by now; from here on they write on a background thread
+    log_pipeline.configure_logging()
     logger.info("Application started, connected to MongoDB")
-    FastAPICache.init(InMemoryBackend())
     try:
         await client.server_info()
         logger.info("MongoDB connection verified")
+        await response_cache.init_cache()
         await db.submissions.create_index([("sectionStatus.completedCount", 1), ("rtaStatus.completedCriticals", 1)])
         await db.product_codes.create_index([("code", 1), ("name", 1)])
-        count = await db.product_codes.count_documents({})
-        if count == 0:
-            await store_product_codes_in_mongodb()
-        else:
-            logger.info(f"Found {count} product codes in MongoDB, skipping FDA fetch")
+        # Fetches at once if there are no product codes, without holding up startup
+        product_code_sync.start_sync_task()
+        await product_code_index.rebuild()
         prompt_count = await db.checklist_prompts.count_documents({})
         logger.info(f"Found {prompt_count} checklist prompts in MongoDB")
+        await job_queue.ensure_indexes()
+        job_queue.start(AI_JOB_WORKERS)
+        await blob_store.ensure_indexes()
+        collected = await blob_store.collect_garbage()
+        if collected:
+            logger.info(f"Collected {collected} unreferenced upload blobs")
+        await predicate_index.ensure_indexes()
+        predicate_index.start_refresh_task()
         collections = await rag_db.list_collection_names()
         if RAG_COLLECTION not in collections:
             logger.info(f"RAG collection '{RAG_COLLECTION}' not found, creating it")
@@ -154,102 +166,22 @@ async def startup_event():
         except Exception as e:
             logger.error(f"Error checking search indexes: {e}")
             raise
+        # Models named in WARM_UP_COMPONENTS load in the background; /ready reports when they are warm
+        components.start_warm_up()
     except Exception as e:
         logger.error(f"Startup failed: {str(e)}")
         raise
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await components.stop_warm_up()
+    await job_queue.stop()
+    await predicate_index.stop_refresh_task()
+    await product_code_sync.stop_sync_task()
+    content_extractor.shutdown_pool()
     logger.info("Closing MongoDB connection")
     client.close()
-
-async def fetch_product_codes_from_fda():
-    logger.info("Fetching 510(k)-related product codes from FDA classification endpoint")
-    api_key = os.getenv("FDA_API_KEY", "4GDeXmlPiVhbLaPgD5sYUfJu0uKAGS5iokXIokwJ")
-    base_url = "https://api.fda.gov/device/classification.json"
-    params = {
-        "api_key": api_key,
-        "limit": 1000,
-        "skip": 0
-    }
-    product_codes = []
-    class_counts = {"1": 0, "2": 0, "3": 0, "U": 0}
-    exempt_count = 0
-    non_exempt_510k_count = 0
-
-    async with aiohttp.ClientSession() as session:
-        while True:
-            try:
-                logger.debug(f"Making API request to {base_url} with params: {params}")
-                async with session.get(base_url, params=params) as response:
-                    if response.status != 200:
-                        logger.error(f"API request failed with status {response.status}: {await response.text()}")
-                        break
-                    
-                    data = await response.json()
-                    
-                    if "results" not in data:
-                        logger.warning("No product codes found.")
-                        break
-                    
-                    for item in data["results"]:
-                        try:
-                            code = item.get("product_code", "Unknown")
-                            name = item.get("device_name", "Unknown Device")
-                            device_class = item.get("device_class", "U")
-                            is_510k_exempt = item.get("510k_exempt", False)
-                            regulation_number = item.get("regulation_number", None)
-                            logger.debug(f"Raw regulation_number for {code}: {regulation_number}")
-                            if regulation_number and not re.match(r"^\d{3}\.\d{4}$", regulation_number):
-                                logger.warning(f"Invalid regulation_number format for {code}: {regulation_number}")
-                                regulation_number = None
-                            if not isinstance(code, str) or not isinstance(name, str):
-                                logger.warning(f"Invalid data for item: {item}")
-                                continue
-                            if device_class == "2" and not is_510k_exempt:
-                                product_codes.append({
-                                    "code": code,
-                                    "name": name,
-                                    "device_class": device_class,
-                                    "510k_exempt": is_510k_exempt,
-                                    "regulation_number": regulation_number
-                                })
-                                non_exempt_510k_count += 1
-                            class_counts[device_class] += 1
-                            if is_510k_exempt:
-                                exempt_count += 1
-                        except Exception as e:
-                            logger.warning(f"Error processing item {item}: {str(e)}")
-                            continue
-                    
-                    total = data.get("meta", {}).get("results", {}).get("total", 0)
-                    params["skip"] += params["limit"]
-                    if params["skip"] >= total or not data["results"]:
-                        break
-                
-            except aiohttp.ClientError as e:
-                logger.error(f"Error querying FDA API: {str(e)}")
-                break
-            except Exception as e:
-                logger.error(f"Unexpected error in API fetch: {str(e)}")
-                break
-    
-    logger.info(f"Fetched {len(product_codes)} 510(k)-related product codes from FDA")
-    logger.info(f"Device class counts (all): {class_counts}")
-    logger.info(f"510(k)-exempt codes (all): {exempt_count}")
-    logger.info(f"Non-exempt Class II (stored, likely 510(k)): {non_exempt_510k_count}")
-    return product_codes
-
-async def store_product_codes_in_mongodb():
-    logger.info("Storing 510(k)-related product codes in MongoDB")
-    product_codes = await fetch_product_codes_from_fda()
-    collection = db.product_codes
-    
-    await collection.delete_many({})
-    
-    if product_codes:
-        await collection.insert_many(product_codes)
-        logger.info(f"Stored {len(product_codes)} 510(k)-related product codes in MongoDB")
+    log_pipeline.shutdown_logging()
 
 async def get_product_codes_from_mongodb(
     page: int = Query(1, ge=1),
@@ -257,8 +189,16 @@ async def get_product_codes_from_mongodb(
     search: str = Query(None)
 ) -> List[Dict]:
     logger.info(f"Fetching product codes from MongoDB: page={page}, limit={limit}, search={search}")
-    collection = db.product_codes
-    
+    collection = read_db.product_codes
+    skip = (page - 1) * limit
+
+    index = await product_code_index.get_index()
+    if search and len(index):
+        matches = index.search(search, limit=skip + limit)[skip:]
+        product_codes = [{"code": m["code"], "name": m["name"], "regulation_number": m["regulation_number"]} for m in matches]
+        logger.info(f"Retrieved {len(product_codes)} product codes from the typeahead index")
+        return product_codes
+
     query = {}
     if search:
         query = {
@@ -268,7 +208,6 @@ async def get_product_codes_from_mongodb(
             ]
         }
     
-    skip = (page - 1) * limit
     cursor = collection.find(query, {"_id": 0, "code": 1, "name": 1, "regulation_number": 1}).skip(skip).limit(limit)
     product_codes = await cursor.to_list(length=limit)
     
@@ -276,7 +215,7 @@ async def get_product_codes_from_mongodb(
     return product_codes
 
 @app.get("/api/product-codes", response_model=List[Dict])
-@cache(expire=3600)
+@cache(expire=3600, namespace=product_code_sync.CACHE_NAMESPACE)
 async def get_product_codes(
     page: int = Query(1, ge=1),
     limit: int = Query(100, ge=1, le=1000),
@@ -286,6 +225,18 @@ async def get_product_codes(
     product_codes = await get_product_codes_from_mongodb(page, limit, search)
     return product_codes
 
+@app.get("/api/product-codes/suggest", response_model=List[Dict])
+async def suggest_product_codes(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50)
+):
+    try:
+        index = await product_code_index.get_index()
+        return index.search(q, limit=limit)
+    except Exception as e:
+        logger.error(f"Error suggesting product codes for {q!r}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error suggesting product codes: {str(e)}")
+
 # Request Models
 class GenerationRequest(BaseModel):
     input_data: Dict
@@ -298,6 +249,9 @@ class ValidationRequest(BaseModel):
     checklist_ids: List[str]
     subsection_id: str
 
+class BatchValidationRequest(BaseModel):
+    items: List[ValidationRequest]
+
 class FixChecklistItemRequest(BaseModel):
     submission_id: str
     section_id: str
@@ -310,31 +264,10 @@ class UserQuery(BaseModel):
     query: str
     filters: Optional[Dict] = None
 
-def extract_json_array(response_text: str) -> List[Dict]:
-    try:
-        json_match = re.search(r'\[\s*{[\s\S]*?}\s*\]', response_text)
-        if not json_match:
-            logger.error("No JSON array found in response: %s", response_text[:200])
-            raise ValueError("No valid JSON array found in response")
-        
-        json_str = json_match.group(0)
-        json_data = json.loads(json_str)
-        if not isinstance(json_data, list):
-            logger.error("Parsed response is not a JSON array: %s", json_data)
-            raise ValueError("Parsed response is not a JSON array")
-        
-        logger.info("Successfully extracted JSON array with %d items", len(json_data))
-        return json_data
-    except json.JSONDecodeError as e:
-        logger.error("JSON parsing failed: %s", str(e))
-        raise ValueError(f"Invalid JSON format: {str(e)}")
-    except Exception as e:
-        logger.error("Unexpected error while extracting JSON: %s", str(e))
-        raise
-
 async def process_chat_with_rag(query: str, filters: Dict = None, session_id: str = None):
     try:
         logger.info(f"Processing RAG query: {query[:100]}...")
+        model = await embedding_model.aget()
         retriever = HybridRetriever(rag_collection, model, index_name=MONGODB_VECTOR_INDEX)
         rag_filters = {"type": {"$ne": "chat"}}
         if filters:
@@ -347,7 +280,7 @@ async def process_chat_with_rag(query: str, filters: Dict = None, session_id: st
             "message_type": "human",
             "content": query,
             "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-            "embedding": model.encode(query, convert_to_tensor=False).tolist()
+            "embedding": (await asyncio.to_thread(model.encode, query, convert_to_tensor=False)).tolist()
         }
         await rag_collection.insert_one(chat_entry)
         prompt = ChatPromptTemplate.from_messages([
@@ -355,11 +288,16 @@ async def process_chat_with_rag(query: str, filters: Dict = None, session_id: st
             ("human", "{input}\n\nContext:\n{search_context}")
         ])
         logger.info("Constructing response using LLM with context...")
-        chain = prompt | llm_chat
-        response = await chain.ainvoke({
-            "input": query,
-            "search_context": search_context,
-        })
+        chain = prompt | chat_llm.get()
+        response = await scheduler.run(
+            chat_llm.get().model_name,
+            lambda: chain.ainvoke({
+                "input": query,
+                "search_context": search_context,
+            }),
+            priority=PRIORITY_INTERACTIVE,
+            tokens=estimate_tokens(RAG_PROMPT, query, search_context)
+        )
         ai_response = response.content
         response_entry = {
             "type": "chat",
@@ -367,10 +305,12 @@ async def process_chat_with_rag(query: str, filters: Dict = None, session_id: st
             "message_type": "system",
             "content": ai_response,
             "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-            "embedding": model.encode(ai_response, convert_to_tensor=False).tolist()
+            "embedding": (await asyncio.to_thread(model.encode, ai_response, convert_to_tensor=False)).tolist()
         }
         await rag_collection.insert_one(response_entry)
         return {"query": query, "response": ai_response}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"An error occurred during RAG processing: {str(e)}")
         raise HTTPException(status_code=500, detail=f"RAG processing error: {str(e)}")
@@ -385,6 +325,69 @@ async def chat_with_rag(user_query: UserQuery, session_id: Optional[str] = Query
         logger.error(f"Unexpected error in /chat endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.post("/chat/stream")
+async def chat_with_rag_stream(user_query: UserQuery, session_id: Optional[str] = Query(None)):
+    query = user_query.query
+    try:
+        logger.info(f"Processing streamed RAG query: {query[:100]}...")
+        scheduler.admit(chat_llm.get().model_name, PRIORITY_INTERACTIVE)
+        model = await embedding_model.aget()
+        retriever = HybridRetriever(rag_collection, model, index_name=MONGODB_VECTOR_INDEX)
+        rag_filters = {"type": {"$ne": "chat"}}
+        if user_query.filters:
+            rag_filters.update(user_query.filters)
+        search_results = await retriever.retrieve(query, filters=rag_filters)
+        search_context = "\n".join([f"Title: {r.get('title', 'N/A')}, Content: {r.get('content', 'N/A')}" for r in search_results])
+        await rag_collection.insert_one({
+            "type": "chat",
+            "session_id": session_id or "default",
+            "message_type": "human",
+            "content": query,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "embedding": (await asyncio.to_thread(model.encode, query, convert_to_tensor=False)).tolist()
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error in /chat/stream endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", RAG_PROMPT),
+        ("human", "{input}\n\nContext:\n{search_context}")
+    ])
+    chain = prompt | chat_llm.get() | StrOutputParser()
+    tokens = estimate_tokens(RAG_PROMPT, query, search_context)
+
+    async def events():
+        parts = []
+        try:
+            async with scheduler.slot(chat_llm.get().model_name, tokens, PRIORITY_INTERACTIVE):
+                async for chunk in chain.astream({"input": query, "search_context": search_context}):
+                    text = chunk_text(chunk)
+                    if text:
+                        parts.append(text)
+                        yield sse_event("token", {"text": text})
+
+            ai_response = "".join(parts)
+            await rag_collection.insert_one({
+                "type": "chat",
+                "session_id": session_id or "default",
+                "message_type": "system",
+                "content": ai_response,
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "embedding": (await asyncio.to_thread(model.encode, ai_response, convert_to_tensor=False)).tolist()
+            })
+            yield sse_event("done", {"query": query, "response": ai_response})
+        except HTTPException as e:
+            logger.error(f"Error in /chat/stream: {e.detail}")
+            yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"An error occurred during streamed RAG processing: {str(e)}")
+            yield sse_event("error", {"status": 500, "detail": f"RAG processing error: {str(e)}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.get("/chat/history")
 async def get_chat_history(session_id: Optional[str] = Query(None)):
     try:
@@ -395,32 +398,49 @@ async def get_chat_history(session_id: Optional[str] = Query(None)):
         logger.error(f"Error retrieving chat history: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving chat history")
 
+@app.get("/metrics")
+async def metrics():
+    return Response(content=render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/ready")
+async def ready():
+    readiness = components.readiness()
+    return JSONResponse(content=readiness, status_code=200 if readiness["ready"] else 503)
+
+@app.get("/api/cache/stats", response_model=Dict)
+async def cache_stats():
+    return {"tiers": response_cache.stats()}
+
+@app.get("/api/llm/scheduler", response_model=Dict)
+async def llm_scheduler_stats():
+    return {"models": scheduler.stats()}
+
 @app.get("/")
 async def root():
     return {"message": "FDA 510(k) Submission API with RAG flow is running!"}
 
-@app.post("/generate", response_model=Dict)
-async def generate_content(payload: GenerationRequest):
-    try:
-        checklist_prompt = await checklist_collection.find_one({"subsectionId": payload.subsection_id})
-        if not checklist_prompt or not checklist_prompt.get("checklist"):
-            logger.error(f"No checklist found for subsection {payload.subsection_id}")
-            raise HTTPException(status_code=404, detail=f"No checklist found for subsection {payload.subsection_id}")
-        
-        checklist_items = checklist_prompt["checklist"]
-        checklist_ids = [item["id"] for item in checklist_items]
-        logger.info(f"Checklist IDs for generation {payload.subsection_id}: {checklist_ids}")
+GENERATION_PREFIX_REGEX = r'^Here is a.* (?:Intended Use Statement|overview).* for the .* subsection.*:[\n\s]*'
 
-        invalid_ids = [cid for cid in payload.checklist_ids if cid not in checklist_ids]
-        if invalid_ids:
-            logger.warning(f"Invalid checklist IDs provided for {payload.subsection_id}: {invalid_ids}")
-            raise HTTPException(status_code=400, detail=f"Invalid checklist IDs: {invalid_ids}")
+async def _prepare_generation(payload: GenerationRequest):
+    checklist_prompt = await checklist_collection.find_one({"subsectionId": payload.subsection_id})
+    if not checklist_prompt or not checklist_prompt.get("checklist"):
+        logger.error(f"No checklist found for subsection {payload.subsection_id}")
+        raise HTTPException(status_code=404, detail=f"No checklist found for subsection {payload.subsection_id}")
+    
+    checklist_items = checklist_prompt["checklist"]
+    checklist_ids = [item["id"] for item in checklist_items]
+    logger.info(f"Checklist IDs for generation {payload.subsection_id}: {checklist_ids}")
 
-        checklist_str = "\nAdhere to the following checklist:\n" + "\n".join(f"- {item['question']} (ID: {item['id']})" for item in checklist_items)
-        input_data_str = json.dumps(payload.input_data, indent=2).replace("{", "{{").replace("}", "}}")
+    invalid_ids = [cid for cid in payload.checklist_ids if cid not in checklist_ids]
+    if invalid_ids:
+        logger.warning(f"Invalid checklist IDs provided for {payload.subsection_id}: {invalid_ids}")
+        raise HTTPException(status_code=400, detail=f"Invalid checklist IDs: {invalid_ids}")
 
-        if payload.subsection_id == "A2":
-            system_msg = f"""
+    checklist_str = "\nAdhere to the following checklist:\n" + "\n".join(f"- {item['question']} (ID: {item['id']})" for item in checklist_items)
+    input_data_str = json.dumps(payload.input_data, indent=2).replace("{", "{{").replace("}", "}}")
+
+    if payload.subsection_id == "A2":
+        system_msg = f"""
 You are an expert in drafting FDA 510(k) submissions. Generate a clear and concise Intended Use Statement for the {checklist_prompt.get('title', 'Intended Use Statement')} (subsection {payload.subsection_id}) of a 510(k) submission.
 The content must explicitly address each checklist item listed below, incorporating the provided input data.
 {payload.system_prompt.strip()}
@@ -437,8 +457,8 @@ Structure the response as follows:
 Ensure the content is professional, concise, and fully compliant with FDA requirements for an Intended Use Statement.
 Return only the generated content, without any additional text or JSON formatting.
 """
-        else:
-            system_msg = f"""
+    else:
+        system_msg = f"""
 You are an expert in drafting FDA 510(k) submissions. Generate a clear and concise response for the {checklist_prompt.get('title', 'subsection')} (subsection {payload.subsection_id}) of a 510(k) submission.
 The content must explicitly address each checklist item listed below, incorporating the provided input data.
 {payload.system_prompt.strip()}
@@ -455,30 +475,41 @@ The content must be clear, concise, and compliant with FDA requirements.
 Return only the generated content, without any additional text or JSON formatting.
 """
 
-        logger.info(f"System prompt for {payload.subsection_id}:\n{system_msg}")
+    logger.info(f"System prompt for {payload.subsection_id}:\n{system_msg}")
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system_msg),
+        ("user", "Generate the content now, ensuring all checklist items are addressed.")
+    ])
+
+    input_vars = {
+        "deviceName": payload.input_data.get("deviceName", "Device Name"),
+        "mechanism": payload.input_data.get("mechanism", "device technology"),
+        "indications": payload.input_data.get("indications", "diagnostic purposes"),
+        "targetPopulation": payload.input_data.get("targetPopulation", "adult patients"),
+        "clinicalSetting": payload.input_data.get("clinicalSetting", "clinical settings"),
+        "contraindications": payload.input_data.get("contraindications", "specific conditions"),
+        "intended_use": payload.input_data.get("intended_use", "diagnostic purposes"),
+        "predicateDevice": payload.input_data.get("predicateDevice", "similar device"),
+    }
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_msg),
-            ("user", "Generate the content now, ensuring all checklist items are addressed.")
-        ])
+    return prompt, system_msg, input_vars, checklist_ids
 
-        input_vars = {
-            "deviceName": payload.input_data.get("deviceName", "Device Name"),
-            "mechanism": payload.input_data.get("mechanism", "device technology"),
-            "indications": payload.input_data.get("indications", "diagnostic purposes"),
-            "targetPopulation": payload.input_data.get("targetPopulation", "adult patients"),
-            "clinicalSetting": payload.input_data.get("clinicalSetting", "clinical settings"),
-            "contraindications": payload.input_data.get("contraindications", "specific conditions"),
-            "intended_use": payload.input_data.get("intended_use", "diagnostic purposes"),
-            "predicateDevice": payload.input_data.get("predicateDevice", "similar device"),
-        }
+@app.post("/generate", response_model=Dict)
+async def generate_content(payload: GenerationRequest):
+    try:
+        prompt, system_msg, input_vars, checklist_ids = await _prepare_generation(payload)
 
         parser = StrOutputParser()
-        chain = prompt | llm | parser
-        content = await chain.ainvoke(input_vars)
+        chain = prompt | generation_llm.get() | parser
+        content = await scheduler.run(
+            generation_llm.get().model_name,
+            lambda: chain.ainvoke(input_vars),
+            priority=PRIORITY_BULK,
+            tokens=estimate_tokens(system_msg)
+        )
 
-        prefix_regex = r'^Here is a.* (?:Intended Use Statement|overview).* for the .* subsection.*:[\n\s]*'
-        content = re.sub(prefix_regex, '', content, flags=re.IGNORECASE).strip()
+        content = re.sub(GENERATION_PREFIX_REGEX, '', content, flags=re.IGNORECASE).strip()
 
         for key, value in input_vars.items():
             placeholder = f"[{key}]"
@@ -502,10 +533,95 @@ Return only the generated content, without any additional text or JSON formattin
             "subsectionId": payload.subsection_id
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in /generate endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _store_generated_draft(submission_id: str, section_id: str, subsection_id: str, content: str, checklist_validation: List[Dict]):
+    result = await db.submissions.update_one(
+        {"_id": submission_id},
+        {
+            "$set": {
+                "sections.$[s].subsections.$[sub].contentExtracted": content,
+                "sections.$[s].subsections.$[sub].status": "ai-draft",
+                "sections.$[s].subsections.$[sub].checklistValidation": checklist_validation,
+                "sections.$[s].subsections.$[sub].last_updated": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "last_updated": datetime.datetime.now(datetime.timezone.utc).isoformat()
+            }
+        },
+        array_filters=[{"s.id": section_id}, {"sub.id": subsection_id}]
+    )
+    if result.matched_count == 0:
+        logger.warning(f"Submission {submission_id} not found, streamed draft for {subsection_id} was not stored")
+    else:
+        logger.info(f"Stored streamed draft for submission {submission_id} in subsection {subsection_id}")
+
+@app.post("/generate/stream")
+async def generate_content_stream(
+    payload: GenerationRequest,
+    submission_id: Optional[str] = Query(None, description="Store the final draft in this submission"),
+    section_id: Optional[str] = Query(None, description="Section holding the subsection, defaults to its first letter")
+):
+    try:
+        prompt, system_msg, input_vars, checklist_ids = await _prepare_generation(payload)
+        # Reject before the 200 status line is sent if the LLM queue is saturated; same priority
+        # as /generate, so switching to streaming does not jump the queue
+        scheduler.admit(generation_llm.get().model_name, PRIORITY_BULK)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in /generate/stream endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    chain = prompt | generation_llm.get() | StrOutputParser()
+    tokens = estimate_tokens(system_msg)
+
+    async def events():
+        rewriter = PlaceholderRewriter(input_vars, prefix_pattern=GENERATION_PREFIX_REGEX)
+        try:
+            async with scheduler.slot(generation_llm.get().model_name, tokens, PRIORITY_BULK):
+                async for chunk in chain.astream(input_vars):
+                    text = rewriter.feed(chunk_text(chunk))
+                    if text:
+                        yield sse_event("token", {"text": text})
+            text = rewriter.flush()
+            if text:
+                yield sse_event("token", {"text": text})
+
+            content = rewriter.text.strip()
+            logger.info(f"Streamed content for {payload.subsection_id}: {content[:100]}...")
+            yield sse_event("validating", {"subsectionId": payload.subsection_id})
+            validation_response = await validate_content(ValidationRequest(
+                content=content,
+                checklist_ids=checklist_ids,
+                subsection_id=payload.subsection_id
+            ))
+
+            if submission_id:
+                await _store_generated_draft(
+                    submission_id,
+                    section_id or payload.subsection_id[0],
+                    payload.subsection_id,
+                    content,
+                    validation_response["validation"]
+                )
+
+            yield sse_event("done", {
+                "content": content,
+                "checklistValidation": validation_response["validation"],
+                "subsectionId": payload.subsection_id
+            })
+        except HTTPException as e:
+            logger.error(f"Error in /generate/stream for {payload.subsection_id}: {e.detail}")
+            yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"Error in /generate/stream for {payload.subsection_id}: {str(e)}")
+            yield sse_event("error", {"status": 500, "detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.post("/validate", response_model=Dict)
 async def validate_content(payload: ValidationRequest):
     try:
@@ -523,79 +639,47 @@ async def validate_content(payload: ValidationRequest):
             logger.warning(f"Invalid checklist IDs provided for {payload.subsection_id}: {invalid_ids}")
             raise HTTPException(status_code=400, detail=f"Invalid checklist IDs: {invalid_ids}")
 
-        checklist_str = "\n".join(f"- {item['question']} (ID: {item['id']})" for item in checklist_items)
-        validation_instruction = f"""
-You are a compliance checker for FDA 510(k) submissions. Validate the following content against each checklist item for subsection {payload.subsection_id}.
-For each checklist item, perform a contextual and semantic analysis to determine if the content fully addresses the requirement. Focus on the meaning and intent of the content, ensuring it aligns with FDA 510(k) submission requirements for clarity, specificity, and completeness. Avoid requiring exact phrasing; instead, evaluate whether the content conveys the necessary information.
-Return a JSON array of validation results, where each result includes:
-- id: string (checklist item ID)
-- question: string (checklist item text)
-- validated: boolean (true if the content satisfies the checklist item, false otherwise)
-- status: string ("complete" or "missing")
-- comments: string (explanation of validation result, e.g., why it was marked complete or missing)
-- suggestion: string (specific suggestion for addressing missing items, empty if validated)
-- tooltip: string (brief description for UI display, summarizing the validation result)
-
-Checklist:
-{checklist_str}
-
-Content to validate:
-{payload.content}
-
-Return only the JSON array of validation results, without any additional text.
-"""
-
-        logger.info(f"Validation prompt for {payload.subsection_id}:\n{validation_instruction}")
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", validation_instruction),
-            ("user", "Validate the content now.")
-        ])
-
-        chain = prompt | llm | JsonOutputParser()
-        try:
-            validation_results = await chain.ainvoke({})
-            logger.info(f"Raw LLM validation results for {payload.subsection_id}: {validation_results}")
-        except Exception as e:
-            logger.warning(f"JSON parsing failed for validation: {str(e)}, attempting fallback extraction")
-            raw_response = await (prompt | llm | StrOutputParser()).ainvoke({})
-            validation_results = extract_json_array(raw_response)
+        final_results = await validate_subsection(generation_llm.get(), payload.subsection_id, checklist_items, payload.content)
 
-        final_results = []
-        for item in checklist_items:
-            item_id = item["id"]
-            item_text = item["question"]
-            validation_item = next((v for v in validation_results if v["id"] == item_id), None)
-
-            if validation_item and validation_item.get("validated") is not None:
-                final_results.append({
-                    "id": item_id,
-                    "question": item_text,
-                    "validated": validation_item.get("validated", False),
-                    "status": validation_item.get("status", "missing"),
-                    "comments": validation_item.get("comments", f"Content does not address: {item_text}"),
-                    "suggestion": validation_item.get("suggestion", f"Include specific details about {item_text.lower()} in the content."),
-                    "tooltip": validation_item.get("tooltip", f"Please address: {item_text}")
-                })
-            else:
-                logger.warning(f"No validation result for checklist item {item_id} in subsection {payload.subsection_id}")
-                final_results.append({
-                    "id": item_id,
-                    "question": item_text,
-                    "validated": False,
-                    "status": "missing",
-                    "comments": f"Content does not address: {item_text}",
-                    "suggestion": f"Include specific details about {item_text.lower()} in the content.",
-                    "tooltip": f"Please address: {item_text}"
-                })
-
-        logger.info(f"Final validation results for {payload.subsection_id}: {final_results}")
+        logger.info("Final validation results for %s: %s", payload.subsection_id, log_pipeline.truncated(final_results))
         return {"validation": final_results, "subsectionId": payload.subsection_id}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in /validate endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/validate-batch", response_model=Dict)
+async def validate_content_batch(payload: BatchValidationRequest):
+    try:
+        subsection_ids = [item.subsection_id for item in payload.items]
+        checklist_prompts = await checklist_collection.find({"subsectionId": {"$in": subsection_ids}}).to_list(length=None)
+        checklists = {cp["subsectionId"]: cp.get("checklist", []) for cp in checklist_prompts}
+
+        entries = []
+        for item in payload.items:
+            checklist_items = checklists.get(item.subsection_id)
+            if not checklist_items:
+                logger.error(f"No checklist found for subsection {item.subsection_id}")
+                raise HTTPException(status_code=404, detail=f"No checklist found for subsection {item.subsection_id}")
+            checklist_ids = [c["id"] for c in checklist_items]
+            invalid_ids = [cid for cid in item.checklist_ids if cid not in checklist_ids]
+            if invalid_ids:
+                logger.warning(f"Invalid checklist IDs provided for {item.subsection_id}: {invalid_ids}")
+                raise HTTPException(status_code=400, detail=f"Invalid checklist IDs: {invalid_ids}")
+            entries.append({"subsection_id": item.subsection_id, "content": item.content, "checklist": checklist_items})
+
+        results = await validate_batch(generation_llm.get(), entries)
+        logger.info(f"Batch validation completed for subsections {subsection_ids}")
+        return {"results": [{"subsectionId": sid, "validation": results.get(sid, [])} for sid in subsection_ids]}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in /validate-batch endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/fix-checklist-item", response_model=Dict)
 async def fix_checklist_item(payload: FixChecklistItemRequest):
     try:
@@ -646,8 +730,13 @@ The generated content should:
         }
 
         parser = StrOutputParser()
-        chain = prompt | llm | parser
-        new_content = await chain.ainvoke(input_vars)
+        chain = prompt | generation_llm.get() | parser
+        new_content = await scheduler.run(
+            generation_llm.get().model_name,
+            lambda: chain.ainvoke(input_vars),
+            priority=PRIORITY_INTERACTIVE,
+            tokens=estimate_tokens(system_msg)
+        )
         new_content = new_content.strip()
 
         updated_content = f"{payload.current_content}\n\n{new_content}" if payload.current_content else new_content
@@ -746,18 +835,30 @@ The generated content should:
             "subsectionId": payload.subsection_id
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in /fix-checklist-item endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/ai/generate-substantial-equivalence", response_model=Dict)
-async def generate_substantial_equivalence(
-    payload: SubstantialEquivalenceRequest,
-    submission_id: str = Query(..., description="ID of the submission")
-):
+async def _no_progress(stage: str, **data) -> None:
+    pass
+
+async def _generate_substantial_equivalence(payload: SubstantialEquivalenceRequest, submission_id: str, progress=_no_progress):
     try:
         logger.info(f"Generating Substantial Equivalence summary for submission {submission_id}")
-        submission = await db.submissions.find_one({"_id": submission_id})
+        # Independent reads run concurrently; only generate -> validate is sequential
+        loaded = await gather_named({
+            "submission": db.submissions.find_one({"_id": submission_id}),
+            "checklists": checklist_collection.find(
+                {"subsectionId": {"$in": ["B1", "B2", "B3", "B4"]}, "submissionType": "510k"}
+            ).to_list(length=None),
+            "template": db.checklist_templates.find_one({"_id": "510k_v1"}),
+        })
+        submission = loaded["submission"]
+        checklists = {}
+        for cp in loaded["checklists"]:
+            checklists.setdefault(cp["subsectionId"], cp.get("checklist", []))
         if not submission:
             logger.warning(f"Submission {submission_id} not found")
             raise HTTPException(status_code=404, detail=f"Submission {submission_id} not found")
@@ -772,12 +873,9 @@ async def generate_substantial_equivalence(
             logger.error(f"Device name mismatch: payload ({payload.subject_device.get('name')}) vs submission ({submission.get('device_name')})")
             raise HTTPException(status_code=400, detail=f"Device name in payload ({payload.subject_device.get('name')}) does not match submission device name ({submission.get('device_name')})")
 
-        checklist_prompt = await checklist_collection.find_one({"subsectionId": "B2", "submissionType": "510k"})
-        if not checklist_prompt or not checklist_prompt.get("checklist"):
+        combined_checklist = checklists.get("B2", [])
+        if not combined_checklist:
             logger.warning("No checklist found for subsection B2, using empty checklist")
-            combined_checklist = []
-        else:
-            combined_checklist = checklist_prompt.get("checklist", [])
         
         checklist_str = "\nAdhere to the following checklist:\n" + "\n".join(
             f"- {item['question']} (ID: {item['id']})" for item in combined_checklist
@@ -850,8 +948,13 @@ Output Guidelines:
         ])
 
         parser = StrOutputParser()
-        chain = prompt | llm | parser
-        content = await chain.ainvoke(input_vars)
+        chain = prompt | generation_llm.get() | parser
+        content = await scheduler.run(
+            generation_llm.get().model_name,
+            lambda: chain.ainvoke(input_vars),
+            priority=PRIORITY_BULK,
+            tokens=estimate_tokens(system_msg, predicate_comparison)
+        )
         content = re.sub(r'^Here is.*substantial equivalence.*:[\n\s]*', '', content, flags=re.IGNORECASE).strip()
 
         for key, value in input_vars.items():
@@ -859,6 +962,7 @@ Output Guidelines:
             content = content.replace(f"[specific {key}]", value)
 
         logger.info(f"Generated summary for Subsection B2: {content[:100]}...")
+        await progress("generated", subsectionId="B2")
 
         word_count = len(content.split())
         if not (150 <= word_count <= 300):
@@ -874,6 +978,7 @@ Output Guidelines:
         except HTTPException as e:
             logger.warning(f"Validation failed for subsection B2: {str(e)}")
             validation_response = {"validation": [], "subsectionId": "B2"}
+        await progress("validated", subsectionId="B2")
 
         sections = submission.get("sections", [])
         section_b = next((s for s in sections if s["id"] == "B"), None)
@@ -896,8 +1001,7 @@ Output Guidelines:
 
         for sub in subsections:
             existing_sub = next((s for s in section_b["subsections"] if s["id"] == sub["id"]), None)
-            checklist_prompt = await checklist_collection.find_one({"subsectionId": sub["id"], "submissionType": "510k"})
-            checklist = checklist_prompt.get("checklist", []) if checklist_prompt else []
+            checklist = checklists.get(sub["id"], [])
             checklist_validation = [
                 v for v in validation_response["validation"] if v["id"] in [item["id"] for item in checklist]
             ] if sub["id"] == "B2" else []
@@ -932,7 +1036,7 @@ Output Guidelines:
 
         section_b["status"] = "ai-draft"
 
-        template = await db.checklist_templates.find_one({"_id": "510k_v1"})
+        template = loaded["template"]
         total_sections = len(template.get("sections", []))
         completed_sections = sum(1 for section in sections if section.get("status") == "complete")
         total_criticals = 0
@@ -972,18 +1076,33 @@ Output Guidelines:
             "subsectionId": "B2"
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in /api/ai/generate-substantial-equivalence: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/ai/generate-performance-summary", response_model=Dict)
-async def generate_performance_summary(
-    payload: PerformanceSummaryRequest,
+@app.post("/api/ai/generate-substantial-equivalence", response_model=Dict)
+async def generate_substantial_equivalence(
+    payload: SubstantialEquivalenceRequest,
     submission_id: str = Query(..., description="ID of the submission")
 ):
+    return await _generate_substantial_equivalence(payload, submission_id)
+
+async def _generate_performance_summary(payload: PerformanceSummaryRequest, submission_id: str, progress=_no_progress):
     try:
         logger.info(f"Generating Performance Summary for submission {submission_id}")
-        submission = await db.submissions.find_one({"_id": submission_id})
+        loaded = await gather_named({
+            "submission": db.submissions.find_one({"_id": submission_id}),
+            "checklists": checklist_collection.find(
+                {"subsectionId": {"$in": ["G1", "G2", "G3", "G4"]}, "submissionType": "510k"}
+            ).to_list(length=10),
+            "template": db.checklist_templates.find_one({"_id": "510k_v1"}),
+        })
+        submission = loaded["submission"]
+        checklists = {}
+        for cp in loaded["checklists"]:
+            checklists.setdefault(cp["subsectionId"], cp.get("checklist", []))
         if not submission:
             logger.warning(f"Submission {submission_id} not found")
             raise HTTPException(status_code=404, detail=f"Submission {submission_id} not found")
@@ -996,9 +1115,7 @@ async def generate_performance_summary(
             logger.error(f"Device name mismatch: payload ({payload.subject_device.get('name')}) vs submission ({submission.get('device_name')})")
             raise HTTPException(status_code=400, detail=f"Device name in payload ({payload.subject_device.get('name')}) does not match submission device name ({submission.get('device_name')})")
 
-        checklist_prompts = await checklist_collection.find(
-            {"subsectionId": {"$in": ["G1", "G2", "G3", "G4"]}, "submissionType": "510k"}
-        ).to_list(length=10)
+        checklist_prompts = loaded["checklists"]
         if not checklist_prompts:
             logger.warning("No checklist prompts found for Section G, using empty checklist")
             combined_checklist = []
@@ -1093,8 +1210,13 @@ Output Guidelines:
         ])
 
         parser = StrOutputParser()
-        chain = prompt | llm | parser
-        content = await chain.ainvoke(input_vars)
+        chain = prompt | generation_llm.get() | parser
+        content = await scheduler.run(
+            generation_llm.get().model_name,
+            lambda: chain.ainvoke(input_vars),
+            priority=PRIORITY_BULK,
+            tokens=estimate_tokens(system_msg, clinical_studies_str)
+        )
         content = re.sub(r'^Here is.*clinical performance summary.*:[\n\s]*', '', content, flags=re.IGNORECASE).strip()
 
         for key, value in input_vars.items():
@@ -1115,20 +1237,26 @@ Output Guidelines:
             logger.info(f"Extended summary to {word_count} words")
 
         logger.info(f"Final summary for Section G: {content[:100]}...")
+        await progress("generated", subsectionId="G1")
 
         if not (150 <= word_count <= 300):
             logger.warning(f"Generated summary word count ({word_count}) is outside the 150–300 word range after adjustment")
 
-        validation_request = ValidationRequest(
-            content=content,
-            checklist_ids=[item["id"] for item in combined_checklist],
-            subsection_id="G1"
-        )
+        # The summary is checked against the G1–G4 checklists together, in one LLM call where the budget allows
+        validation_entries = [
+            {"subsection_id": cp["subsectionId"], "content": content, "checklist": cp.get("checklist", [])}
+            for cp in sorted(checklist_prompts, key=lambda cp: cp["subsectionId"])
+        ]
         try:
-            validation_response = await validate_content(validation_request)
-        except HTTPException as e:
+            batch_results = await validate_batch(generation_llm.get(), validation_entries)
+            validation_response = {
+                "validation": [v for entry in validation_entries for v in batch_results.get(entry["subsection_id"], [])],
+                "subsectionId": "G1"
+            }
+        except (HTTPException, ValueError) as e:
             logger.warning(f"Validation failed for Section G: {str(e)}")
             validation_response = {"validation": [], "subsectionId": "G1"}
+        await progress("validated", subsectionId="G1")
 
         sections = submission.get("sections", [])
         section_g = next((s for s in sections if s["id"] == "G"), None)
@@ -1151,8 +1279,7 @@ Output Guidelines:
 
         for sub in subsections:
             existing_sub = next((s for s in section_g["subsections"] if s["id"] == sub["id"]), None)
-            checklist_prompt = await checklist_collection.find_one({"subsectionId": sub["id"], "submissionType": "510k"})
-            checklist = checklist_prompt.get("checklist", []) if checklist_prompt else []
+            checklist = checklists.get(sub["id"], [])
             checklist_validation = [
                 v for v in validation_response["validation"] if v["id"] in [item["id"] for item in checklist]
             ] if sub["id"] == "G1" else []
@@ -1207,7 +1334,7 @@ Output Guidelines:
 
         section_g["status"] = "ai-draft"
 
-        template = await db.checklist_templates.find_one({"_id": "510k_v1"})
+        template = loaded["template"]
         total_sections = len(template.get("sections", []))
         completed_sections = sum(1 for section in sections if section.get("status") == "complete")
         total_criticals = 0
@@ -1247,23 +1374,96 @@ Output Guidelines:
             "subsectionId": "G1"
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in /api/ai/generate-performance-summary: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/ai/generate-performance-summary", response_model=Dict)
+async def generate_performance_summary(
+    payload: PerformanceSummaryRequest,
+    submission_id: str = Query(..., description="ID of the submission")
+):
+    return await _generate_performance_summary(payload, submission_id)
+
+@job_queue.handler("substantial_equivalence")
+async def run_substantial_equivalence_job(job_payload: Dict, progress) -> Dict:
+    request = SubstantialEquivalenceRequest(**job_payload["request"])
+    return await _generate_substantial_equivalence(request, job_payload["submission_id"], progress)
+
+@job_queue.handler("performance_summary")
+async def run_performance_summary_job(job_payload: Dict, progress) -> Dict:
+    request = PerformanceSummaryRequest(**job_payload["request"])
+    return await _generate_performance_summary(request, job_payload["submission_id"], progress)
+
+@app.post("/api/ai/jobs/substantial-equivalence", response_model=Dict, status_code=202)
+async def enqueue_substantial_equivalence(
+    payload: SubstantialEquivalenceRequest,
+    submission_id: str = Query(..., description="ID of the submission")
+):
+    try:
+        job_id = await job_queue.enqueue("substantial_equivalence", {"request": payload.dict(), "submission_id": submission_id})
+        return {"job_id": job_id, "status": STATUS_QUEUED}
+    except Exception as e:
+        logger.error(f"Error enqueuing Substantial Equivalence job for submission {submission_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/ai/jobs/performance-summary", response_model=Dict, status_code=202)
+async def enqueue_performance_summary(
+    payload: PerformanceSummaryRequest,
+    submission_id: str = Query(..., description="ID of the submission")
+):
+    try:
+        job_id = await job_queue.enqueue("performance_summary", {"request": payload.dict(), "submission_id": submission_id})
+        return {"job_id": job_id, "status": STATUS_QUEUED}
+    except Exception as e:
+        logger.error(f"Error enqueuing Performance Summary job for submission {submission_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/ai/jobs/{job_id}", response_model=Dict)
+async def get_job_status(job_id: str):
+    job = await job_queue.get(job_id)
+    if not job:
+        logger.warning(f"Job {job_id} not found")
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@app.get("/api/ai/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    if not await job_queue.get(job_id):
+        logger.warning(f"Job {job_id} not found")
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+    async def events():
+        async for stage, data, job in job_queue.events(job_id):
+            yield sse_event("progress", {"job_id": job_id, "stage": stage, **data})
+            if stage == STATUS_SUCCEEDED:
+                yield sse_event("done", {"job_id": job_id, "result": job.get("result")})
+            elif stage == STATUS_FAILED:
+                yield sse_event("error", {"job_id": job_id, **(job.get("error") or {})})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 
+SOP_REQUIRED_SECTIONS = ["# Purpose", "# Scope", "# Materials", "# Procedure", "# Quality Control", "# Safety Considerations", "# References", "# Revision History"]
 
 async def generate_fda_output(prompt: str) -> str:
     try:
         logger.info("Generating SOP content from provided prompt")
         chat_prompt = ChatPromptTemplate.from_template("{prompt}")
-        chain = chat_prompt | llm | StrOutputParser()
-        result = await chain.ainvoke({"prompt": prompt})
+        chain = chat_prompt | generation_llm.get() | StrOutputParser()
+        result = await scheduler.run(
+            generation_llm.get().model_name,
+            lambda: chain.ainvoke({"prompt": prompt}),
+            priority=PRIORITY_BULK,
+            tokens=estimate_tokens(prompt)
+        )
 
         # Validate SOP structure for full_document
         if "full_document" in prompt and "SOP" in prompt:
-            required_sections = ["# Purpose", "# Scope", "# Materials", "# Procedure", "# Quality Control", "# Safety Considerations", "# References", "# Revision History"]
-            missing = [section for section in required_sections if section not in result]
+            missing = [section for section in SOP_REQUIRED_SECTIONS if section not in result]
             if missing:
                 logger.error(f"Generated SOP missing sections: {missing}")
                 raise ValueError(f"Generated SOP is missing required sections: {missing}")
@@ -1295,10 +1495,62 @@ async def generate_fda_document(request: FDARequest):
         logger.info("Successfully generated FDA content")
         return {"output": result}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in /generate-fda-text: {str(e)}")
         raise HTTPException(status_code=500, detail="Error generating FDA content")
 
+@app.post("/generate-fda-text/stream")
+async def generate_fda_document_stream(request: FDARequest):
+    try:
+        logger.info(f"Received request to stream FDA content | Intent: {request.user_intent}")
+        prompt = build_fda_prompt(
+            user_intent=request.user_intent,
+            fda_guideline=request.fda_guideline,
+            user_input=request.user_input,
+            selected_text=request.selected_text
+        )
+        scheduler.admit(generation_llm.get().model_name, PRIORITY_BULK)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in /generate-fda-text/stream: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error generating FDA content")
+
+    chain = ChatPromptTemplate.from_template("{prompt}") | generation_llm.get() | StrOutputParser()
+    # Same structure check as generate_fda_output, reported as sections arrive
+    tracker = HeadingTracker(SOP_REQUIRED_SECTIONS) if "full_document" in prompt and "SOP" in prompt else None
+
+    async def events():
+        parts = []
+        try:
+            async with scheduler.slot(generation_llm.get().model_name, estimate_tokens(prompt), PRIORITY_BULK):
+                async for chunk in chain.astream({"prompt": prompt}):
+                    text = chunk_text(chunk)
+                    if not text:
+                        continue
+                    parts.append(text)
+                    yield sse_event("token", {"text": text})
+                    if tracker:
+                        for section in tracker.feed(text):
+                            yield sse_event("section", {"section": section})
+
+            if tracker and tracker.missing:
+                logger.error(f"Streamed SOP missing sections: {tracker.missing}")
+                yield sse_event("error", {"status": 500, "detail": f"Generated SOP is missing required sections: {tracker.missing}"})
+                return
+            logger.info("Successfully streamed FDA content")
+            yield sse_event("done", {"output": "".join(parts)})
+        except HTTPException as e:
+            logger.error(f"Error in /generate-fda-text/stream: {e.detail}")
+            yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"Error in /generate-fda-text/stream: {str(e)}")
+            yield sse_event("error", {"status": 500, "detail": "Error generating FDA content"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 # Include router
 app.include_router(submissions.router)
 app.include_router(templates.router)
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, status, UploadFile, File, Form
 from api.models.document_hub import DocumentCreate, Document, DocumentUpdate, UploadedBy, UploadedByVersionHistory, VersionHistory
 from api.services.db import document_hub_collection
+from api.services import blob_store
 from api.services.document_service import create_document, get_document, get_all_documents, update_document, delete_document, upload_to_storage
 from pydantic import BaseModel
 from typing import Optional, List
@@ -212,9 +213,9 @@ async def get_document_content(fileUrl: str, orgId: str):
             raise HTTPException(status_code=400, detail="Missing fileUrl or orgId")
 
         file_path = fileUrl.lstrip("/")
-        full_path = os.path.join("Uploads", os.path.basename(file_path))
+        full_path = await blob_store.resolve(os.path.basename(file_path))
 
-        if not os.path.exists(full_path):
+        if not full_path:
             logger.error(f"File not found: {full_path}")
             raise HTTPException(status_code=404, detail="File not found")
 
@@ -1,26 +1,31 @@
 
 from fastapi import APIRouter, UploadFile, HTTPException
-from pathlib import Path
 import logging
+import os
 import uuid
+from api.services.storage import UploadTooLargeError
+from api.services.blob_store import store_upload
+from api.services.content_extractor import schedule_extraction
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/files", tags=["files"])
 
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Section source documents can be large extracted PDFs, so they get a higher cap than attachments
+MAX_SECTION_FILE_SIZE = int(os.getenv("MAX_SECTION_FILE_SIZE", str(100 * 1024 * 1024)))
 
 @router.post("/upload", response_model=dict)
 async def upload_file(file: UploadFile):
     try:
         file_id = f"{uuid.uuid4()}_{file.filename}"
-        file_path = UPLOAD_DIR / file_id
-        with file_path.open("wb") as f:
-            content = await file.read()
-            f.write(content)
-        logger.info(f"Uploaded file {file_id} to {file_path}")
+        ref = await store_upload(file, file_id, max_size=MAX_SECTION_FILE_SIZE)
+        logger.info(f"Uploaded file {file_id} as blob {ref['sha256']}")
+        # Extract in the background so the section save that uses the file finds its text ready
+        await schedule_extraction(file_id)
         return {"fileId": file_id, "fileName": file.filename}
+    except UploadTooLargeError as e:
+        logger.error(f"Rejected upload {file.filename}: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to upload file: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,8 +1,12 @@
 from fastapi import APIRouter, HTTPException, status, UploadFile, File, Form, Query
 from api.models.submission import SubmissionCreate, Submission, SubmissionSectionUpdate, RTAReviewResponse, SubmissionSummary, SubmissionSummaryMetrics, AnalyticalTest, SupportingDocument, ClinicalStudy
 from api.services.submission_service import create_submission, get_submission, get_all_submissions, merge_submission_with_template
-from api.services.content_extractor import extract_content
+from api.services.content_extractor import wait_for_content
 from api.services.db import client
+from api.ai.engines.openai_client import generation_llm
+from api.ai.engines.validation import validate_batch
+from api.services.storage import UploadTooLargeError
+from api.services import blob_store
 from typing import Dict, Optional, List
 import logging
 from datetime import datetime
@@ -30,15 +34,7 @@ FALLBACK_CHECKLISTS = {
     ]
 }
 
-UPLOAD_DIR = Path(r"src\server\upload")
-
-# Ensure upload directory exists with proper permissions
-try:
-    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-    os.chmod(UPLOAD_DIR, 0o755)  # Ensure write permissions
-except Exception as e:
-    logger.error(f"Failed to create or set permissions for upload directory {UPLOAD_DIR}: {str(e)}")
-    raise Exception(f"Upload directory setup failed: {str(e)}")
+MAX_ATTACHMENT_SIZE = 10 * 1024 * 1024  # 10MB
 
 @router.post("/", response_model=Submission)
 async def create_new_submission(submission: SubmissionCreate):
@@ -374,12 +370,11 @@ async def update_submission_section(submission_id: str, section_id: str, update:
         
         content = update.content if update.content is not None else None
         if update.fileId and not content:
-            file_path = UPLOAD_DIR / update.fileId
-            if not file_path.exists():
+            if not await blob_store.resolve(update.fileId):
                 logger.error(f"File {update.fileId} does not exist")
                 raise HTTPException(status_code=400, detail="File not found")
             try:
-                content = await extract_content(update.fileId)
+                content = await wait_for_content(update.fileId)
                 logger.info(f"Extracted content for file {update.fileId}: {content[:50]}...")
             except Exception as e:
                 logger.error(f"Failed to extract content for file {update.fileId}: {str(e)}")
@@ -482,6 +477,34 @@ async def rta_review(submission_id: str, section_id: str, body: Dict):
             logger.error(f"Section {section_id} not found for submission {submission_id}")
             raise HTTPException(status_code=404, detail="Section not found")
         
+        # Optionally re-check every drafted subsection against its checklist, batched into as few LLM calls as fit
+        # Only the revalidated subsections' results are written back, so concurrent section edits are not overwritten
+        validation_updates = {}
+        array_filters = []
+        if body.get("revalidate"):
+            subsection_ids = [subsection["id"] for subsection in section["subsections"]]
+            checklist_prompts = await db.checklist_prompts.find({"subsectionId": {"$in": subsection_ids}}).to_list(length=None)
+            checklists = {cp["subsectionId"]: cp.get("checklist", []) for cp in checklist_prompts}
+            entries = [
+                {
+                    "subsection_id": subsection["id"],
+                    "content": subsection["contentExtracted"],
+                    "checklist": checklists.get(subsection["id"]) or FALLBACK_CHECKLISTS.get(subsection["id"], [])
+                }
+                for subsection in section["subsections"]
+                if isinstance(subsection.get("contentExtracted"), str) and subsection["contentExtracted"].strip()
+            ]
+            results = await validate_batch(generation_llm.get(), entries)
+            for subsection in section["subsections"]:
+                if subsection["id"] in results:
+                    subsection["checklistValidation"] = results[subsection["id"]]
+                    position = len(array_filters)
+                    validation_updates[f"sections.$[s].subsections.$[sub{position}].checklistValidation"] = results[subsection["id"]]
+                    array_filters.append({f"sub{position}.id": subsection["id"]})
+            if array_filters:
+                array_filters.insert(0, {"s.id": section_id})
+            logger.info(f"Revalidated {len(results)} subsections of section {section_id} for submission {submission_id}")
+
         total_questions = 0
         validated_questions = 0
         rta_failures = []
@@ -566,9 +589,11 @@ async def rta_review(submission_id: str, section_id: str, body: Dict):
                     "sectionStatus": {"completedCount": completed_sections, "totalSections": total_sections},
                     "rtaStatus": {"completedCriticals": completed_criticals, "totalCriticals": total_criticals},
                     "issues": unresolved_issues,
-                    "readinessScore": readiness_score
+                    "readinessScore": readiness_score,
+                    **validation_updates
                 }
-            }
+            },
+            **({"array_filters": array_filters} if array_filters else {})
         )
 
         logger.info(f"RTA review for submission {submission_id}, section {section_id}: {readiness_percent}% ready, {len(rta_failures)} failures")
@@ -577,6 +602,8 @@ async def rta_review(submission_id: str, section_id: str, body: Dict):
             rtaFailures=rta_failures,
             canMarkComplete=can_mark_complete
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in RTA review for submission {submission_id}, section {section_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -656,28 +683,26 @@ async def upload_test_attachment_section_c(submission_id: str, file: UploadFile
             logger.error(f"Test {test_id} not found in section C for submission {submission_id}")
             raise HTTPException(status_code=404, detail="Test not found")
         
-        if file.size > 10 * 1024 * 1024:  # 10MB limit
-            logger.error(f"File {file.filename} exceeds 10MB limit")
-            raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
-        
         if not file.content_type in ["application/pdf", "application/msword", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"]:
             logger.error(f"Unsupported file type {file.content_type} for file {file.filename}")
             raise HTTPException(status_code=400, detail="Only .pdf, .doc, or .docx files are supported")
         
         file_extension = file.filename.rsplit(".", 1)[-1] if "." in file.filename else ""
         file_id = f"{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOAD_DIR / file_id
 
         try:
-            with file_path.open("wb") as f:
-                content = await file.read()
-                f.write(content)
+            await blob_store.store_upload(file, file_id, max_size=MAX_ATTACHMENT_SIZE, owner={"submissionId": submission_id, "testId": test_id})
+        except UploadTooLargeError as e:
+            logger.error(f"File {file.filename} rejected: {str(e)}")
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
-            logger.error(f"Failed to save file {file.filename} to {file_path}: {str(e)}")
+            logger.error(f"Failed to save file {file.filename} as {file_id}: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
         
+        test = submission["sections"][section_index]["subsections"][subsection_index]["analytical_tests"][test_index]
+        previous_attachment = test.get("attachment_url")
         attachment_url = f"/upload/{file_id}"
-        submission["sections"][section_index]["subsections"][subsection_index]["analytical_tests"][test_index]["attachment_url"] = attachment_url
+        test["attachment_url"] = attachment_url
 
         await db.submissions.update_one(
             {"_id": submission_id},
@@ -687,6 +712,9 @@ async def upload_test_attachment_section_c(submission_id: str, file: UploadFile
             }}
         )
 
+        if previous_attachment:
+            await blob_store.release(previous_attachment)
+
         logger.info(f"Uploaded attachment {file_id} for test {test_id} in section C for submission {submission_id}")
         return {"attachment_url": attachment_url}
     except Exception as e:
@@ -724,11 +752,9 @@ async def delete_analytical_test_section_c(submission_id: str, test_id: str):
         
         if test.get("attachment_url"):
             file_id = test["attachment_url"].split("/")[-1]
-            file_path = UPLOAD_DIR / file_id
             try:
-                if file_path.exists():
-                    file_path.unlink()
-                    logger.info(f"Deleted file {file_id} for test {test_id}")
+                await blob_store.release(file_id)
+                logger.info(f"Released file {file_id} for test {test_id}")
             except Exception as e:
                 logger.warning(f"Failed to delete file {file_id}: {str(e)}")
         
@@ -776,24 +802,20 @@ async def upload_supporting_document_section_c(submission_id: str, file: UploadF
             })
             subsection_index = len(submission["sections"][section_index]["subsections"]) - 1
         
-        if file.size > 10 * 1024 * 1024:  # 10MB limit
-            logger.error(f"File {file.filename} exceeds 10MB limit")
-            raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
-        
         if not file.content_type in ["application/pdf", "application/msword", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"]:
             logger.error(f"Unsupported file type {file.content_type} for file {file.filename}")
             raise HTTPException(status_code=400, detail="Only .pdf, .doc, or .docx files are supported")
         
         file_extension = file.filename.rsplit(".", 1)[-1] if "." in file.filename else ""
         file_id = f"{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOAD_DIR / file_id
 
         try:
-            with file_path.open("wb") as f:
-                content = await file.read()
-                f.write(content)
+            await blob_store.store_upload(file, file_id, max_size=MAX_ATTACHMENT_SIZE, owner={"submissionId": submission_id})
+        except UploadTooLargeError as e:
+            logger.error(f"File {file.filename} rejected: {str(e)}")
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
-            logger.error(f"Failed to save file {file.filename} to {file_path}: {str(e)}")
+            logger.error(f"Failed to save file {file.filename} as {file_id}: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
         
         document = SupportingDocument(
@@ -849,11 +871,9 @@ async def delete_supporting_document_section_c(submission_id: str, document_id:
         document = submission["sections"][section_index]["subsections"][subsection_index]["supporting_documents"].pop(document_index)
         
         file_id = document["url"].split("/")[-1]
-        file_path = UPLOAD_DIR / file_id
         try:
-            if file_path.exists():
-                file_path.unlink()
-                logger.info(f"Deleted file {file_id} for document {document_id}")
+            await blob_store.release(file_id)
+            logger.info(f"Released file {file_id} for document {document_id}")
         except Exception as e:
             logger.warning(f"Failed to delete file {file_id}: {str(e)}")
         
@@ -1197,11 +1217,9 @@ async def delete_analytical_test_section_c(submission_id: str, test_id: str):
         
         if test.get("attachment_url"):
             file_id = test["attachment_url"].split("/")[-1]
-            file_path = UPLOAD_DIR / file_id
             try:
-                if file_path.exists():
-                    file_path.unlink()
-                    logger.info(f"Deleted file {file_id} for test {test_id}")
+                await blob_store.release(file_id)
+                logger.info(f"Released file {file_id} for test {test_id}")
             except Exception as e:
                 logger.warning(f"Failed to delete file {file_id}: {str(e)}")
         
@@ -0,0 +1,195 @@
+import asyncio
+import datetime
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from fastapi import UploadFile
+from pymongo import ReturnDocument
+
+from api.services.db import db
+from api.services.metrics import REGISTRY
+from api.services.storage import save_upload, MAX_UPLOAD_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Uploads are stored once per distinct content under blobs/<sha[:2]>/<sha[2:4]>/<sha>.
+# Every logical file id (a fileId, attachment URL or Document Hub fileUrl) is a row in
+# file_refs pointing at its blob; file_blobs counts those rows, and a blob whose count
+# drops to zero is deleted.
+BLOB_STORE_DIR = Path(os.getenv("BLOB_STORE_DIR", "blobs"))
+# Where uploads went before the blob store; ids without a file_refs row are looked up here
+LEGACY_UPLOAD_DIRS = [Path("uploads"), Path("Uploads"), Path(r"src\server\upload")]
+
+blobs_collection = db.file_blobs
+refs_collection = db.file_refs
+
+blob_uploads_total = REGISTRY.counter("blob_uploads_total", "Uploads by whether their content was already stored", ("outcome",))
+blob_bytes_deduplicated_total = REGISTRY.counter("blob_bytes_deduplicated_total", "Upload bytes not written because the blob existed")
+blobs_collected_total = REGISTRY.counter("blobs_collected_total", "Blobs deleted after their last reference was released")
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def blob_path(sha256: str) -> Path:
+    return BLOB_STORE_DIR / sha256[:2] / sha256[2:4] / sha256
+
+
+def _place(temp_path: Path, dest: Path) -> bool:
+    """Move a finished upload into the store; returns False when identical content was already there."""
+    if dest.exists():
+        temp_path.unlink(missing_ok=True)
+        return False
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(temp_path, dest)
+    return True
+
+
+async def ensure_indexes() -> None:
+    await refs_collection.create_index("sha256")
+    await blobs_collection.create_index("refcount")
+
+
+async def store_upload(
+    file: UploadFile,
+    file_id: str,
+    max_size: int = MAX_UPLOAD_SIZE,
+    owner: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Stream an upload into the store and register `file_id` as a reference to it.
+
+    :param file: The upload.
+    :param file_id: Logical id the caller hands out, e.g. "<uuid>.pdf".
+    :param max_size: Size limit in bytes.
+    :param owner: What the file is attached to, e.g. {"submissionId": "SUB-001"}; informational.
+    :return: The file_refs row.
+    """
+    stored = await save_upload(file, BLOB_STORE_DIR / "tmp" / uuid.uuid4().hex, max_size=max_size)
+    now = _now()
+    try:
+        # Count the reference before the file is placed, so a concurrent collection of the same blob backs off
+        result = await blobs_collection.update_one(
+            {"_id": stored.sha256},
+            {"$inc": {"refcount": 1}, "$set": {"updated_at": now}, "$setOnInsert": {"size": stored.size, "created_at": now}},
+            upsert=True,
+        )
+    except BaseException:
+        await asyncio.to_thread(stored.path.unlink, True)
+        raise
+    written = await asyncio.to_thread(_place, stored.path, blob_path(stored.sha256))
+    if written:
+        blob_uploads_total.inc(outcome="new")
+    else:
+        blob_uploads_total.inc(outcome="deduplicated")
+        blob_bytes_deduplicated_total.inc(stored.size)
+    ref = {
+        "_id": file_id,
+        "sha256": stored.sha256,
+        "size": stored.size,
+        "filename": file.filename,
+        "content_type": file.content_type,
+        "owner": owner or {},
+        "created_at": now,
+    }
+    try:
+        await refs_collection.insert_one(ref)
+    except BaseException:
+        await blobs_collection.update_one({"_id": stored.sha256}, {"$inc": {"refcount": -1}})
+        raise
+    logger.info(f"Stored {file_id} as blob {stored.sha256[:12]} ({'new' if result.upserted_id else 'deduplicated'})")
+    return ref
+
+
+async def get_ref(file_id: str) -> Optional[Dict[str, Any]]:
+    return await refs_collection.find_one({"_id": file_id})
+
+
+def _legacy_path(file_id: str) -> Optional[Path]:
+    for directory in LEGACY_UPLOAD_DIRS:
+        path = directory / file_id
+        if path.exists():
+            return path
+    return None
+
+
+async def resolve(file_id: str) -> Optional[Path]:
+    """Path of the bytes behind a logical file id, or None if there are none."""
+    file_id = os.path.basename(file_id)
+    ref = await get_ref(file_id)
+    if ref:
+        path = blob_path(ref["sha256"])
+        if await asyncio.to_thread(path.exists):
+            return path
+        logger.error(f"File {file_id} references missing blob {ref['sha256']}")
+        return None
+    return await asyncio.to_thread(_legacy_path, file_id)
+
+
+async def release(file_id: str) -> None:
+    """Drop one reference; the blob is deleted once nothing references it."""
+    file_id = os.path.basename(file_id)
+    ref = await refs_collection.find_one_and_delete({"_id": file_id})
+    if not ref:
+        path = await asyncio.to_thread(_legacy_path, file_id)
+        if path:
+            await asyncio.to_thread(path.unlink, True)
+            logger.info(f"Deleted legacy upload {path}")
+        return
+    blob = await blobs_collection.find_one_and_update(
+        {"_id": ref["sha256"]},
+        {"$inc": {"refcount": -1}, "$set": {"updated_at": _now()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if blob and blob["refcount"] <= 0:
+        await collect(ref["sha256"])
+
+
+def _tombstone(path: Path) -> Optional[Path]:
+    tombstone = path.with_name(f"{path.name}.{uuid.uuid4().hex}.gc")
+    try:
+        os.replace(path, tombstone)
+    except FileNotFoundError:
+        return None
+    return tombstone
+
+
+def _restore(tombstone: Path, path: Path) -> None:
+    # Same hash, same bytes: whichever copy ends up in place is correct
+    if path.exists():
+        tombstone.unlink(missing_ok=True)
+    else:
+        os.replace(tombstone, path)
+
+
+async def collect(sha256: str) -> bool:
+    """
+    Delete an unreferenced blob. The file is first renamed aside, then the
+    record is deleted only if still unreferenced; if an upload of the same
+    content raced in, the file is put back.
+    """
+    path = blob_path(sha256)
+    tombstone = await asyncio.to_thread(_tombstone, path)
+    result = await blobs_collection.delete_one({"_id": sha256, "refcount": {"$lte": 0}})
+    if result.deleted_count == 0:
+        if tombstone:
+            await asyncio.to_thread(_restore, tombstone, path)
+        return False
+    if tombstone:
+        await asyncio.to_thread(tombstone.unlink, True)
+    blobs_collected_total.inc()
+    logger.info(f"Collected blob {sha256}")
+    return True
+
+
+async def collect_garbage() -> int:
+    """Sweep blobs left at zero references, e.g. by a process that died mid-release."""
+    collected = 0
+    async for blob in blobs_collection.find({"refcount": {"$lte": 0}}, {"_id": 1}):
+        if await collect(blob["_id"]):
+            collected += 1
+    return collected
@@ -1,6 +1,6 @@
 
 import logging
-from ..db import client
+from api.services.db import client
 
 logger = logging.getLogger(__name__)
 
@@ -1,93 +1,212 @@
+import json
 import logging
-from typing import List, Dict
+import os
+import re
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, List, Tuple
+
+from api.services.keyword_automaton import KeywordAutomaton
+from api.services.rta_rules import RTA_RULES
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Content with fewer words than this cannot address any checklist item
+PREVALIDATION_MIN_WORDS = int(os.getenv("PREVALIDATION_MIN_WORDS", "5"))
+# Sections whose subsections describe the device itself, where the RTA heuristics apply
+RTA_RULE_SECTIONS = {"A"}
+
+DECISION_FAIL = "fail"
+DECISION_UNCERTAIN = "uncertain"
+
+# Question -> concepts the content is expected to mention; edit the JSON file to change the rules
+CHECKLIST_RULES_PATH = os.getenv("CHECKLIST_RULES_PATH", os.path.join(os.path.dirname(__file__), "checklist_rules.json"))
+
+
+def load_keyword_rules(path: str = CHECKLIST_RULES_PATH) -> Dict[str, List[str]]:
+    with open(path, encoding="utf-8") as f:
+        rules = json.load(f)
+    logger.info(f"Loaded {len(rules)} checklist keyword rules from {path}")
+    return rules
+
+
+KEYWORD_RULES = load_keyword_rules()
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+_WORD_RE = re.compile(r"\w+")
+_SUFFIXES = ("ations", "ation", "ments", "ment", "ings", "ing", "ies", "ied", "ed", "es", "s")
+
+
+@lru_cache(maxsize=65536)
+def stem(token: str) -> str:
+    """Light suffix stripping so "risks"/"risk" and "tested"/"tests" compare equal."""
+    if len(token) <= 3 or not token.isalpha():
+        return token
+    base = token
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            if suffix == "s" and token.endswith(("ss", "us", "is")):
+                break
+            base = token[:-len(suffix)]
+            if suffix in ("ies", "ied"):
+                base += "y"
+            elif suffix in ("ed", "ing") and len(base) > 3 and base[-1] == base[-2] and base[-1] != "s":
+                base = base[:-1]  # planned -> plan, controlled -> control
+            break
+    # disease/diseases, tolerance/tolerances
+    if len(base) > 4 and base.endswith("e"):
+        base = base[:-1]
+    return base
+
+
+def stems(text: str) -> List[str]:
+    return [stem(token) for token in _TOKEN_RE.findall(text.lower())]
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """Stemmed tokens with their character offsets; the text is lowercased once."""
+    return [(stem(m.group()), m.start(), m.end()) for m in _TOKEN_RE.finditer(text.lower())]
+
+
+def _normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+# Compiled once: question -> (keyword, stem tuple), plus one automaton over every keyword phrase
+_COMPILED_RULES: Dict[str, List[Tuple[str, Tuple[str, ...]]]] = {
+    _normalize_question(question): [(keyword, tuple(stems(keyword))) for keyword in keywords]
+    for question, keywords in KEYWORD_RULES.items()
+}
+_AUTOMATON = KeywordAutomaton(phrase for rules in _COMPILED_RULES.values() for _, phrase in rules)
+_KEYWORD_STEMS = {token for phrase in _AUTOMATON.phrases for token in phrase}
+
+
+def _trie_pattern(words: List[str]) -> str:
+    # Alternation factored by shared prefixes, which the regex engine matches far faster than a flat list
+    trie: Dict[str, Dict] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, Dict]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+# Only tokens that could stem to a keyword token are fed to the automaton, and the regex finds them
+# at C speed. Prefixes drop a trailing "y" so "studies" is still a candidate for "study".
+_CANDIDATE_RE = re.compile(
+    r"(?<![a-z0-9])"
+    + _trie_pattern(sorted({s[:-1] if s.endswith("y") else s for s in _KEYWORD_STEMS}))
+    + r"[a-z0-9]*(?:\.[0-9]+)*"
+)
+_WORD_CHAR_RE = re.compile(r"[a-z0-9]")
+# Keyword concepts that an RTA heuristic can also vouch for, e.g. "population" via "adult"/"pediatric"
+_RTA_CONCEPTS = {stem(name): name for name in RTA_RULES}
+
+
+def _candidate_tokens(text: str) -> List[Tuple[str, int, int]]:
+    tokens = []
+    previous_end = 0
+    for m in _CANDIDATE_RE.finditer(text):
+        token = stem(m.group())
+        # Any skipped word in between breaks a phrase, so feed the automaton a token it cannot follow
+        if token not in _KEYWORD_STEMS or _WORD_CHAR_RE.search(text, previous_end, m.start()):
+            tokens.append(("", previous_end, previous_end))
+        if token in _KEYWORD_STEMS:
+            tokens.append((token, m.start(), m.end()))
+        previous_end = m.end()
+    return tokens
+
+
+def scan_keywords(content: str) -> Dict[Tuple[str, ...], List[Tuple[int, int]]]:
+    """
+    Find every rule keyword in one pass over the content.
+
+    :return: Character spans of each keyword phrase (as a stem tuple) that occurs.
+    """
+    return _AUTOMATON.scan(_candidate_tokens(content.lower()))
+
+
+def _has_words(content: str, count: int) -> bool:
+    return sum(1 for _ in islice(_WORD_RE.finditer(content), count)) >= count
+
+
+def prevalidate(subsection_id: str, checklist: List[Dict], content: str) -> List[Dict]:
+    """
+    Rule tier of checklist validation. Fails every item when the content is empty or
+    too short to address any of them, and otherwise marks them "uncertain" for the LLM.
+
+    Keyword matches are only reported, not acted on: a mention does not show an item
+    is addressed ("the intended use is not yet defined"), and the rules list one or
+    two literal words per item, so their absence does not show it is missing either
+    ("for adult patients in hospitals" answers a question about the population).
+
+    :param subsection_id: Subsection being validated, e.g. "A2"; selects section-specific heuristics.
+    :param checklist: Checklist items with "id" and "question".
+    :param content: Content to validate.
+    :return: One entry per checklist item with "decision", "matched", "missing" and "coverage".
+    """
+    too_short = not _has_words(content or "", PREVALIDATION_MIN_WORDS)
+    hits = scan_keywords(content or "")
+    use_rta = subsection_id[:1].upper() in RTA_RULE_SECTIONS
+    rta_results: Dict[str, bool] = {}
+
+    def rta_vouches(phrase: Tuple[str, ...]) -> bool:
+        if not use_rta or len(phrase) != 1 or phrase[0] not in _RTA_CONCEPTS:
+            return False
+        name = _RTA_CONCEPTS[phrase[0]]
+        if name not in rta_results:
+            rta_results[name] = bool(RTA_RULES[name](content or ""))
+        return rta_results[name]
+
+    verdicts = []
+    for item in checklist:
+        rules = _COMPILED_RULES.get(_normalize_question(item.get("question", "")))
+        if not rules:
+            verdicts.append({
+                "id": item.get("id"),
+                "question": item.get("question", ""),
+                "decision": DECISION_FAIL if too_short else DECISION_UNCERTAIN,
+                "matched": [],
+                "missing": [],
+                "coverage": 0.0,
+            })
+            continue
+        matched = [keyword for keyword, phrase in rules if phrase in hits or rta_vouches(phrase)]
+        missing = [keyword for keyword, _ in rules if keyword not in matched]
+        verdicts.append({
+            "id": item.get("id"),
+            "question": item.get("question", ""),
+            "decision": DECISION_FAIL if too_short else DECISION_UNCERTAIN,
+            "matched": matched,
+            "missing": missing,
+            "coverage": round(len(matched) / len(rules), 2),
+        })
+    return verdicts
+
+
 async def validate_checklist(content: str, checklist: List[Dict]) -> List[Dict]:
     logger.info("Validating checklist")
+    hits = scan_keywords(content)
     validation_results = []
-
-    keyword_rules = {
-        "Does the summary describe the device purpose and function?": ["purpose", "function"],
-        "Does it include a high-level overview of the technology?": ["technology", "overview"],
-        "Is the target population or environment mentioned?": ["population", "environment"],
-        "Is the intended use clearly stated?": ["intended use"],
-        "Is the indication for use population defined?": ["indication", "population"],
-        "Are the conditions or diseases treated identified?": ["condition", "disease"],
-        "Are key specifications like dimensions, power, and materials listed?": ["dimensions", "power", "materials"],
-        "Is the performance range or tolerances provided?": ["performance", "tolerances"],
-        "Is a valid predicate device listed with 510(k) number?": ["predicate", "510(k)"],
-        "Are similarities and differences clearly described?": ["similarities", "differences"],
-        "Is the summary consistent with comparison table?": ["summary", "comparison"],
-        "Does it address technology and indication similarities?": ["technology", "indication"],
-        "Are performance metrics side-by-side with predicate?": ["performance", "predicate"],
-        "Are test methods referenced and results compared?": ["test methods", "results"],
-        "Are risks and mitigations for differences discussed?": ["risks", "mitigations"],
-        "Is the analysis aligned with ISO 14971 principles?": ["ISO 14971", "risk"],
-        "Is software architecture described?": ["software", "architecture"],
-        "Are software levels of concern defined?": ["software", "level of concern"],
-        "Are cybersecurity risks and controls documented?": ["cybersecurity", "risks"],
-        "Does it comply with FDA cybersecurity guidance?": ["cybersecurity", "FDA"],
-        "Are software test plans and results included?": ["test plans", "results"],
-        "Does it demonstrate conformance to specifications?": ["conformance", "specifications"],
-        "Does the evaluation address all patient-contacting materials?": ["biocompatibility", "materials"],
-        "Is the duration and type of contact specified?": ["contact", "duration"],
-        "Are test results for relevant ISO 10993 endpoints included?": ["ISO 10993", "test results"],
-        "Does the report justify the selection of tests performed?": ["tests", "justification"],
-        "Are analytical performance test methods described?": ["analytical", "test methods"],
-        "Do results meet predefined acceptance criteria?": ["results", "acceptance criteria"],
-        "Are precision studies conducted under controlled conditions?": ["precision", "controlled"],
-        "Are repeatability and reproducibility data provided?": ["repeatability", "reproducibility"],
-        "Are accuracy studies compared to a reference standard?": ["accuracy", "reference standard"],
-        "Are statistical measures of accuracy included?": ["statistical", "accuracy"],
-        "Are stability test conditions and duration specified?": ["stability", "duration"],
-        "Do results confirm device performance over shelf life?": ["shelf life", "performance"],
-        "Are potential interferents identified and tested?": ["interferents", "tested"],
-        "Do results show minimal interference impact?": ["interference", "impact"],
-        "Does the labeling include intended use and warnings?": ["labeling", "intended use"],
-        "Is the labeling consistent with FDA requirements?": ["labeling", "FDA"],
-        "Are instructions clear and user-friendly?": ["instructions", "user-friendly"],
-        "Do they include safety and handling information?": ["safety", "handling"],
-        "Does the insert include indications and contraindications?": ["indications", "contraindications"],
-        "Is it aligned with the intended use statement?": ["intended use", "aligned"],
-        "Is the study design and methodology described?": ["study design", "methodology"],
-        "Are inclusion and exclusion criteria defined?": ["inclusion", "exclusion"],
-        "Are study results summarized with statistical analysis?": ["statistical", "results"],
-        "Do results support safety and effectiveness?": ["safety", "effectiveness"],
-        "Is the statistical methodology clearly outlined?": ["statistical", "methodology"],
-        "Are endpoints and hypotheses defined?": ["endpoints", "hypotheses"],
-        "Does the summary integrate all clinical findings?": ["clinical", "findings"],
-        "Is it consistent with the study report?": ["study report", "consistent"],
-        "Are all potential risks identified and assessed?": ["risks", "assessed"],
-        "Is the file compliant with ISO 14971?": ["ISO 14971", "compliant"],
-        "Does the analysis justify benefits outweighing risks?": ["benefits", "risks"],
-        "Are residual risks clearly documented?": ["residual risks", "documented"],
-        "Does the summary include all required elements per 21 CFR 807.92?": ["21 CFR 807.92", "summary"],
-        "Is it concise and consistent with other sections?": ["concise", "consistent"],
-        "Is the statement signed and dated?": ["signed", "dated"],
-        "Does it confirm the accuracy of the submission?": ["accuracy", "submission"],
-        "Are all relevant supporting documents included?": ["supporting documents", "included"],
-        "Are documents organized and clearly referenced?": ["organized", "referenced"],
-    }
-
     for item in checklist:
         question = item.get("question", "")
-        keywords = keyword_rules.get(question, [])
-        validated = False
-        comments = "No matching rule found"
-
-        for keyword in keywords:
-            if keyword.lower() in content.lower():
-                validated = True
-                comments = f"Validated by keyword: {keyword}"
-                break
-
+        rules = _COMPILED_RULES.get(_normalize_question(question), [])
+        keyword = next((keyword for keyword, phrase in rules if phrase in hits), None)
         validation_results.append({
             "question": question,
-            "validated": validated,
-            "comments": comments
+            "validated": keyword is not None,
+            "comments": f"Validated by keyword: {keyword}" if keyword else "No matching rule found"
         })
 
     logger.info(f"Checklist validation completed with {len(validation_results)} results")
-    return validation_results
\ No newline at end of file
+    return validation_results
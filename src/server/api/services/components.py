@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, List, Optional, TypeVar
+
+from api.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Heavy components (the embedding model, chat models) are built on first use
+# instead of at import, so processes that never need them never pay for them.
+# Warming them in the background after startup is opt-in: WARM_UP_COMPONENTS is
+# "none" (default), "all", or a comma-separated list of component names, e.g.
+# "embedding_model" on a worker that serves chat and has no embedding server.
+WARM_UP_COMPONENTS = os.getenv("WARM_UP_COMPONENTS", "none").strip().lower()
+# Lets the server answer its first requests before warm-up competes for CPU
+WARM_UP_DELAY_SECONDS = float(os.getenv("WARM_UP_DELAY_SECONDS", "0"))
+
+STATUS_COLD = "cold"
+STATUS_LOADING = "loading"
+STATUS_WARM = "warm"
+STATUS_FAILED = "failed"
+
+component_ready = REGISTRY.gauge("component_ready", "1 once a lazily loaded component has been built", ("component",))
+component_load_seconds = REGISTRY.gauge("component_load_seconds", "Time it took to build a lazily loaded component", ("component",))
+
+T = TypeVar("T")
+
+
+class Component(Generic[T]):
+    """
+    A value built by `factory` the first time it is needed. Building is
+    serialised, so concurrent first users wait for one build instead of
+    starting several; a failed build is retried on the next use.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T], required: bool = True):
+        self.name = name
+        self.factory = factory
+        # Whether /ready waits for this component
+        self.required = required
+        self.status = STATUS_COLD
+        self.load_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self._value: Optional[T] = None
+        self._lock = threading.Lock()
+
+    @property
+    def warm(self) -> bool:
+        return self.status == STATUS_WARM
+
+    def get(self) -> T:
+        """The component, built in the calling thread if needed; from async code prefer `aget`."""
+        if self.status == STATUS_WARM:
+            return self._value
+        with self._lock:
+            if self.status == STATUS_WARM:
+                return self._value
+            self.status = STATUS_LOADING
+            started = time.perf_counter()
+            try:
+                value = self.factory()
+            except Exception as e:
+                self.status, self.error = STATUS_FAILED, str(e)
+                logger.error(f"Failed to load {self.name}: {str(e)}")
+                raise
+            self.load_seconds = time.perf_counter() - started
+            self._value, self.status, self.error = value, STATUS_WARM, None
+            component_ready.set(1, component=self.name)
+            component_load_seconds.set(self.load_seconds, component=self.name)
+            logger.info(f"Loaded {self.name} in {self.load_seconds:.2f}s")
+            return value
+
+    async def aget(self) -> T:
+        """The component; a build runs in a thread so it does not stall the event loop."""
+        if self.status == STATUS_WARM:
+            return self._value
+        return await asyncio.to_thread(self.get)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"status": self.status, "required": self.required, "load_seconds": self.load_seconds, "error": self.error}
+
+
+_components: Dict[str, Component] = {}
+_warm_up_task: Optional[asyncio.Task] = None
+
+
+def register(name: str, factory: Callable[[], T], required: bool = True) -> Component[T]:
+    """
+    Declare a lazily built component.
+
+    :param name: Name reported by /ready and used in WARM_UP_COMPONENTS.
+    :param factory: Builds the component; called at most once per successful build.
+    :param required: Whether the process counts as ready only once it is warm.
+    """
+    if name in _components:
+        raise ValueError(f"Component {name} is already registered")
+    component = Component(name, factory, required)
+    _components[name] = component
+    component_ready.set(0, component=name)
+    return component
+
+
+def get(name: str) -> Component:
+    return _components[name]
+
+
+def names() -> List[str]:
+    return list(_components)
+
+
+def _to_warm() -> List[Component]:
+    if WARM_UP_COMPONENTS == "none":
+        return []
+    if WARM_UP_COMPONENTS == "all":
+        return list(_components.values())
+    wanted = [n.strip() for n in WARM_UP_COMPONENTS.split(",") if n.strip()]
+    return [_components[n] for n in wanted if n in _components]
+
+
+async def warm_up() -> None:
+    """Build the configured components one after another, logging rather than raising failures."""
+    await asyncio.sleep(WARM_UP_DELAY_SECONDS)
+    if WARM_UP_COMPONENTS not in ("all", "none"):
+        unknown = [n.strip() for n in WARM_UP_COMPONENTS.split(",") if n.strip() and n.strip() not in _components]
+        if unknown:
+            logger.warning(f"WARM_UP_COMPONENTS names unknown components: {unknown}")
+    for component in _to_warm():
+        try:
+            await component.aget()
+        except Exception:
+            # Already logged; the next use retries
+            pass
+
+
+def start_warm_up() -> None:
+    global _warm_up_task
+    if _warm_up_task is None:
+        _warm_up_task = asyncio.create_task(warm_up())
+
+
+async def stop_warm_up() -> None:
+    global _warm_up_task
+    if _warm_up_task is not None:
+        # A build already running in a thread finishes on its own; this only stops the sequence
+        _warm_up_task.cancel()
+        await asyncio.gather(_warm_up_task, return_exceptions=True)
+        _warm_up_task = None
+
+
+def readiness() -> Dict[str, Any]:
+    """Per-component status, and whether every required component is warm."""
+    # Components left out of warm-up are built on first use and do not hold readiness back
+    return {
+        "ready": all(c.warm for c in _to_warm() if c.required),
+        "components": {name: c.describe() for name, c in _components.items()},
+    }
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrently awaited steps per request, so one endpoint cannot
+# monopolise the Mongo pool or the LLM scheduler queue
+MAX_FANOUT = int(os.getenv("MAX_FANOUT", "8"))
+
+
+async def gather_bounded(*aws: Awaitable, limit: Optional[int] = None, return_exceptions: bool = False) -> list:
+    """Like asyncio.gather, but with at most `limit` awaitables running at once."""
+    semaphore = asyncio.Semaphore(limit or MAX_FANOUT)
+
+    async def run(aw: Awaitable) -> Any:
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*(run(aw) for aw in aws), return_exceptions=return_exceptions)
+
+
+async def gather_named(steps: Dict[str, Awaitable], limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Run independent steps concurrently and return their results by name.
+
+    Example:
+        loaded = await gather_named({
+            "submission": db.submissions.find_one({"_id": submission_id}),
+            "template": db.checklist_templates.find_one({"_id": "510k_v1"}),
+        })
+    """
+    names = list(steps)
+    try:
+        results = await gather_bounded(*steps.values(), limit=limit)
+    except Exception as e:
+        logger.error(f"Concurrent steps {names} failed: {str(e)}")
+        raise
+    return dict(zip(names, results))
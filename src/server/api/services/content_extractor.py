@@ -1,28 +1,360 @@
+import asyncio
+import datetime
+import hashlib
 import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
 from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+import mammoth
+import pdfplumber
 import PyPDF2
+from fastapi import HTTPException
+from pymongo.errors import PyMongoError
+
+from api.services import blob_store
+from api.services.db import db
+from api.services.job_queue import JobQueue
+from api.services.metrics import REGISTRY
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def extract_content(file_id: str) -> str:
+# PDF parsing is CPU-bound, so it runs in worker processes; 0 runs it on a thread instead
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Pages past this budget are not extracted; 0 means no limit
+EXTRACTION_MAX_PAGES = int(os.getenv("EXTRACTION_MAX_PAGES", "500"))
+# How long a section save waits for a running extraction job before parsing the file itself
+EXTRACTION_WAIT_SECONDS = float(os.getenv("EXTRACTION_WAIT_SECONDS", "30"))
+EXTRACTION_JOB = "content_extraction"
+EXTRACTABLE_EXTENSIONS = {".pdf", ".docx"}
+
+# Page texts keyed by the sha256 of the file content:
+# {_id: sha256, page_count, pages: {"0": text, ...}, updated_at}
+extraction_cache = db.extraction_cache
+
+extraction_cache_total = REGISTRY.counter("extraction_cache_total", "Text extractions by how much of the result was cached", ("outcome",))
+extraction_seconds = REGISTRY.histogram("extraction_seconds", "Time spent parsing PDF pages that were not cached")
+upload_to_editable_seconds = REGISTRY.histogram(
+    "upload_to_editable_seconds",
+    "Time from a file upload until its text is extracted, by a background job or by the section save itself",
+    ("path",),
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800, 3600),
+)
+
+T = TypeVar("T")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_queue: Optional[JobQueue] = None
+# Section saves waiting on an extraction job running in this process, by file id
+_waiters: Dict[str, asyncio.Event] = {}
+
+
+def _page_range(page_count: int, max_pages: int) -> range:
+    return range(min(page_count, max_pages) if max_pages else page_count)
+
+
+def _read_pages(path: str, kind: str, indices: Optional[List[int]], max_pages: int) -> Tuple[int, Dict[int, str]]:
+    """
+    Runs in a worker process. Extracts the given pages, or the first `max_pages`
+    pages when `indices` is None. A DOCX has no pages and comes back as page 0.
+
+    :return: The document's page count and the extracted text per page index.
+    """
+    if kind == ".docx":
+        with open(path, "rb") as f:
+            return 1, {0: mammoth.extract_raw_text(f).value}
+    try:
+        with open(path, "rb") as f:
+            reader = PyPDF2.PdfReader(f)
+            page_count = len(reader.pages)
+            wanted = _page_range(page_count, max_pages) if indices is None else indices
+            return page_count, {i: reader.pages[i].extract_text() or "" for i in wanted if 0 <= i < page_count}
+    except PyPDF2.errors.PdfReadError:
+        # pdfplumber copes with some damaged cross-reference tables PyPDF2 rejects
+        with pdfplumber.open(path) as pdf:
+            page_count = len(pdf.pages)
+            wanted = _page_range(page_count, max_pages) if indices is None else indices
+            return page_count, {i: pdf.pages[i].extract_text() or "" for i in wanted if 0 <= i < page_count}
+
+
+def _get_pool() -> Executor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS)
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _kind(file_id: str) -> str:
+    return os.path.splitext(file_id)[1].lower()
+
+
+async def run_in_pool(fn: Callable[..., T], *args) -> T:
+    """
+    Run a CPU-bound function in the extraction process pool, or on a thread
+    when EXTRACTION_WORKERS is 0. `fn` and its arguments must be picklable.
+    """
+    job = partial(fn, *args)
+    if EXTRACTION_WORKERS <= 0:
+        return await asyncio.to_thread(job)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), job)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a malformed PDF); start a fresh pool and retry once
+        logger.warning(f"Extraction pool broken while running {fn.__name__}, restarting it")
+        shutdown_pool()
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), job)
+
+
+async def _run_extraction(path: Path, kind: str, indices: Optional[List[int]], max_pages: int) -> Tuple[int, Dict[int, str]]:
+    started = time.perf_counter()
+    try:
+        return await run_in_pool(_read_pages, str(path), kind, indices, max_pages)
+    finally:
+        extraction_seconds.observe(time.perf_counter() - started)
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def _locate(file_id: str) -> Tuple[Path, str]:
+    """Path and content hash of a file; legacy uploads without a blob ref are hashed on the fly."""
+    file_path = await blob_store.resolve(file_id)
+    if not file_path:
+        logger.error(f"File {file_id} does not exist")
+        raise FileNotFoundError(f"File {file_id} not found")
+    ref = await blob_store.get_ref(os.path.basename(file_id))
+    sha256 = ref["sha256"] if ref else await asyncio.to_thread(_hash_file, file_path)
+    return file_path, sha256
+
+
+async def _cached_pages(sha256: str, wanted: Optional[Iterable[int]] = None) -> Tuple[Optional[int], Dict[int, str]]:
+    projection = {"page_count": 1}
+    if wanted is None:
+        projection["pages"] = 1
+    else:
+        projection.update({f"pages.{i}": 1 for i in wanted})
+    cached = await extraction_cache.find_one({"_id": sha256}, projection)
+    if not cached:
+        return None, {}
+    return cached.get("page_count"), {int(i): text for i, text in cached.get("pages", {}).items()}
+
+
+async def _store_pages(sha256: str, page_count: int, pages: Dict[int, str]) -> None:
+    try:
+        await extraction_cache.update_one(
+            {"_id": sha256},
+            {"$set": {"page_count": page_count, "updated_at": datetime.datetime.utcnow(), **{f"pages.{i}": text for i, text in pages.items()}}},
+            upsert=True,
+        )
+    except Exception as e:
+        # The cache is an optimisation; a failed write (e.g. a document over 16MB) must not fail extraction
+        logger.warning(f"Failed to cache extracted pages for {sha256[:12]}: {str(e)}")
+
+
+async def extract_pages(file_id: str, pages: Optional[Iterable[int]] = None, max_pages: int = EXTRACTION_MAX_PAGES) -> Tuple[int, Dict[int, str]]:
+    """
+    Extract text per page, parsing only pages that are not cached yet.
+
+    :param file_id: Logical file id, as handed out by the upload endpoints.
+    :param pages: Zero-based page indices to extract; None extracts the first `max_pages` pages.
+    :param max_pages: Page budget when `pages` is None; 0 means no limit.
+    :return: The document's page count and the text of each requested page that exists.
+    """
+    file_path, sha256 = await _locate(file_id)
+    wanted = sorted(set(pages)) if pages is not None else None
+    page_count, cached = await _cached_pages(sha256, wanted)
+
+    if page_count is not None:
+        if wanted is None:
+            wanted = list(_page_range(page_count, max_pages))
+        wanted = [i for i in wanted if 0 <= i < page_count]
+        missing = [i for i in wanted if i not in cached]
+    else:
+        missing = wanted
+
+    if page_count is not None and not missing:
+        extraction_cache_total.inc(outcome="hit")
+        return page_count, {i: cached[i] for i in wanted}
+
+    extraction_cache_total.inc(outcome="partial" if cached else "miss")
+    page_count, extracted = await _run_extraction(file_path, _kind(file_id), missing, max_pages)
+    await _store_pages(sha256, page_count, extracted)
+    cached.update(extracted)
+    if wanted is None:
+        wanted = sorted(extracted)
+    return page_count, {i: cached[i] for i in wanted if i in cached}
+
+
+async def extract_page(file_id: str, page: int) -> Optional[str]:
+    """Text of a single zero-based page, or None if the document has no such page."""
+    _, extracted = await extract_pages(file_id, [page])
+    return extracted.get(page)
+
+
+def _join_pages(pages: Dict[int, str]) -> Tuple[str, List[int]]:
+    """Join page texts; the index holds the offset in the text where each page starts."""
+    parts = [pages[i] for i in sorted(pages)]
+    index, offset = [], 0
+    for part in parts:
+        index.append(offset)
+        offset += len(part) + 1
+    text = "\n".join(parts)
+    stripped = text.lstrip()
+    lead = len(text) - len(stripped)
+    return stripped.rstrip(), [max(0, start - lead) for start in index]
+
+
+async def extract_content(file_id: str, max_pages: int = EXTRACTION_MAX_PAGES) -> str:
     logger.info(f"Extracting content from file {file_id}")
     try:
-        file_path = Path(f"uploads/{file_id}")
-        if not file_path.exists():
-            logger.error(f"File {file_path} does not exist")
-            raise FileNotFoundError(f"File {file_id} not found")
-        
-        with open(file_path, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() or ""
-            if not text.strip():
-                logger.warning(f"No text extracted from {file_id}")
-                return "No content extracted"
-            logger.info(f"Extracted {len(text)} characters from {file_id}")
-            return text.strip()
+        page_count, pages = await extract_pages(file_id, max_pages=max_pages)
+        text, _ = _join_pages(pages)
+        if not text:
+            logger.warning(f"No text extracted from {file_id}")
+            return "No content extracted"
+        if len(pages) < page_count:
+            logger.warning(f"Extracted only the first {len(pages)} of {page_count} pages of {file_id}")
+        logger.info(f"Extracted {len(text)} characters from {file_id}")
+        return text
     except Exception as e:
         logger.error(f"Failed to extract content from {file_id}: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+
+async def _set_state(file_id: str, **fields) -> None:
+    await blob_store.refs_collection.update_one(
+        {"_id": file_id},
+        {"$set": {f"extraction.{key}": value for key, value in fields.items()}},
+    )
+
+
+async def _observe_editable(file_id: str, path: str) -> None:
+    ref = await blob_store.get_ref(file_id)
+    if ref and ref.get("created_at"):
+        created_at = ref["created_at"].replace(tzinfo=datetime.timezone.utc)
+        upload_to_editable_seconds.observe((datetime.datetime.now(datetime.timezone.utc) - created_at).total_seconds(), path=path)
+
+
+def _wake(file_id: str) -> None:
+    event = _waiters.pop(file_id, None)
+    if event:
+        event.set()
+
+
+async def _run_job(payload: Dict[str, Any], progress) -> Dict[str, Any]:
+    file_id = payload["file_id"]
+    await _set_state(file_id, status="running", error=None)
+    try:
+        page_count, pages = await extract_pages(file_id)
+        text, page_index = _join_pages(pages)
+        await _set_state(
+            file_id,
+            status="succeeded",
+            page_count=page_count,
+            pages_extracted=len(pages),
+            page_index=page_index,
+            chars=len(text),
+            finished_at=datetime.datetime.utcnow(),
+        )
+        await _observe_editable(file_id, "background")
+        await progress("extracted", page_count=page_count, chars=len(text))
+        return {"file_id": file_id, "page_count": page_count, "pages_extracted": len(pages), "chars": len(text)}
+    except PyMongoError as e:
+        await _set_state(file_id, status="failed", error=str(e))
+        raise
+    except Exception as e:
+        # A file that cannot be parsed will not parse on a retry either
+        await _set_state(file_id, status="failed", error=str(e))
+        raise HTTPException(status_code=422, detail=f"Could not extract text from {file_id}: {str(e)}")
+    finally:
+        _wake(file_id)
+
+
+def register(queue: JobQueue) -> None:
+    """Run extraction jobs on `queue`; main.py calls this once with the app's queue."""
+    global _queue
+    _queue = queue
+    queue.handler(EXTRACTION_JOB)(_run_job)
+
+
+async def schedule_extraction(file_id: str) -> Optional[str]:
+    """
+    Queue background extraction of a freshly uploaded file, so that the
+    section save that uses it finds the text ready. Failing to queue is not
+    an error; the save then extracts the file itself.
+
+    :return: The job id, or None when nothing was queued.
+    """
+    if _queue is None or _kind(file_id) not in EXTRACTABLE_EXTENSIONS:
+        return None
+    try:
+        # Marked queued before enqueueing, so a worker that starts right away is not overwritten
+        await _set_state(file_id, status="queued")
+        job_id = await _queue.enqueue(EXTRACTION_JOB, {"file_id": file_id})
+        await _set_state(file_id, job_id=job_id)
+        return job_id
+    except Exception as e:
+        logger.warning(f"Could not queue extraction of {file_id}: {str(e)}")
+        await _set_state(file_id, status="failed", error=str(e))
+        return None
+
+
+async def wait_for_content(file_id: str, timeout: float = EXTRACTION_WAIT_SECONDS, poll_interval: float = 0.25) -> str:
+    """
+    Text of an uploaded file for a section save: the stored result of its
+    extraction job, after waiting for the job if it is already running, or a
+    fresh extraction when there is no job, it is still queued (behind other
+    AI jobs, possibly for minutes) or it did not finish within `timeout` seconds.
+    """
+    file_id = os.path.basename(file_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    waited = False
+    try:
+        while True:
+            ref = await blob_store.get_ref(file_id)
+            state = (ref or {}).get("extraction") or {}
+            remaining = deadline - loop.time()
+            if state.get("status") != "running" or remaining <= 0:
+                break
+            waited = True
+            # Jobs running here wake us directly; jobs claimed by another process are polled
+            event = _waiters.setdefault(file_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(poll_interval, remaining))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        # Only the process running the job wakes (and removes) its entry
+        _waiters.pop(file_id, None)
+
+    status = state.get("status")
+    if status == "succeeded":
+        # The job cached every page, so this only reads them back
+        if waited:
+            logger.info(f"Waited for extraction job {state.get('job_id')} of {file_id}")
+        return await extract_content(file_id)
+    if status == "running":
+        logger.warning(f"Extraction job {state.get('job_id')} for {file_id} still running after {timeout}s, extracting inline")
+    elif status == "queued":
+        logger.info(f"Extraction job {state.get('job_id')} for {file_id} not started yet, extracting inline")
+    content = await extract_content(file_id)
+    await _observe_editable(file_id, "inline")
+    return content
@@ -1,10 +1,16 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
+from pymongo import monitoring
+from pymongo.compression_support import validate_compressors
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
 import os
 import certifi
 import logging
+import warnings
 from logging.handlers import RotatingFileHandler
 
+from api.services.metrics import REGISTRY
+
 # Configure logging with rotation
 log_dir = os.path.join(os.path.dirname(__file__), "logs")
 os.makedirs(log_dir, exist_ok=True)
@@ -29,6 +35,18 @@ MONGODB_URI = os.getenv("MONGODB_URI")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "fignos")
 RAG_DB_NAME = os.getenv("RAG_DB_NAME", "fda_510k_index")
 RAG_COLLECTION = os.getenv("RAG_COLLECTION", "documents")
+# Atlas needs TLS; set MONGODB_TLS=false for a local mongod (e.g. the load-test suite)
+MONGODB_TLS = os.getenv("MONGODB_TLS", "true").lower() == "true"
+# This client is the process's only connection pool; everything else imports it
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+# Wire compression, in order of preference; codecs whose package is not installed are skipped
+MONGODB_COMPRESSORS = os.getenv("MONGODB_COMPRESSORS", "zstd,snappy,zlib")
+# Used by read_db, for routes that can tolerate slightly stale data
+MONGODB_READ_PREFERENCE = os.getenv("MONGODB_READ_PREFERENCE", "secondaryPreferred")
+MONGODB_APP_NAME = os.getenv("MONGODB_APP_NAME", "fignos-api")
 
 if not MONGODB_URI:
     logger.error("Error: MONGODB_URI not found in environment variables")
@@ -36,9 +54,123 @@ if not MONGODB_URI:
     logger.error(f"Available environment variables: {dict(os.environ)}")
     raise ValueError("MONGODB_URI not set in environment variables")
 
+mongo_pool_connections = REGISTRY.gauge("mongo_pool_connections", "Open MongoDB connections by server and state", ("address", "state"))
+mongo_pool_max_size = REGISTRY.gauge("mongo_pool_max_size", "Configured MongoDB connection pool size per server")
+mongo_pool_checkout_seconds = REGISTRY.histogram(
+    "mongo_pool_checkout_seconds",
+    "Time to check a connection out of the MongoDB pool",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+mongo_pool_checkout_failures_total = REGISTRY.counter("mongo_pool_checkout_failures_total", "Failed MongoDB connection checkouts by reason", ("reason",))
+mongo_pool_cleared_total = REGISTRY.counter("mongo_pool_cleared_total", "MongoDB pools cleared after a server error", ("address",))
+mongo_command_seconds = REGISTRY.histogram(
+    "mongo_command_seconds",
+    "Server round trip of MongoDB commands by command and collection",
+    ("command", "collection"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+mongo_command_failures_total = REGISTRY.counter("mongo_command_failures_total", "MongoDB commands that returned an error", ("command", "collection"))
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Tracks open and in-use connections per server; runs on driver threads."""
+
+    @staticmethod
+    def _address(event) -> str:
+        return f"{event.address[0]}:{event.address[1]}"
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        mongo_pool_cleared_total.inc(address=self._address(event))
+
+    def pool_closed(self, event):
+        address = self._address(event)
+        mongo_pool_connections.set(0, address=address, state="open")
+        mongo_pool_connections.set(0, address=address, state="in_use")
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc(address=self._address(event), state="open")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec(address=self._address(event), state="open")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_checkout_failures_total.inc(reason=str(event.reason))
+
+    def connection_checked_out(self, event):
+        mongo_pool_connections.inc(address=self._address(event), state="in_use")
+        if getattr(event, "duration", None) is not None:
+            mongo_pool_checkout_seconds.observe(event.duration)
+
+    def connection_checked_in(self, event):
+        mongo_pool_connections.dec(address=self._address(event), state="in_use")
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Times every MongoDB command; runs on the driver threads that Motor dispatches to."""
+
+    def __init__(self):
+        # request_id -> (command, collection); an entry lives only while its command is in flight
+        self._pending = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        # For collection commands the first field names the collection; getMore names it separately
+        collection = event.command.get("collection") if event.command_name == "getMore" else target
+        self._pending[(event.connection_id, event.request_id)] = (event.command_name, collection if isinstance(collection, str) else "")
+
+    def _finish(self, event):
+        return self._pending.pop((event.connection_id, event.request_id), (event.command_name, ""))
+
+    def succeeded(self, event):
+        command, collection = self._finish(event)
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=command, collection=collection)
+
+    def failed(self, event):
+        command, collection = self._finish(event)
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=command, collection=collection)
+        mongo_command_failures_total.inc(command=command, collection=collection)
+
+
+def _available_compressors() -> list:
+    # The driver's own check, so the list logged below is the one actually offered to the server
+    with warnings.catch_warnings(record=True) as skipped:
+        warnings.simplefilter("always")
+        compressors = validate_compressors(None, [c.strip() for c in MONGODB_COMPRESSORS.split(",") if c.strip()])
+    for warning in skipped:
+        logger.info(f"MongoDB compressor skipped: {warning.message}")
+    return compressors
+
+
 # Initialize MongoDB client
-client = AsyncIOMotorClient(MONGODB_URI, tls=True, tlsCAFile=certifi.where())
+tls_options = {"tls": True, "tlsCAFile": certifi.where()} if MONGODB_TLS else {}
+compressors = _available_compressors()
+pool_options = {
+    "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+    "minPoolSize": MONGODB_MIN_POOL_SIZE,
+    "maxIdleTimeMS": MONGODB_MAX_IDLE_TIME_MS,
+    "waitQueueTimeoutMS": MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+    "appname": MONGODB_APP_NAME,
+    "event_listeners": [PoolMetricsListener(), CommandMetricsListener()],
+}
+if compressors:
+    pool_options["compressors"] = ",".join(compressors)
+client = AsyncIOMotorClient(MONGODB_URI, **tls_options, **pool_options)
+mongo_pool_max_size.set(MONGODB_MAX_POOL_SIZE)
 db = client.get_database(MONGODB_DB_NAME)
+# Same pool, but reads may go to a secondary; only for reads that need not see this request's writes
+read_db = client.get_database(MONGODB_DB_NAME, read_preference=make_read_preference(read_pref_mode_from_name(MONGODB_READ_PREFERENCE), None))
 rag_db = client.get_database(RAG_DB_NAME)
 
 # Define collections
@@ -47,4 +179,9 @@ checklist_collection = db.checklist_prompts
 document_hub_collection = db.document_hub
 rag_collection = rag_db[RAG_COLLECTION]  # Used for both RAG documents and chat history
 
-logger.info("MongoDB client initialized with collections: submissions, checklist_prompts, document_hub, rag_collection")
\ No newline at end of file
+logger.info(f"MongoDB client initialized (pool {MONGODB_MIN_POOL_SIZE}-{MONGODB_MAX_POOL_SIZE}, compressors: {compressors or 'none'}) with collections: submissions, checklist_prompts, document_hub, rag_collection")
+
+
+def close() -> None:
+    """Close the shared client; called once, at application shutdown."""
+    client.close()
\ No newline at end of file
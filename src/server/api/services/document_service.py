@@ -1,5 +1,7 @@
 from api.models.document_hub import Document, DocumentCreate, DocumentUpdate, DocumentMetadata, UploadedBy, VersionHistory, UploadedByVersionHistory
 from api.services.db import document_hub_collection
+from api.services import blob_store
+from api.services.log_pipeline import truncated
 from fastapi import UploadFile
 from typing import Dict, List, Optional
 import logging
@@ -25,7 +27,7 @@ def clean_description(content: Optional[str], name: str) -> Optional[str]:
     cleaned_content = re.sub(pattern, "", content, flags=re.IGNORECASE).strip()
     return cleaned_content if cleaned_content else None
 
-async def upload_to_storage(file: UploadFile) -> str:
+async def upload_to_storage(file: UploadFile, document_id: Optional[str] = None) -> str:
     ext = os.path.splitext(file.filename)[1].lower()
     unique_filename = f"{uuid.uuid4()}{ext}"
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
@@ -35,18 +37,9 @@ async def upload_to_storage(file: UploadFile) -> str:
             logger.error(f"Invalid file type: {ext}")
             raise ValueError(f"Unsupported file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}")
         
-        file.file.seek(0, os.SEEK_END)
-        file_size = file.file.tell()
-        file.file.seek(0)
-        if file_size > MAX_FILE_SIZE:
-            logger.error(f"File size {file_size} exceeds limit of {MAX_FILE_SIZE} bytes")
-            raise ValueError("File size exceeds 10MB limit")
-
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
+        # The URL keeps its Uploads/ form; the bytes live in the blob store under the file name
+        await blob_store.store_upload(file, unique_filename, max_size=MAX_FILE_SIZE, owner={"documentId": document_id} if document_id else None)
+
         file_url = f"/{file_path}"
         logger.info(f"Saved file locally: {file_url}")
         return file_url
@@ -56,12 +49,8 @@ async def upload_to_storage(file: UploadFile) -> str:
 
 async def delete_from_storage(file_url: str) -> bool:
     try:
-        file_path = file_url.lstrip("/")
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logger.info(f"Deleted file: {file_path}")
-            return True
-        logger.warning(f"File not found: {file_path}")
+        await blob_store.release(os.path.basename(file_url))
+        logger.info(f"Released file: {file_url}")
         return True
     except Exception as e:
         logger.warning(f"Failed to delete file {file_url}: {str(e)}")
@@ -121,7 +110,7 @@ async def create_document(document: DocumentCreate, file: Optional[UploadFile] =
     })
 
     if file:
-        document_data["fileUrl"] = await upload_to_storage(file)
+        document_data["fileUrl"] = await upload_to_storage(file, document_id)
         document_data["fileSize"] = f"{file.size / 1024 / 1024:.1f} MB" if file.size else None
         document_data["versionHistory"] = [
             VersionHistory(
@@ -161,7 +150,7 @@ async def get_document(document_id: str) -> Optional[Document]:
             logger.warning(f"No document found for ID: {document_id}")
             return None
         document_data["id"] = document_data.pop("_id")
-        logger.info(f"Document data fetched: {document_data}")
+        logger.debug("Document data fetched: %s", truncated(document_data))
         return Document(**document_data)
     except Exception as e:
         logger.error(f"Error fetching document {document_id}: {str(e)}")
@@ -238,7 +227,7 @@ async def update_document(document_id: str, update_data: Dict, file: Optional[Up
 
         # Handle file upload and versioning
         if file:
-            update_dict["fileUrl"] = await upload_to_storage(file)
+            update_dict["fileUrl"] = await upload_to_storage(file, document_id)
             update_dict["fileSize"] = f"{file.size / 1024 / 1024:.1f} MB" if file.size else None
 # Safely clean and convert version
             raw_version = document.version or "1.0"
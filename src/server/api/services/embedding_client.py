@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import uuid
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Thin client for api.services.embedding_server. Each connection owns a shared
+# memory segment; the server writes the vectors of a reply straight into it, so
+# only a small JSON header crosses the socket. Replies too big for the segment
+# come back inline over the socket instead.
+EMBEDDING_SERVER_SOCKET = os.getenv("EMBEDDING_SERVER_SOCKET")
+EMBEDDING_CLIENT_CONNECTIONS = int(os.getenv("EMBEDDING_CLIENT_CONNECTIONS", "4"))
+# 4MB holds about 1,300 768-dimensional float32 vectors
+EMBEDDING_SHM_BYTES = int(os.getenv("EMBEDDING_SHM_BYTES", str(4 * 1024 * 1024)))
+EMBEDDING_CLIENT_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_CLIENT_TIMEOUT_SECONDS", "60"))
+
+FRAME_HEADER = struct.Struct("!I")
+
+
+class EmbeddingServerError(RuntimeError):
+    pass
+
+
+class EmbeddingRequestError(EmbeddingServerError):
+    """The server answered, but could not embed the texts; the connection stays usable."""
+
+
+def send_frame(sock: socket.socket, header: Dict[str, Any], payload: bytes = b"") -> None:
+    """Write a length-prefixed JSON header, then `payload` (whose length the header must state)."""
+    data = json.dumps(header).encode("utf-8")
+    sock.sendall(FRAME_HEADER.pack(len(data)) + data + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise EmbeddingServerError("Embedding server closed the connection")
+        received += n
+    return bytes(buf)
+
+
+def recv_frame(sock: socket.socket) -> Dict[str, Any]:
+    (size,) = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    return json.loads(_recv_exact(sock, size))
+
+
+class _Connection:
+    def __init__(self, path: str, shm_bytes: int):
+        self.shm = shared_memory.SharedMemory(name=f"emb_{uuid.uuid4().hex[:16]}", create=True, size=shm_bytes)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(EMBEDDING_CLIENT_TIMEOUT_SECONDS)
+        try:
+            self.sock.connect(path)
+            send_frame(self.sock, {"op": "hello", "shm": self.shm.name, "size": self.shm.size})
+            reply = recv_frame(self.sock)
+            if reply.get("error"):
+                raise EmbeddingServerError(reply["error"])
+            self.dimensions = reply.get("dimensions")
+        except BaseException:
+            self.close()
+            raise
+
+    def encode(self, texts: List[str], normalize: bool) -> np.ndarray:
+        send_frame(self.sock, {"op": "encode", "texts": texts, "normalize": normalize})
+        reply = recv_frame(self.sock)
+        if reply.get("error"):
+            raise EmbeddingRequestError(reply["error"])
+        shape: Tuple[int, ...] = tuple(reply["shape"])
+        if reply.get("inline"):
+            data = _recv_exact(self.sock, reply["inline"])
+            return np.frombuffer(data, dtype=np.float32).reshape(shape)
+        # The segment is rewritten by the next request on this connection, so copy out
+        return np.ndarray(shape, dtype=np.float32, buffer=self.shm.buf).copy()
+
+    def close(self) -> None:
+        try:
+            self.sock.close()
+        finally:
+            self.shm.close()
+            self.shm.unlink()
+
+
+class EmbeddingClient:
+    """
+    Stands in for a SentenceTransformer: `encode` has the same call shape and
+    return type, so code written against the model works unchanged.
+    Thread-safe; each in-flight call holds one pooled connection.
+    """
+
+    def __init__(self, path: Optional[str] = None, connections: int = EMBEDDING_CLIENT_CONNECTIONS, shm_bytes: int = EMBEDDING_SHM_BYTES):
+        self.path = path or EMBEDDING_SERVER_SOCKET
+        if not self.path:
+            raise ValueError("No embedding server socket configured (EMBEDDING_SERVER_SOCKET)")
+        self.shm_bytes = shm_bytes
+        self._idle: "queue.LifoQueue[_Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(connections)
+        self._all: List[_Connection] = []
+        self._lock = threading.Lock()
+        # Fail at startup rather than on the first request if the server is not there
+        self._release(self._acquire())
+
+    def _acquire(self) -> _Connection:
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            conn = _Connection(self.path, self.shm_bytes)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def _release(self, conn: _Connection, broken: bool = False) -> None:
+        if broken:
+            with self._lock:
+                self._all.remove(conn)
+            conn.close()
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    def encode(self, sentences: Union[str, List[str]], normalize_embeddings: bool = False, convert_to_tensor: bool = False, **kwargs) -> np.ndarray:
+        """
+        :param sentences: One text or a list of texts.
+        :param normalize_embeddings: Scale vectors to unit length, as SentenceTransformer does.
+        :return: One vector for a single text, otherwise a (len(sentences), dimensions) array.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        conn = self._acquire()
+        try:
+            vectors = conn.encode(texts, normalize_embeddings)
+        except EmbeddingRequestError:
+            self._release(conn)
+            raise
+        except (OSError, EmbeddingServerError) as e:
+            # The connection may be mid-frame; drop it instead of reusing it
+            self._release(conn, broken=True)
+            if isinstance(e, EmbeddingServerError):
+                raise
+            raise EmbeddingServerError(f"Embedding server request failed: {str(e)}") from e
+        self._release(conn)
+        return vectors[0] if single else vectors
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._all = self._all, []
+        for conn in connections:
+            conn.close()
@@ -0,0 +1,208 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from api.services.embedding_client import FRAME_HEADER
+
+logger = logging.getLogger(__name__)
+
+# One process holds the embedding model for every API worker on the host:
+#   python -m api.services.embedding_server --socket /run/fignos/embedding.sock
+# and the workers run with EMBEDDING_SERVER_SOCKET pointing at the same path.
+# Requests arriving within EMBEDDING_BATCH_WAIT_MS of each other are encoded
+# in one model call, up to EMBEDDING_MAX_BATCH texts.
+MODEL_NAME = os.getenv("MODEL_NAME", "nomic-ai/nomic-embed-text-v1")
+EMBEDDING_SERVER_SOCKET = os.getenv("EMBEDDING_SERVER_SOCKET", "/tmp/fignos-embedding.sock")
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+
+Encoder = Callable[[List[str], bool], np.ndarray]
+
+
+@dataclass
+class _Request:
+    texts: List[str]
+    normalize: bool
+    future: asyncio.Future = field(default=None)
+
+
+class EmbeddingServer:
+    """
+    Serves `encode` to local clients over a Unix socket, batching concurrent
+    requests into single model calls and writing vectors into each client's
+    shared memory segment.
+    """
+
+    def __init__(self, encoder: Encoder, path: str = EMBEDDING_SERVER_SOCKET, max_batch: int = EMBEDDING_MAX_BATCH, batch_wait_ms: float = EMBEDDING_BATCH_WAIT_MS):
+        self.encoder = encoder
+        self.path = path
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait_ms / 1000
+        self.dimensions: Optional[int] = None
+        self.stats = {"requests": 0, "texts": 0, "batches": 0, "encode_seconds": 0.0}
+        self._queue: "asyncio.Queue[_Request]" = asyncio.Queue()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._batcher: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if os.path.exists(self.path):
+            # Left behind by a server that did not shut down cleanly
+            os.unlink(self.path)
+        self._batcher = asyncio.create_task(self._batch_loop())
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o660)
+        logger.info(f"Embedding server listening on {self.path}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._batcher is not None:
+            self._batcher.cancel()
+            await asyncio.gather(self._batcher, return_exceptions=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _next_batch(self) -> List[_Request]:
+        batch = [await self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.batch_wait
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    async def _batch_loop(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            for normalize in (False, True):
+                group = [r for r in batch if r.normalize == normalize and not r.future.done()]
+                if not group:
+                    continue
+                texts = [text for r in group for text in r.texts]
+                started = time.perf_counter()
+                try:
+                    vectors = np.asarray(await asyncio.to_thread(self.encoder, texts, normalize), dtype=np.float32)
+                except Exception as e:
+                    logger.error(f"Embedding {len(texts)} texts failed: {str(e)}")
+                    for r in group:
+                        r.future.set_exception(e)
+                    continue
+                self.stats["batches"] += 1
+                self.stats["texts"] += len(texts)
+                self.stats["encode_seconds"] += time.perf_counter() - started
+                self.dimensions = vectors.shape[1]
+                offset = 0
+                for r in group:
+                    if not r.future.done():
+                        r.future.set_result(vectors[offset:offset + len(r.texts)])
+                    offset += len(r.texts)
+
+    async def encode(self, texts: List[str], normalize: bool) -> np.ndarray:
+        request = _Request(texts, normalize, asyncio.get_running_loop().create_future())
+        self.stats["requests"] += 1
+        await self._queue.put(request)
+        return await request.future
+
+    @staticmethod
+    async def _read(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+        try:
+            (size,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+            return json.loads(await reader.readexactly(size))
+        except asyncio.IncompleteReadError:
+            return None
+
+    @staticmethod
+    def _write(writer: asyncio.StreamWriter, header: Dict[str, Any], payload: bytes = b"") -> None:
+        data = json.dumps(header).encode("utf-8")
+        writer.write(FRAME_HEADER.pack(len(data)) + data + payload)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        shm: Optional[shared_memory.SharedMemory] = None
+        try:
+            hello = await self._read(reader)
+            if not hello or hello.get("op") != "hello":
+                return
+            try:
+                shm = shared_memory.SharedMemory(name=hello["shm"])
+                # The client created the segment and unlinks it; without this the
+                # resource tracker would unlink it when this process exits
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except (FileNotFoundError, KeyError) as e:
+                self._write(writer, {"error": f"Cannot attach shared memory: {str(e)}"})
+                return
+            self._write(writer, {"ok": True, "dimensions": self.dimensions})
+            await writer.drain()
+            while True:
+                message = await self._read(reader)
+                if message is None:
+                    break
+                try:
+                    vectors = await self.encode([str(t) for t in message["texts"]], bool(message.get("normalize")))
+                except Exception as e:
+                    self._write(writer, {"error": str(e)})
+                else:
+                    if vectors.nbytes <= shm.size:
+                        np.ndarray(vectors.shape, dtype=np.float32, buffer=shm.buf)[...] = vectors
+                        self._write(writer, {"shape": list(vectors.shape)})
+                    else:
+                        self._write(writer, {"shape": list(vectors.shape), "inline": vectors.nbytes}, vectors.tobytes())
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            if shm is not None:
+                shm.close()
+            writer.close()
+
+
+def load_encoder(model_name: str = MODEL_NAME) -> Encoder:
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, trust_remote_code=True)
+    return lambda texts, normalize: model.encode(texts, normalize_embeddings=normalize, convert_to_numpy=True)
+
+
+async def _main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve sentence embeddings to the API workers on this host")
+    parser.add_argument("--socket", default=EMBEDDING_SERVER_SOCKET, help="Unix socket path")
+    parser.add_argument("--model", default=MODEL_NAME, help="SentenceTransformer model name")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    encoder = await asyncio.to_thread(load_encoder, args.model)
+    logger.info(f"Loaded {args.model} in {time.perf_counter() - started:.1f}s")
+    server = EmbeddingServer(encoder, path=args.socket)
+    await server.start()
+    try:
+        while True:
+            await asyncio.sleep(60)
+            if server.stats["batches"]:
+                logger.info(
+                    f"Embedded {server.stats['texts']} texts for {server.stats['requests']} requests in "
+                    f"{server.stats['batches']} batches ({server.stats['encode_seconds']:.1f}s encoding)"
+                )
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        logger.info("Embedding server stopped")
@@ -0,0 +1,91 @@
+import time
+from typing import Any, List, Union
+
+from api.services.metrics import REGISTRY
+
+# Request and embedding timings for /metrics. The middleware is plain ASGI
+# rather than BaseHTTPMiddleware, so it adds two clock reads per request and
+# does not buffer streamed responses.
+
+# Requests that matched no route share one label, so unknown paths cannot grow the label set
+UNMATCHED_ROUTE = "<unmatched>"
+
+http_requests_total = REGISTRY.counter("http_requests_total", "HTTP requests by route template and status code", ("method", "route", "status"))
+http_request_duration_seconds = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response",
+    ("method", "route"),
+)
+http_requests_in_flight = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being handled")
+
+embedding_encode_seconds = REGISTRY.histogram("embedding_encode_seconds", "Time spent in one embedding encode call", ("backend",))
+embedding_batch_size = REGISTRY.histogram(
+    "embedding_batch_size",
+    "Texts per embedding encode call",
+    ("backend",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+embedding_encode_failures_total = REGISTRY.counter("embedding_encode_failures_total", "Embedding encode calls that raised", ("backend",))
+
+
+class RequestMetricsMiddleware:
+    """
+    Records latency, status and in-flight count for every HTTP request,
+    labelled by the route template (`/api/submissions/{submission_id}`) rather
+    than the raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            # The router records the matched route in the shared scope
+            route = scope.get("route")
+            template = getattr(route, "path", None) or UNMATCHED_ROUTE
+            method = scope["method"]
+            http_request_duration_seconds.observe(time.perf_counter() - started, method=method, route=template)
+            http_requests_total.inc(method=method, route=template, status=str(status))
+
+
+class TimedEncoder:
+    """
+    Wraps an embedding model (a SentenceTransformer or an EmbeddingClient) to
+    record each `encode` call; every other attribute is the wrapped model's.
+    """
+
+    def __init__(self, model: Any, backend: str):
+        self.model = model
+        self.backend = backend
+
+    def encode(self, sentences: Union[str, List[str]], *args, **kwargs):
+        size = 1 if isinstance(sentences, str) else len(sentences)
+        started = time.perf_counter()
+        try:
+            result = self.model.encode(sentences, *args, **kwargs)
+        except Exception:
+            embedding_encode_failures_total.inc(backend=self.backend)
+            raise
+        embedding_encode_seconds.observe(time.perf_counter() - started, backend=self.backend)
+        embedding_batch_size.observe(size, backend=self.backend)
+        return result
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.model, name)
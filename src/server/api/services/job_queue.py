@@ -0,0 +1,318 @@
+import asyncio
+import datetime
+import logging
+import os
+import socket
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+from api.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Jobs live in Mongo so any API or worker process can claim them. A claim is a
+# lease: the worker heartbeats it while running, and if the process dies the
+# lease expires and another worker picks the job up again.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+TERMINAL_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED)
+
+jobs_total = REGISTRY.counter("ai_jobs_total", "AI jobs by type and final status", ("type", "status"))
+jobs_running = REGISTRY.gauge("ai_jobs_running", "AI jobs currently executing in this process", ("type",))
+job_duration_seconds = REGISTRY.histogram("ai_job_duration_seconds", "Wall-clock time of AI job attempts", ("type",))
+job_queue_wait_seconds = REGISTRY.histogram("ai_job_queue_wait_seconds", "Time from enqueue to first claim", ("type",))
+
+ProgressFn = Callable[..., Awaitable[None]]
+JobHandler = Callable[[Dict[str, Any], ProgressFn], Awaitable[Any]]
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _iso(value: Optional[datetime.datetime]) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+class JobQueue:
+    def __init__(self, collection, lease_seconds: float = JOB_LEASE_SECONDS, poll_interval: float = JOB_POLL_INTERVAL):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.handlers: Dict[str, JobHandler] = {}
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._last_sweep = 0.0
+
+    def handler(self, job_type: str):
+        """Decorator registering the coroutine that executes jobs of `job_type`."""
+        def register(fn: JobHandler) -> JobHandler:
+            self.handlers[job_type] = fn
+            return fn
+        return register
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index([("status", 1), ("type", 1), ("created_at", 1)])
+        await self.collection.create_index([("status", 1), ("lease_expires_at", 1)])
+        # Finished jobs expire on their own after the retention window
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def enqueue(self, job_type: str, payload: Dict[str, Any], max_attempts: int = JOB_MAX_ATTEMPTS) -> str:
+        if job_type not in self.handlers:
+            raise ValueError(f"No handler registered for job type {job_type}")
+        job_id = uuid.uuid4().hex
+        now = _now()
+        await self.collection.insert_one({
+            "_id": job_id,
+            "type": job_type,
+            "payload": payload,
+            "status": STATUS_QUEUED,
+            "stage": STATUS_QUEUED,
+            "events": [{"stage": STATUS_QUEUED, "at": now.isoformat(), "data": {}}],
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "result": None,
+            "error": None,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "created_at": now,
+            "updated_at": now,
+        })
+        logger.info(f"Enqueued {job_type} job {job_id}")
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self.collection.find_one({"_id": job_id})
+        return self.serialize(job) if job else None
+
+    @staticmethod
+    def serialize(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "job_id": job["_id"],
+            "type": job["type"],
+            "status": job["status"],
+            "stage": job.get("stage"),
+            "attempts": job.get("attempts", 0),
+            "result": job.get("result"),
+            "error": job.get("error"),
+            "events": job.get("events", []),
+            "created_at": _iso(job.get("created_at")),
+            "updated_at": _iso(job.get("updated_at")),
+            "finished_at": _iso(job.get("finished_at")),
+        }
+
+    async def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        now = _now()
+        return await self.collection.find_one_and_update(
+            {
+                "type": {"$in": list(self.handlers)},
+                "$or": [
+                    {"status": STATUS_QUEUED},
+                    # A running job whose lease lapsed belongs to a dead worker; once it has
+                    # used up its attempts it is not retried (see fail_abandoned)
+                    {
+                        "status": STATUS_RUNNING,
+                        "lease_expires_at": {"$lt": now},
+                        "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+                    },
+                ],
+            },
+            {
+                "$set": {
+                    "status": STATUS_RUNNING,
+                    "lease_owner": worker_id,
+                    "lease_expires_at": now + datetime.timedelta(seconds=self.lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def fail_abandoned(self) -> int:
+        """
+        Fail running jobs whose lease lapsed on their last attempt. A job that kills its
+        worker (out of memory, a crash in a parser) would otherwise take down every
+        worker that claimed it.
+
+        :return: Number of jobs failed.
+        """
+        now = _now()
+        abandoned = {
+            "type": {"$in": list(self.handlers)},
+            "status": STATUS_RUNNING,
+            "lease_expires_at": {"$lt": now},
+            "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+        }
+        failed = 0
+        async for job in self.collection.find(abandoned, {"type": 1, "attempts": 1}):
+            error = {"status": 500, "detail": f"Worker stopped responding on all {job['attempts']} attempts"}
+            result = await self.collection.update_one({**abandoned, "_id": job["_id"]}, {
+                "$set": {
+                    "status": STATUS_FAILED,
+                    "stage": STATUS_FAILED,
+                    "error": error,
+                    "lease_owner": None,
+                    "lease_expires_at": None,
+                    "updated_at": now,
+                    "finished_at": now,
+                    "expires_at": now + datetime.timedelta(days=JOB_RETENTION_DAYS),
+                },
+                "$push": {"events": {"stage": STATUS_FAILED, "at": now.isoformat(), "data": {"error": error}}},
+            })
+            if result.modified_count:
+                failed += 1
+                jobs_total.inc(type=job["type"], status=STATUS_FAILED)
+                logger.error(f"{job['type']} job {job['_id']} failed: {error['detail']}")
+        return failed
+
+    async def _update_owned(self, job_id: str, worker_id: str, update: Dict[str, Any]) -> bool:
+        # Every write is conditional on still holding the lease
+        result = await self.collection.update_one({"_id": job_id, "lease_owner": worker_id}, update)
+        return result.matched_count == 1
+
+    async def _heartbeat(self, job_id: str, worker_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            now = _now()
+            renewed = await self._update_owned(job_id, worker_id, {
+                "$set": {"lease_expires_at": now + datetime.timedelta(seconds=self.lease_seconds), "updated_at": now}
+            })
+            if not renewed:
+                logger.warning(f"Worker {worker_id} lost the lease on job {job_id}")
+                return
+
+    def _progress_fn(self, job_id: str, worker_id: str) -> ProgressFn:
+        async def progress(stage: str, **data) -> None:
+            now = _now()
+            await self._update_owned(job_id, worker_id, {
+                "$set": {"stage": stage, "updated_at": now},
+                "$push": {"events": {"stage": stage, "at": now.isoformat(), "data": data}},
+            })
+        return progress
+
+    async def _execute(self, job: Dict[str, Any], worker_id: str) -> None:
+        job_id, job_type = job["_id"], job["type"]
+        if job["attempts"] == 1:
+            job_queue_wait_seconds.observe((_now() - job["created_at"].replace(tzinfo=datetime.timezone.utc)).total_seconds(), type=job_type)
+        logger.info(f"Worker {worker_id} running {job_type} job {job_id} (attempt {job['attempts']}/{job['max_attempts']})")
+        progress = self._progress_fn(job_id, worker_id)
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, worker_id))
+        jobs_running.inc(type=job_type)
+        started = asyncio.get_running_loop().time()
+        try:
+            await progress(STATUS_RUNNING, attempt=job["attempts"])
+            result = await self.handlers[job_type](job["payload"], progress)
+        except Exception as e:
+            # Client errors will fail the same way again; anything else is retried while attempts remain
+            if isinstance(e, HTTPException):
+                error = {"status": e.status_code, "detail": e.detail}
+                retryable = e.status_code >= 500 or e.status_code == 429
+            else:
+                error = {"status": 500, "detail": str(e)}
+                retryable = True
+            final = not retryable or job["attempts"] >= job["max_attempts"]
+            now = _now()
+            status = STATUS_FAILED if final else STATUS_QUEUED
+            update = {
+                "$set": {"status": status, "stage": status, "error": error, "lease_owner": None, "lease_expires_at": None, "updated_at": now},
+                "$push": {"events": {"stage": status, "at": now.isoformat(), "data": {"error": error}}},
+            }
+            if final:
+                update["$set"].update({"finished_at": now, "expires_at": now + datetime.timedelta(days=JOB_RETENTION_DAYS)})
+                jobs_total.inc(type=job_type, status=STATUS_FAILED)
+            await self._update_owned(job_id, worker_id, update)
+            logger.error(f"{job_type} job {job_id} failed on attempt {job['attempts']}: {error['detail']}{'' if final else ', requeued'}")
+        else:
+            now = _now()
+            await self._update_owned(job_id, worker_id, {
+                "$set": {
+                    "status": STATUS_SUCCEEDED,
+                    "stage": STATUS_SUCCEEDED,
+                    "result": result,
+                    "error": None,
+                    "lease_owner": None,
+                    "lease_expires_at": None,
+                    "updated_at": now,
+                    "finished_at": now,
+                    "expires_at": now + datetime.timedelta(days=JOB_RETENTION_DAYS),
+                },
+                "$push": {"events": {"stage": STATUS_SUCCEEDED, "at": now.isoformat(), "data": {}}},
+            })
+            jobs_total.inc(type=job_type, status=STATUS_SUCCEEDED)
+            logger.info(f"{job_type} job {job_id} succeeded")
+        finally:
+            heartbeat.cancel()
+            jobs_running.dec(type=job_type)
+            job_duration_seconds.observe(asyncio.get_running_loop().time() - started, type=job_type)
+
+    async def _worker(self, worker_id: str) -> None:
+        logger.info(f"Job worker {worker_id} started")
+        while not self._stopping:
+            loop_time = asyncio.get_running_loop().time()
+            if loop_time - self._last_sweep >= self.lease_seconds:
+                # Once per lease period per process is enough; the sweep is idempotent
+                self._last_sweep = loop_time
+                try:
+                    await self.fail_abandoned()
+                except Exception as e:
+                    logger.error(f"Job worker {worker_id} could not sweep abandoned jobs: {str(e)}")
+            try:
+                job = await self.claim(worker_id)
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} could not claim work: {str(e)}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    # Local enqueues wake us immediately; jobs from other processes are found by polling
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job, worker_id)
+
+    def start(self, workers: int) -> None:
+        self._stopping = False
+        for i in range(workers):
+            worker_id = f"{self.worker_prefix}:{i}:{uuid.uuid4().hex[:6]}"
+            self._workers.append(asyncio.create_task(self._worker(worker_id)))
+        if workers:
+            logger.info(f"Started {workers} job workers for {sorted(self.handlers)}")
+
+    async def stop(self) -> None:
+        # Running jobs are abandoned; their leases lapse and another worker resumes them
+        self._stopping = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def events(self, job_id: str, poll_interval: float = 0.5):
+        """Yields (stage, data, job) for each new progress event until the job finishes."""
+        seen = 0
+        while True:
+            job = await self.collection.find_one({"_id": job_id})
+            if job is None:
+                return
+            events = job.get("events", [])
+            for event in events[seen:]:
+                yield event["stage"], event.get("data", {}), job
+            seen = len(events)
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(poll_interval)
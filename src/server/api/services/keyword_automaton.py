@@ -0,0 +1,75 @@
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+Phrase = Tuple[str, ...]
+Span = Tuple[int, int]
+
+
+class KeywordAutomaton:
+    """
+    Aho–Corasick automaton over token sequences.
+
+    Built once from every keyword phrase (as token tuples), it finds all
+    occurrences of all phrases, overlapping ones included, in a single pass
+    over the text's tokens, whatever the number of phrases.
+
+    Example:
+        automaton = KeywordAutomaton([("risk",), ("residual", "risk")])
+        automaton.scan([("residual", 0, 8), ("risk", 9, 14)])
+        # {("residual", "risk"): [(0, 14)], ("risk",): [(9, 14)]}
+    """
+
+    def __init__(self, phrases: Iterable[Phrase]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Phrase]] = [[]]
+        self.phrases: List[Phrase] = []
+        for phrase in phrases:
+            self._add(tuple(phrase))
+        self._link()
+
+    def _add(self, phrase: Phrase) -> None:
+        if not phrase or phrase in self.phrases:
+            return
+        self.phrases.append(phrase)
+        node = 0
+        for token in phrase:
+            if token not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][token] = len(self._goto) - 1
+            node = self._goto[node][token]
+        self._output[node].append(phrase)
+
+    def _link(self) -> None:
+        # Breadth-first, so a node's failure target is always linked before the node itself
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(token, 0)
+                # Phrases ending at the failure target also end here ("residual risk" contains "risk")
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def scan(self, tokens: Sequence[Tuple[str, int, int]]) -> Dict[Phrase, List[Span]]:
+        """
+        Find every phrase occurrence.
+
+        :param tokens: (token, start, end) triples in text order, with character offsets into the text.
+        :return: Character spans of each phrase that occurs at least once.
+        """
+        hits: Dict[Phrase, List[Span]] = defaultdict(list)
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for i, (token, _, end) in enumerate(tokens):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            for phrase in output[state]:
+                hits[phrase].append((tokens[i - len(phrase) + 1][1], end))
+        return dict(hits)
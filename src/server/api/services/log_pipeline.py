@@ -0,0 +1,259 @@
+import logging
+import os
+import queue
+import random
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.services.metrics import REGISTRY
+
+# Handlers do their I/O (and message formatting) on one writer thread; the
+# handlers that modules attach are swapped for stand-ins that only queue the
+# record, so logging from a request adds a queue put, not a file write.
+#
+#   LOG_LEVEL              root level (default INFO)
+#   LOG_LEVELS             per-logger levels, e.g. "api.ai.engines.validation=DEBUG,aiohttp=WARNING"
+#   LOG_SAMPLING           keep this share of a logger's DEBUG/INFO records, e.g. "ApplicationLogger=0.1";
+#                          warnings and errors are always kept
+#   LOG_MAX_MESSAGE_CHARS  longer messages are truncated when written
+#   LOG_QUEUE_SIZE         records waiting for the writer; beyond it DEBUG/INFO records are dropped
+#                          and warnings and errors are written by the logging thread itself
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "4000"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Default size for truncated() when a call site does not pass one
+LOG_MAX_OBJECT_CHARS = int(os.getenv("LOG_MAX_OBJECT_CHARS", "1000"))
+
+log_records_dropped_total = REGISTRY.counter("log_records_dropped_total", "Log records not written, by reason", ("reason",))
+
+_REDACTIONS = [
+    # Credentials in connection strings
+    (re.compile(r"(mongodb(?:\+srv)?://)[^:/@\s]+:[^@\s]+@"), r"\1***:***@"),
+    # Provider API keys
+    (re.compile(r"\b(gsk_|sk-)[A-Za-z0-9_\-]{8,}"), r"\1***"),
+    (re.compile(r"(?i)\b(api[_-]?key|access[_-]?token|token|password|secret|authorization)(['\"]?\s*[:=]\s*['\"]?)(bearer\s+)?[^\s'\",&]+"), r"\1\2\3***"),
+]
+
+
+def _parse_pairs(spec: str) -> List[Tuple[str, str]]:
+    pairs = []
+    for part in spec.split(","):
+        name, sep, value = part.partition("=")
+        if sep and name.strip():
+            pairs.append((name.strip(), value.strip()))
+    return pairs
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class truncated:
+    """
+    Wraps a log argument so it is rendered, and cut to `limit` characters, only
+    when the record is written, on the writer thread:
+
+        logger.info("Document data fetched: %s", truncated(document_data))
+
+    The wrapped object is read then, not when logging is called, so do not
+    pass objects the caller goes on to mutate.
+    """
+
+    __slots__ = ("obj", "limit")
+
+    def __init__(self, obj: Any, limit: Optional[int] = None):
+        self.obj = obj
+        self.limit = limit or LOG_MAX_OBJECT_CHARS
+
+    def __str__(self) -> str:
+        text = str(self.obj)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... [{len(text) - self.limit} more chars]"
+
+    __repr__ = __str__
+
+
+class SafeFormatter(logging.Formatter):
+    """
+    Wraps a handler's own formatter: the message is capped at
+    LOG_MAX_MESSAGE_CHARS before it is formatted (tracebacks are kept whole)
+    and secrets are redacted from the output.
+    """
+
+    def __init__(self, inner: Optional[logging.Formatter] = None):
+        super().__init__()
+        self.inner = inner or logging.Formatter()
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if len(message) > LOG_MAX_MESSAGE_CHARS:
+            # Rewriting is idempotent, so a record formatted for two handlers gets the same text
+            record.msg = f"{message[:LOG_MAX_MESSAGE_CHARS]}... [{len(message) - LOG_MAX_MESSAGE_CHARS} more chars]"
+            record.args = None
+        return redact(self.inner.format(record))
+
+
+class _SamplingFilter(logging.Filter):
+    """Decides once per record, so every handler that sees it agrees."""
+
+    def __init__(self, rates: List[Tuple[str, float]]):
+        super().__init__()
+        # Longest prefix first, so "api.ai" can be sampled differently from "api"
+        self.rates = sorted(rates, key=lambda item: len(item[0]), reverse=True)
+
+    def _rate(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        keep = getattr(record, "_log_sampled", None)
+        if keep is None:
+            keep = record.levelno >= logging.WARNING or random.random() < self._rate(record.name)
+            record._log_sampled = keep
+            if not keep:
+                log_records_dropped_total.inc(reason="sampled")
+        return keep
+
+
+_queue: "queue.Queue[Optional[Tuple[logging.Handler, logging.LogRecord]]]" = queue.Queue(LOG_QUEUE_SIZE)
+_writer: Optional[threading.Thread] = None
+_targets: List[logging.Handler] = []
+_lock = threading.Lock()
+
+
+class _QueuedHandler(logging.Handler):
+    """Takes the place of `target` on a logger; `target` handles the record on the writer thread."""
+
+    def __init__(self, target: logging.Handler, sampling: Optional[_SamplingFilter]):
+        super().__init__(target.level)
+        self.target = target
+        if sampling is not None:
+            self.addFilter(sampling)
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # No handler lock: the queue is the only shared state
+        if not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        writer = _writer
+        if writer is None or not writer.is_alive():
+            # Nothing would drain the queue
+            self.target.handle(record)
+            return
+        try:
+            _queue.put_nowait((self.target, record))
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                log_records_dropped_total.inc(reason="queue_full")
+                return
+            # Warnings and errors are written here rather than lost or left waiting for the writer
+            self.target.handle(record)
+
+
+def _write_loop() -> None:
+    while True:
+        item = _queue.get()
+        if item is None:
+            return
+        target, record = item
+        try:
+            target.handle(record)
+        except Exception:
+            target.handleError(record)
+
+
+def _swap_handlers(logger: logging.Logger, sampling: Optional[_SamplingFilter]) -> None:
+    for handler in list(logger.handlers):
+        if isinstance(handler, _QueuedHandler):
+            continue
+        if not isinstance(handler.formatter, SafeFormatter):
+            handler.setFormatter(SafeFormatter(handler.formatter))
+        logger.removeHandler(handler)
+        logger.addHandler(_QueuedHandler(handler, sampling))
+        _targets.append(handler)
+
+
+def _restore_handlers() -> None:
+    loggers = [logging.getLogger(), *(lg for lg in logging.Logger.manager.loggerDict.values() if isinstance(lg, logging.Logger))]
+    for logger in loggers:
+        for handler in list(logger.handlers):
+            if isinstance(handler, _QueuedHandler):
+                logger.removeHandler(handler)
+                logger.addHandler(handler.target)
+
+
+def _after_fork_in_child() -> None:
+    # Forked children (the extraction process pool) get no writer thread; they
+    # write through the original handlers and start with an empty queue
+    global _queue, _writer, _lock
+    _queue = queue.Queue(LOG_QUEUE_SIZE)
+    _writer = None
+    _lock = threading.Lock()
+    _restore_handlers()
+    _targets.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def configure_logging() -> None:
+    """
+    Move every handler attached so far onto the writer thread and apply the
+    LOG_* settings. Call once all modules are imported; calling again picks
+    up handlers added since.
+    """
+    global _writer
+    with _lock:
+        root = logging.getLogger()
+        if not root.handlers:
+            logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        root.setLevel(LOG_LEVEL)
+        for name, level in _parse_pairs(LOG_LEVELS):
+            logging.getLogger(name).setLevel(level.upper())
+        rates = []
+        for name, rate in _parse_pairs(LOG_SAMPLING):
+            try:
+                rates.append((name, min(max(float(rate), 0.0), 1.0)))
+            except ValueError:
+                logging.getLogger(__name__).warning(f"Ignoring LOG_SAMPLING entry {name}={rate}")
+        sampling = _SamplingFilter(rates) if rates else None
+
+        _swap_handlers(root, sampling)
+        for logger in list(logging.Logger.manager.loggerDict.values()):
+            if isinstance(logger, logging.Logger):
+                _swap_handlers(logger, sampling)
+
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name="log-writer", daemon=True)
+            _writer.start()
+
+
+def shutdown_logging(timeout: float = 5.0) -> None:
+    """Write out what is queued and stop the writer; later records are written synchronously."""
+    global _writer
+    with _lock:
+        if _writer is None:
+            return
+        _queue.put(None)
+        _writer.join(timeout)
+        _writer = None
+        _restore_handlers()
+        for target in _targets:
+            target.flush()
+        _targets.clear()
+
+
+def stats() -> Dict[str, Any]:
+    return {"queued": _queue.qsize(), "capacity": LOG_QUEUE_SIZE, "dropped": {key[0]: value for key, value in log_records_dropped_total.values().items()}}
@@ -0,0 +1,366 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import re
+import time
+import zipfile
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import aiohttp
+import numpy as np
+from pymongo import DESCENDING, TEXT, UpdateOne
+
+from api.services.db import db, read_db
+from api.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# A local copy of the openFDA 510(k) clearances, so predicate search covers every
+# clearance under a product code instead of the first 25 the live API returns.
+# Seed it from the bulk download (https://open.fda.gov/data/downloads/, device/510k)
+# with `python -m api.services.predicate_index load device-510k-0001-of-0001.json.zip`;
+# afterwards it is kept current from the API by decision date. `... embed` stores
+# device-name embeddings that the predicate ranker blends into its scores.
+FDA_510K_URL = os.getenv("FDA_510K_URL", "https://api.fda.gov/device/510k.json")
+FDA_API_KEY = os.getenv("FDA_API_KEY")
+PREDICATE_REFRESH_HOURS = float(os.getenv("PREDICATE_REFRESH_HOURS", "24"))
+# Candidates handed to the ranker; a product code rarely has more clearances than this
+PREDICATE_CANDIDATES = int(os.getenv("PREDICATE_CANDIDATES", "2000"))
+# Name embeddings are kept in memory as one float32 matrix per product code, so
+# ranking does not pull them from Mongo per request. Bounded by total rows
+# (768-dimensional rows are 3KB each), least recently used codes go first.
+PREDICATE_VECTOR_CACHE_ROWS = int(os.getenv("PREDICATE_VECTOR_CACHE_ROWS", "50000"))
+# Other processes' refresh/embed runs are picked up after this long
+PREDICATE_VECTOR_CACHE_SECONDS = float(os.getenv("PREDICATE_VECTOR_CACHE_SECONDS", "3600"))
+BULK_BATCH_SIZE = 1000
+EMBED_BATCH_SIZE = 256
+# openFDA refuses skip values past this, so longer refreshes restart the window at the last date seen
+OPENFDA_MAX_SKIP = 25000
+OPENFDA_PAGE_SIZE = 1000
+
+collection = db.fda_510k
+# Searches tolerate replication lag; writes and the refresh watermark use the primary
+read_collection = read_db.fda_510k
+
+predicate_index_records_total = REGISTRY.counter("predicate_index_records_total", "510(k) records written to the local index", ("source",))
+predicate_index_search_seconds = REGISTRY.histogram(
+    "predicate_index_search_seconds",
+    "Latency of local predicate index searches",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+
+_REGULATION_RE = re.compile(r"^\d{3}\.\d{4}$")
+_K_NUMBER_RE = re.compile(r"^K\d{6}$")
+
+_refresh_task: Optional[asyncio.Task] = None
+# product code -> (loaded at, K number -> row, matrix)
+_vector_cache: "OrderedDict[str, Tuple[float, Dict[str, int], np.ndarray]]" = OrderedDict()
+_vector_cache_rows = 0
+_vector_locks: Dict[str, asyncio.Lock] = {}
+
+
+async def ensure_indexes() -> None:
+    await collection.create_index([("product_code", 1), ("decision_date", DESCENDING)])
+    await collection.create_index("applicant")
+    await collection.create_index([("decision_date", DESCENDING)])
+    await collection.create_index([("device_name", TEXT)], default_language="english")
+
+
+def normalize_record(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Map an openFDA 510(k) result to an index document; None when it has no usable K number."""
+    k_number = str(item.get("k_number") or "").strip().upper()
+    if not _K_NUMBER_RE.match(k_number):
+        return None
+    openfda = item.get("openfda") or {}
+    regulation_number = openfda.get("regulation_number") or item.get("regulation_number")
+    if isinstance(regulation_number, list):
+        regulation_number = regulation_number[0] if regulation_number else None
+    if regulation_number:
+        regulation_number = re.sub(r"21 CFR\s*", "", str(regulation_number)).strip()
+        if not _REGULATION_RE.match(regulation_number):
+            regulation_number = None
+    return {
+        "_id": k_number,
+        "k_number": k_number,
+        "device_name": item.get("device_name") or "Unknown Device",
+        "applicant": item.get("applicant") or "Unknown Manufacturer",
+        "product_code": (item.get("product_code") or "").strip().upper(),
+        # openFDA dates are YYYY-MM-DD, so they also sort correctly as strings
+        "decision_date": item.get("decision_date") or "",
+        "decision_description": item.get("decision_description"),
+        "clearance_type": item.get("clearance_type"),
+        "regulation_number": regulation_number,
+        "device_class": openfda.get("device_class"),
+    }
+
+
+async def upsert_records(items: Iterable[Dict[str, Any]], source: str) -> int:
+    """Write openFDA results into the index in bulk; returns how many were written."""
+    now = datetime.datetime.utcnow()
+    operations = []
+    written = 0
+    for item in items:
+        record = normalize_record(item)
+        if record is None:
+            continue
+        record["updated_at"] = now
+        operations.append(UpdateOne({"_id": record["_id"]}, {"$set": record}, upsert=True))
+        if len(operations) >= BULK_BATCH_SIZE:
+            await collection.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+        written += len(operations)
+    predicate_index_records_total.inc(written, source=source)
+    return written
+
+
+def read_openfda_bulk_file(path: str) -> List[Dict[str, Any]]:
+    """Results of an openFDA bulk download, zipped or not."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            results = []
+            for name in archive.namelist():
+                if name.endswith(".json"):
+                    with archive.open(name) as f:
+                        results.extend(json.load(f).get("results", []))
+            return results
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("results", [])
+
+
+async def load_bulk_file(path: str) -> int:
+    """
+    Load an openFDA 510(k) bulk download (the .json.zip, or the .json inside it).
+
+    :param path: Path of the download.
+    :return: Number of records written.
+    """
+    logger.info(f"Loading 510(k) bulk file {path}")
+    started = time.perf_counter()
+    results = await asyncio.to_thread(read_openfda_bulk_file, path)
+    await ensure_indexes()
+    written = await upsert_records(results, source="bulk")
+    logger.info(f"Loaded {written} of {len(results)} 510(k) records from {path} in {time.perf_counter() - started:.1f}s")
+    return written
+
+
+async def watermark() -> Optional[str]:
+    """Latest decision date in the index."""
+    latest = await collection.find_one({"decision_date": {"$ne": ""}}, {"decision_date": 1}, sort=[("decision_date", DESCENDING)])
+    return latest["decision_date"] if latest else None
+
+
+async def refresh(since: Optional[str] = None) -> int:
+    """
+    Fetch clearances decided on or after `since` (default: the index's latest
+    decision date, so that day is re-read in case it was incomplete).
+
+    :return: Number of records written.
+    """
+    since = since or await watermark()
+    if not since:
+        logger.warning("Predicate index is empty; load a bulk file before refreshing")
+        return 0
+    until = datetime.date.today().isoformat()
+    params = {"limit": OPENFDA_PAGE_SIZE, "skip": 0, "sort": "decision_date:asc"}
+    if FDA_API_KEY:
+        params["api_key"] = FDA_API_KEY
+    lower = since
+    written = 0
+    async with aiohttp.ClientSession() as session:
+        while True:
+            params["search"] = f"decision_date:[{lower} TO {until}]"
+            async with session.get(FDA_510K_URL, params=params) as response:
+                if response.status == 404:
+                    # openFDA answers 404 when nothing matches
+                    break
+                if response.status != 200:
+                    raise RuntimeError(f"openFDA 510(k) request failed with status {response.status}: {await response.text()}")
+                results = (await response.json()).get("results", [])
+            written += await upsert_records(results, source="refresh")
+            if len(results) < OPENFDA_PAGE_SIZE:
+                break
+            params["skip"] += OPENFDA_PAGE_SIZE
+            if params["skip"] >= OPENFDA_MAX_SKIP:
+                lower, params["skip"] = results[-1]["decision_date"], 0
+    logger.info(f"Refreshed predicate index from {since}: {written} records")
+    if written:
+        clear_vector_cache()
+    return written
+
+
+async def _refresh_loop() -> None:
+    while True:
+        try:
+            await refresh()
+        except Exception as e:
+            logger.error(f"Predicate index refresh failed: {str(e)}")
+        await asyncio.sleep(PREDICATE_REFRESH_HOURS * 3600)
+
+
+def start_refresh_task() -> None:
+    global _refresh_task
+    if PREDICATE_REFRESH_HOURS > 0 and _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop_refresh_task() -> None:
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        await asyncio.gather(_refresh_task, return_exceptions=True)
+        _refresh_task = None
+
+
+async def has_product_code(product_code: str) -> bool:
+    return await read_collection.find_one({"product_code": product_code.upper()}, {"_id": 1}) is not None
+
+
+async def search(
+    product_code: Optional[str] = None,
+    description: Optional[str] = None,
+    k_number: Optional[str] = None,
+    applicant: Optional[str] = None,
+    limit: int = PREDICATE_CANDIDATES,
+) -> List[Dict[str, Any]]:
+    """
+    Candidate predicates from the local index.
+
+    :param product_code: Restrict to this product code.
+    :param description: Full-text query over device names; best matches first.
+    :param k_number: Exact K number; other filters are ignored.
+    :param applicant: Restrict to this applicant (exact, case-sensitive as stored).
+    :param limit: Maximum number of records.
+    :return: Index documents without their name_embedding (see name_vectors), most relevant
+        (or, without a description, most recent) first.
+    """
+    started = time.perf_counter()
+    try:
+        projection = {"name_embedding": 0}
+        if k_number:
+            record = await read_collection.find_one({"_id": k_number.strip().upper()}, projection)
+            return [record] if record else []
+        query: Dict[str, Any] = {}
+        if product_code:
+            query["product_code"] = product_code.upper()
+        if applicant:
+            query["applicant"] = applicant
+        if description and description.strip():
+            cursor = read_collection.find(
+                {**query, "$text": {"$search": description}},
+                {**projection, "score": {"$meta": "textScore"}},
+            ).sort([("score", {"$meta": "textScore"})]).limit(limit)
+            matches = await cursor.to_list(length=limit)
+            if matches:
+                return matches
+        # No description, or no device name shares a word with it: most recent clearances
+        cursor = read_collection.find(query, projection).sort("decision_date", DESCENDING).limit(limit)
+        return await cursor.to_list(length=limit)
+    finally:
+        predicate_index_search_seconds.observe(time.perf_counter() - started)
+
+
+def clear_vector_cache() -> None:
+    global _vector_cache_rows
+    _vector_cache.clear()
+    _vector_cache_rows = 0
+
+
+def _cache_vectors(product_code: str, rows: Dict[str, int], matrix: np.ndarray) -> None:
+    global _vector_cache_rows
+    previous = _vector_cache.pop(product_code, None)
+    if previous is not None:
+        _vector_cache_rows -= len(previous[1])
+    if len(rows) > PREDICATE_VECTOR_CACHE_ROWS:
+        return
+    while _vector_cache and _vector_cache_rows + len(rows) > PREDICATE_VECTOR_CACHE_ROWS:
+        _, (_, evicted, _) = _vector_cache.popitem(last=False)
+        _vector_cache_rows -= len(evicted)
+    _vector_cache[product_code] = (time.monotonic(), rows, matrix)
+    _vector_cache_rows += len(rows)
+
+
+def _stack(records: List[Dict[str, Any]]) -> Tuple[Dict[str, int], np.ndarray]:
+    rows = {record["_id"]: i for i, record in enumerate(records)}
+    return rows, np.asarray([record["name_embedding"] for record in records], dtype=np.float32)
+
+
+async def name_vectors(product_code: str) -> Tuple[Dict[str, int], np.ndarray]:
+    """
+    Device-name embeddings of every clearance under a product code that has one.
+
+    :return: K number -> row of the matrix, and a (records, dimensions) float32 matrix.
+    """
+    product_code = product_code.upper()
+    cached = _vector_cache.get(product_code)
+    if cached is not None and time.monotonic() - cached[0] < PREDICATE_VECTOR_CACHE_SECONDS:
+        _vector_cache.move_to_end(product_code)
+        return cached[1], cached[2]
+    # Concurrent first requests for a code share one load
+    async with _vector_locks.setdefault(product_code, asyncio.Lock()):
+        cached = _vector_cache.get(product_code)
+        if cached is not None and time.monotonic() - cached[0] < PREDICATE_VECTOR_CACHE_SECONDS:
+            return cached[1], cached[2]
+        records = await read_collection.find(
+            {"product_code": product_code, "name_embedding": {"$exists": True}},
+            {"name_embedding": 1},
+        ).to_list(length=None)
+        rows, matrix = await asyncio.to_thread(_stack, records) if records else ({}, np.zeros((0, 0), dtype=np.float32))
+        _cache_vectors(product_code, rows, matrix)
+        return rows, matrix
+
+
+async def embed_device_names(encode: Callable[[List[str]], Sequence[Sequence[float]]], batch_size: int = EMBED_BATCH_SIZE) -> int:
+    """
+    Store a name_embedding on every record that lacks one, for the predicate ranker.
+
+    :param encode: Embeds a batch of device names, e.g. a sentence-transformer's encode.
+    :return: Number of records embedded.
+    """
+    embedded = 0
+    while True:
+        batch = await collection.find({"name_embedding": {"$exists": False}}, {"device_name": 1}).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        vectors = await asyncio.to_thread(encode, [record["device_name"] for record in batch])
+        await collection.bulk_write([
+            UpdateOne({"_id": record["_id"]}, {"$set": {"name_embedding": [float(x) for x in vector]}})
+            for record, vector in zip(batch, vectors)
+        ], ordered=False)
+        embedded += len(batch)
+        logger.info(f"Embedded {embedded} device names")
+    if embedded:
+        clear_vector_cache()
+    return embedded
+
+
+async def _main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Maintain the local FDA 510(k) predicate index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("load", help="load an openFDA bulk download")
+    load.add_argument("path")
+    update = commands.add_parser("refresh", help="fetch clearances since the latest decision date")
+    update.add_argument("--since", default=None, help="YYYY-MM-DD; defaults to the index watermark")
+    commands.add_parser("embed", help="embed device names that have no embedding yet")
+    args = parser.parse_args(argv)
+
+    if args.command == "load":
+        await load_bulk_file(args.path)
+    elif args.command == "embed":
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(os.getenv("MODEL_NAME", "nomic-ai/nomic-embed-text-v1"), trust_remote_code=True)
+        await embed_device_names(lambda names: model.encode(names, normalize_embeddings=True))
+    else:
+        await ensure_indexes()
+        await refresh(args.since)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
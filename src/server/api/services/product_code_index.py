@@ -0,0 +1,148 @@
+import asyncio
+import bisect
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from api.services.db import db
+from api.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# How often a process checks sync_state for product codes synced by another process
+PRODUCT_CODE_INDEX_CHECK_SECONDS = float(os.getenv("PRODUCT_CODE_INDEX_CHECK_SECONDS", "60"))
+
+MATCH_EXACT_CODE = "exact_code"
+MATCH_CODE_PREFIX = "code_prefix"
+MATCH_NAME_PREFIX = "name_prefix"
+MATCH_TOKEN_PREFIX = "token_prefix"
+MATCH_SUBSTRING = "substring"
+_RANKS = [MATCH_EXACT_CODE, MATCH_CODE_PREFIX, MATCH_NAME_PREFIX, MATCH_TOKEN_PREFIX, MATCH_SUBSTRING]
+
+product_code_index_size = REGISTRY.gauge("product_code_index_size", "Product codes in the in-memory typeahead index")
+product_code_index_builds_total = REGISTRY.counter("product_code_index_builds_total", "Typeahead index rebuilds")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class ProductCodeIndex:
+    """
+    In-memory typeahead over product codes and device names.
+
+    Codes and name tokens are kept in sorted arrays, so every prefix lookup is
+    a binary search; only the substring tier scans, and only when the
+    better tiers did not fill the page. Matches rank as exact code, code
+    prefix, name prefix, every query word prefixing a name word, then
+    substring of code or name.
+    """
+
+    def __init__(self, records: List[Dict[str, Any]], version: Any = None):
+        self.version = version
+        self.records = sorted(
+            ({"code": r["code"], "name": r.get("name") or "", "regulation_number": r.get("regulation_number")} for r in records if r.get("code")),
+            key=lambda r: r["code"],
+        )
+        self._codes = [r["code"].lower() for r in self.records]
+        self._names = [r["name"].lower() for r in self.records]
+        self._by_code = {code: i for i, code in enumerate(self._codes)}
+        tokens = sorted({(token, i) for i, name in enumerate(self._names) for token in _TOKEN_RE.findall(name)})
+        self._token_keys = [token for token, _ in tokens]
+        self._token_ids = [i for _, i in tokens]
+        self._name_order = sorted(range(len(self.records)), key=lambda i: self._names[i])
+        self._sorted_names = [self._names[i] for i in self._name_order]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @staticmethod
+    def _prefix_range(keys: List[str], prefix: str) -> Tuple[int, int]:
+        return bisect.bisect_left(keys, prefix), bisect.bisect_left(keys, prefix + "\uffff")
+
+    def _token_prefix(self, token: str) -> Set[int]:
+        start, stop = self._prefix_range(self._token_keys, token)
+        return set(self._token_ids[start:stop])
+
+    def search(self, query: str, limit: Optional[int] = 10) -> List[Dict[str, Any]]:
+        """
+        Ranked matches for a typed query.
+
+        :param query: What the user typed so far.
+        :param limit: Maximum number of matches; None returns all of them.
+        :return: Records with a `match` field naming the tier they matched in.
+        """
+        q = query.strip().lower()
+        if not q:
+            return []
+        tiers: Dict[str, List[int]] = {rank: [] for rank in _RANKS}
+        seen: Set[int] = set()
+
+        def add(rank: str, ids) -> bool:
+            for i in ids:
+                if i not in seen:
+                    seen.add(i)
+                    tiers[rank].append(i)
+            return limit is not None and len(seen) >= limit
+
+        full = False
+        if q in self._by_code:
+            full = add(MATCH_EXACT_CODE, [self._by_code[q]])
+        if not full:
+            start, stop = self._prefix_range(self._codes, q)
+            full = add(MATCH_CODE_PREFIX, range(start, stop))
+        if not full:
+            start, stop = self._prefix_range(self._sorted_names, q)
+            full = add(MATCH_NAME_PREFIX, self._name_order[start:stop])
+        words = _TOKEN_RE.findall(q)
+        if not full and words:
+            ids = self._token_prefix(words[0])
+            for word in words[1:]:
+                ids &= self._token_prefix(word)
+            full = add(MATCH_TOKEN_PREFIX, sorted(ids))
+        if not full:
+            full = add(MATCH_SUBSTRING, (i for i in range(len(self.records)) if q in self._codes[i] or q in self._names[i]))
+
+        results = []
+        for rank in _RANKS:
+            for i in tiers[rank]:
+                results.append({**self.records[i], "match": rank})
+        return results[:limit] if limit is not None else results
+
+
+_index = ProductCodeIndex([])
+_last_check = 0.0
+_rebuild_lock = asyncio.Lock()
+
+
+async def _current_version() -> Any:
+    state = await db.sync_state.find_one({"_id": "product_codes"}, {"release": 1, "count": 1, "source": 1})
+    return (state.get("release"), state.get("count"), state.get("source")) if state else None
+
+
+async def rebuild() -> ProductCodeIndex:
+    """Reload the index from product_codes; the new index replaces the old one in a single assignment."""
+    global _index, _last_check
+    async with _rebuild_lock:
+        started = time.perf_counter()
+        version = await _current_version()
+        records = await db.product_codes.find({}, {"_id": 0, "code": 1, "name": 1, "regulation_number": 1}).to_list(length=None)
+        index = await asyncio.to_thread(ProductCodeIndex, records, version)
+        _index, _last_check = index, time.monotonic()
+        product_code_index_size.set(len(index))
+        product_code_index_builds_total.inc()
+        logger.info(f"Built product code index over {len(index)} codes in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return index
+
+
+async def get_index() -> ProductCodeIndex:
+    """The current index, rebuilt first when product codes were synced since it was built (checked once a minute)."""
+    global _last_check
+    if time.monotonic() - _last_check >= PRODUCT_CODE_INDEX_CHECK_SECONDS:
+        _last_check = time.monotonic()
+        try:
+            if not len(_index) or await _current_version() != _index.version:
+                return await rebuild()
+        except Exception as e:
+            logger.warning(f"Could not refresh product code index, serving the previous one: {str(e)}")
+    return _index
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import re
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+import aiohttp
+from pymongo.errors import DuplicateKeyError
+
+from api.services.db import db
+from api.services import product_code_index, response_cache
+from api.services.metrics import REGISTRY
+from api.services.predicate_index import read_openfda_bulk_file
+
+logger = logging.getLogger(__name__)
+
+# Product codes are rebuilt in a staging collection and renamed over the live one,
+# so readers never see an empty or half-written product_codes. Pages written to
+# staging are recorded in sync_state, and an interrupted sync of the same openFDA
+# data release picks up where it stopped. Every API worker runs the sync loop, so
+# a sync first takes a lease in sync_state; workers that find it held skip the sync.
+FDA_CLASSIFICATION_URL = os.getenv("FDA_CLASSIFICATION_URL", "https://api.fda.gov/device/classification.json")
+FDA_API_KEY = os.getenv("FDA_API_KEY")
+PRODUCT_CODE_SYNC_HOURS = float(os.getenv("PRODUCT_CODE_SYNC_HOURS", "24"))
+PRODUCT_CODE_SYNC_CONCURRENCY = int(os.getenv("PRODUCT_CODE_SYNC_CONCURRENCY", "4"))
+# Refuse to swap in a result this much smaller than what is live, e.g. after a partial API outage
+PRODUCT_CODE_SYNC_MIN_RATIO = float(os.getenv("PRODUCT_CODE_SYNC_MIN_RATIO", "0.5"))
+# Renewed while a sync runs; a process that dies mid-sync holds it at most this long
+PRODUCT_CODE_SYNC_LEASE_SECONDS = float(os.getenv("PRODUCT_CODE_SYNC_LEASE_SECONDS", "300"))
+PAGE_SIZE = 1000
+PAGE_ATTEMPTS = 3
+SYNC_STATE_ID = "product_codes"
+# Namespace of the cached /api/product-codes responses, cleared when new codes are swapped in
+CACHE_NAMESPACE = "product-codes"
+
+product_codes = db.product_codes
+staging = db.product_codes_staging
+sync_state = db.sync_state
+
+product_code_syncs_total = REGISTRY.counter("product_code_syncs_total", "Product code syncs by outcome", ("source", "outcome"))
+product_code_sync_seconds = REGISTRY.histogram("product_code_sync_seconds", "Duration of product code syncs that swapped in new data", ("source",))
+
+_REGULATION_RE = re.compile(r"^\d{3}\.\d{4}$")
+_sync_task: Optional[asyncio.Task] = None
+_sync_lock = asyncio.Lock()
+
+
+class SyncAborted(Exception):
+    pass
+
+
+class SyncInProgress(SyncAborted):
+    """Another process holds the sync lease."""
+
+
+def select_product_codes(results: Iterable[Dict[str, Any]], page: int, stats: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Keep the Class II, non-exempt codes (those that go through 510(k)) from a page of classification results."""
+    selected = []
+    for item in results:
+        code = item.get("product_code", "Unknown")
+        name = item.get("device_name", "Unknown Device")
+        device_class = item.get("device_class", "U")
+        is_510k_exempt = item.get("510k_exempt", False)
+        regulation_number = item.get("regulation_number", None)
+        if regulation_number and not _REGULATION_RE.match(regulation_number):
+            logger.debug(f"Invalid regulation_number format for {code}: {regulation_number}")
+            regulation_number = None
+        if not isinstance(code, str) or not isinstance(name, str):
+            logger.warning(f"Invalid data for item: {item}")
+            continue
+        if stats is not None:
+            stats["class_counts"][device_class] = stats["class_counts"].get(device_class, 0) + 1
+            stats["exempt"] += bool(is_510k_exempt)
+        if device_class == "2" and not is_510k_exempt:
+            selected.append({
+                "code": code,
+                "name": name,
+                "device_class": device_class,
+                "510k_exempt": is_510k_exempt,
+                "regulation_number": regulation_number,
+                "sync_page": page,
+            })
+    return selected
+
+
+async def _get_state() -> Dict[str, Any]:
+    return await sync_state.find_one({"_id": SYNC_STATE_ID}) or {}
+
+
+async def _acquire_lease(owner: str) -> bool:
+    now = datetime.datetime.utcnow()
+    try:
+        await sync_state.find_one_and_update(
+            {"_id": SYNC_STATE_ID, "$or": [{"lease_owner": None}, {"lease_expires_at": {"$lt": now}}]},
+            {"$set": {"lease_owner": owner, "lease_expires_at": now + datetime.timedelta(seconds=PRODUCT_CODE_SYNC_LEASE_SECONDS)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The state document exists and its lease is held, so the upsert tried to insert a second one
+        return False
+    return True
+
+
+async def _renew_lease(owner: str) -> bool:
+    now = datetime.datetime.utcnow()
+    result = await sync_state.update_one(
+        {"_id": SYNC_STATE_ID, "lease_owner": owner},
+        {"$set": {"lease_expires_at": now + datetime.timedelta(seconds=PRODUCT_CODE_SYNC_LEASE_SECONDS)}},
+    )
+    return result.matched_count == 1
+
+
+async def _heartbeat(owner: str) -> None:
+    while True:
+        await asyncio.sleep(PRODUCT_CODE_SYNC_LEASE_SECONDS / 3)
+        if not await _renew_lease(owner):
+            logger.warning(f"Product code sync {owner} lost its lease")
+            return
+
+
+@asynccontextmanager
+async def _sync_lease() -> AsyncIterator[str]:
+    """Hold the cross-process sync lease for the block; raises SyncInProgress if another process has it."""
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    if not await _acquire_lease(owner):
+        raise SyncInProgress("Another process is syncing product codes")
+    heartbeat = asyncio.create_task(_heartbeat(owner))
+    try:
+        yield owner
+    finally:
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+        await sync_state.update_one({"_id": SYNC_STATE_ID, "lease_owner": owner}, {"$set": {"lease_owner": None, "lease_expires_at": None}})
+
+
+async def _fetch_page(session: aiohttp.ClientSession, skip: int) -> Dict[str, Any]:
+    params = {"limit": PAGE_SIZE, "skip": skip}
+    if FDA_API_KEY:
+        params["api_key"] = FDA_API_KEY
+    for attempt in range(1, PAGE_ATTEMPTS + 1):
+        try:
+            async with session.get(FDA_CLASSIFICATION_URL, params=params) as response:
+                if response.status == 200:
+                    return await response.json()
+                error = f"status {response.status}: {await response.text()}"
+                retryable = response.status == 429 or response.status >= 500
+        except aiohttp.ClientError as e:
+            error, retryable = str(e), True
+        if not retryable or attempt == PAGE_ATTEMPTS:
+            raise SyncAborted(f"openFDA classification page at skip={skip} failed: {error}")
+        await asyncio.sleep(2 ** attempt)
+
+
+async def _write_page(page: int, codes: List[Dict[str, Any]], release: str) -> None:
+    # Clearing the page first makes a retried or resumed page idempotent
+    await staging.delete_many({"sync_page": page})
+    if codes:
+        await staging.insert_many(codes)
+    await sync_state.update_one({"_id": SYNC_STATE_ID}, {"$addToSet": {"in_progress.pages": page}, "$set": {"in_progress.release": release}}, upsert=True)
+
+
+async def _begin(release: str, resume: bool = True) -> List[int]:
+    """Pages already in staging for this data release; staging is cleared if it holds another one."""
+    in_progress = (await _get_state()).get("in_progress") or {}
+    if resume and in_progress.get("release") == release:
+        return in_progress.get("pages", [])
+    await staging.drop()
+    await sync_state.update_one({"_id": SYNC_STATE_ID}, {"$set": {"in_progress": {"release": release, "pages": []}}}, upsert=True)
+    return []
+
+
+async def _swap(source: str, release: str, started: float, owner: str) -> int:
+    # A process that stalled past its lease may share staging with a newer sync; leave the swap to that one
+    if not await _renew_lease(owner):
+        product_code_syncs_total.inc(source=source, outcome="failed")
+        raise SyncAborted("Lost the product code sync lease before swapping; keeping the live collection")
+    count = await staging.count_documents({})
+    live = await product_codes.count_documents({})
+    if count == 0 or count < live * PRODUCT_CODE_SYNC_MIN_RATIO:
+        product_code_syncs_total.inc(source=source, outcome="rejected")
+        raise SyncAborted(f"Sync produced {count} product codes against {live} live; keeping the live collection")
+    await staging.create_index([("code", 1), ("name", 1)])
+    await staging.rename(product_codes.name, dropTarget=True)
+    await sync_state.update_one(
+        {"_id": SYNC_STATE_ID},
+        {"$set": {"release": release, "source": source, "count": count, "synced_at": datetime.datetime.utcnow()}, "$unset": {"in_progress": ""}},
+        upsert=True,
+    )
+    product_code_syncs_total.inc(source=source, outcome="swapped")
+    product_code_sync_seconds.observe(time.perf_counter() - started, source=source)
+    logger.info(f"Swapped in {count} 510(k)-related product codes from {source} (release {release})")
+    try:
+        await product_code_index.rebuild()
+    except Exception as e:
+        logger.warning(f"Product codes swapped in but the typeahead index was not rebuilt: {str(e)}")
+    await response_cache.invalidate(CACHE_NAMESPACE)
+    return count
+
+
+async def sync_from_fda(force: bool = False) -> Optional[int]:
+    """
+    Rebuild product codes from the openFDA classification endpoint.
+
+    :param force: Sync even if openFDA has not published new data since the last sync.
+    :return: Number of product codes swapped in, or None when already up to date or another process is syncing.
+    """
+    async with _sync_lock:
+        try:
+            async with _sync_lease() as owner:
+                return await _sync_from_fda(owner, force)
+        except SyncInProgress:
+            logger.info("Another process is syncing product codes, skipping")
+            return None
+
+
+async def _sync_from_fda(owner: str, force: bool) -> Optional[int]:
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        first = await _fetch_page(session, 0)
+        meta = first.get("meta", {})
+        release = meta.get("last_updated") or datetime.date.today().isoformat()
+        total = meta.get("results", {}).get("total", 0)
+        if not force and (await _get_state()).get("release") == release and await product_codes.estimated_document_count():
+            product_code_syncs_total.inc(source="fda", outcome="unchanged")
+            await sync_state.update_one({"_id": SYNC_STATE_ID}, {"$set": {"synced_at": datetime.datetime.utcnow()}})
+            logger.info(f"Product codes already synced from openFDA release {release}")
+            return None
+
+        done = set(await _begin(release))
+        stats = {"class_counts": {}, "exempt": 0}
+        if 0 not in done:
+            await _write_page(0, select_product_codes(first.get("results", []), 0, stats), release)
+        limit = asyncio.Semaphore(PRODUCT_CODE_SYNC_CONCURRENCY)
+
+        async def sync_page(skip: int) -> None:
+            async with limit:
+                data = await _fetch_page(session, skip)
+                await _write_page(skip, select_product_codes(data.get("results", []), skip, stats), release)
+
+        pending = [skip for skip in range(PAGE_SIZE, total, PAGE_SIZE) if skip not in done]
+        logger.info(f"Syncing product codes from openFDA release {release}: {total} classifications, {len(pending) + (0 not in done)} pages to fetch, {len(done)} already staged")
+        # Let every page finish before giving up, so a retry only refetches the failed ones
+        failures = [r for r in await asyncio.gather(*(sync_page(skip) for skip in pending), return_exceptions=True) if isinstance(r, BaseException)]
+        if failures:
+            product_code_syncs_total.inc(source="fda", outcome="failed")
+            raise failures[0]
+        logger.info(f"Device class counts (fetched pages): {stats['class_counts']}, 510(k)-exempt: {stats['exempt']}")
+    return await _swap("fda", release, started, owner)
+
+
+async def sync_from_file(path: str) -> int:
+    """
+    Rebuild product codes from an openFDA classification bulk download
+    (device-classification-*.json.zip, or the .json inside it), for hosts without API access.
+    """
+    async with _sync_lock, _sync_lease() as owner:
+        started = time.perf_counter()
+        results = await asyncio.to_thread(read_openfda_bulk_file, path)
+        release = f"file:{os.path.basename(path)}"
+        await _begin(release, resume=False)
+        for page, start in enumerate(range(0, len(results), PAGE_SIZE)):
+            await _write_page(page, select_product_codes(results[start:start + PAGE_SIZE], page), release)
+        return await _swap("file", release, started, owner)
+
+
+async def _sync_loop() -> None:
+    while True:
+        try:
+            state = await _get_state()
+            synced_at = state.get("synced_at")
+            stale = not synced_at or datetime.datetime.utcnow() - synced_at > datetime.timedelta(hours=PRODUCT_CODE_SYNC_HOURS)
+            if stale or not await product_codes.estimated_document_count():
+                await sync_from_fda()
+        except Exception as e:
+            logger.error(f"Product code sync failed: {str(e)}")
+        await asyncio.sleep(min(PRODUCT_CODE_SYNC_HOURS * 3600, 3600))
+
+
+def start_sync_task() -> None:
+    """Sync in the background: at once if there are no product codes, then every PRODUCT_CODE_SYNC_HOURS."""
+    global _sync_task
+    if PRODUCT_CODE_SYNC_HOURS > 0 and _sync_task is None:
+        _sync_task = asyncio.create_task(_sync_loop())
+
+
+async def stop_sync_task() -> None:
+    global _sync_task
+    if _sync_task is not None:
+        _sync_task.cancel()
+        await asyncio.gather(_sync_task, return_exceptions=True)
+        _sync_task = None
+
+
+async def _main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Sync 510(k)-related product codes")
+    parser.add_argument("--file", default=None, help="load an openFDA classification bulk download instead of calling the API")
+    parser.add_argument("--force", action="store_true", help="sync even if openFDA has no newer data")
+    args = parser.parse_args(argv)
+    if args.file:
+        await sync_from_file(args.file)
+    else:
+        await sync_from_fda(force=args.force)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,263 @@
+import datetime
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from bson import Binary
+from fastapi_cache import FastAPICache
+from fastapi_cache.types import Backend
+from pymongo.errors import DuplicateKeyError
+
+from api.services.db import db
+from api.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Endpoint responses cached with fastapi-cache are kept in a per-worker LRU (L1),
+# bounded by bytes, in front of a store every worker shares (L2). L1 entries live
+# at most CACHE_L1_TTL_SECONDS, which bounds how long a worker can keep serving an
+# entry that another worker has invalidated.
+CACHE_PREFIX = "fastapi-cache"
+CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", str(64 * 1024 * 1024)))
+# Larger values skip L1 so one response cannot flush everything else
+CACHE_L1_MAX_ENTRY_BYTES = int(os.getenv("CACHE_L1_MAX_ENTRY_BYTES", str(1024 * 1024)))
+CACHE_L1_TTL_SECONDS = int(os.getenv("CACHE_L1_TTL_SECONDS", "60"))
+# "mongo" (default), "redis" (needs CACHE_REDIS_URL and the redis package), "memory" or "none"
+CACHE_L2 = os.getenv("CACHE_L2", "mongo").lower()
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+CACHE_DEFAULT_EXPIRE = 3600
+
+cache_requests_total = REGISTRY.counter("cache_requests_total", "Response cache lookups by tier and outcome", ("tier", "outcome"))
+cache_evictions_total = REGISTRY.counter("cache_evictions_total", "Response cache entries dropped before being read again", ("tier", "reason"))
+cache_invalidations_total = REGISTRY.counter("cache_invalidations_total", "Response cache entries removed by invalidation", ("namespace",))
+cache_bytes = REGISTRY.gauge("cache_bytes", "Bytes held by the in-process response cache", ("tier",))
+cache_entries = REGISTRY.gauge("cache_entries", "Entries held by the in-process response cache", ("tier",))
+
+
+class LRUBackend(Backend):
+    """
+    In-process cache bounded by the total size of its values; the least
+    recently used entries are evicted first. Also serves as a stand-in L2
+    where no shared store is available.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_L1_MAX_BYTES, max_entry_bytes: int = CACHE_L1_MAX_ENTRY_BYTES, max_ttl: Optional[int] = None, tier: str = "l1"):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.max_ttl = max_ttl
+        self.tier = tier
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def _update_gauges(self) -> None:
+        cache_bytes.set(self._bytes, tier=self.tier)
+        cache_entries.set(len(self._entries), tier=self.tier)
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                self._drop(key)
+                self._update_gauges()
+                cache_evictions_total.inc(tier=self.tier, reason="expired")
+                entry = None
+            if entry is None:
+                return 0, None
+            self._entries.move_to_end(key)
+            return max(int(entry[1] - time.time()), 0), entry[0]
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self.get_with_ttl(key))[1]
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        expire = expire or CACHE_DEFAULT_EXPIRE
+        if self.max_ttl:
+            expire = min(expire, self.max_ttl)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if len(value) <= self.max_entry_bytes:
+                self._entries[key] = (value, time.time() + expire)
+                self._bytes += len(value)
+                while self._bytes > self.max_bytes:
+                    self._drop(next(iter(self._entries)))
+                    cache_evictions_total.inc(tier=self.tier, reason="size")
+            self._update_gauges()
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        with self._lock:
+            if namespace:
+                keys = [k for k in self._entries if k.startswith(namespace)]
+            elif key:
+                keys = [key] if key in self._entries else []
+            else:
+                keys = list(self._entries)
+            for k in keys:
+                self._drop(k)
+            self._update_gauges()
+            return len(keys)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+class MongoBackend(Backend):
+    """Shared cache in a collection whose TTL index removes expired entries."""
+
+    def __init__(self, collection=None):
+        self.collection = collection if collection is not None else db.http_cache
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        now = datetime.datetime.utcnow()
+        # The TTL monitor runs about once a minute, so expiry is also checked here
+        entry = await self.collection.find_one({"_id": key, "expires_at": {"$gt": now}})
+        if entry is None:
+            return 0, None
+        return int((entry["expires_at"] - now).total_seconds()), bytes(entry["value"])
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self.get_with_ttl(key))[1]
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=expire or CACHE_DEFAULT_EXPIRE)
+        try:
+            await self.collection.replace_one({"_id": key}, {"value": Binary(value), "expires_at": expires_at}, upsert=True)
+        except DuplicateKeyError:
+            # Another worker cached the same response at the same moment
+            pass
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if namespace:
+            # An anchored prefix regex is answered from the _id index
+            query = {"_id": {"$regex": f"^{re.escape(namespace)}"}}
+        elif key:
+            query = {"_id": key}
+        else:
+            query = {}
+        return (await self.collection.delete_many(query)).deleted_count
+
+
+class TieredBackend(Backend):
+    """
+    L1 in front of an optional L2. L2 hits are copied into L1; an L2 that
+    errors is treated as a miss, so an outage degrades to per-worker caching.
+    """
+
+    def __init__(self, l1: LRUBackend, l2: Optional[Backend] = None):
+        self.l1 = l1
+        self.l2 = l2
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        ttl, value = await self.l1.get_with_ttl(key)
+        cache_requests_total.inc(tier="l1", outcome="miss" if value is None else "hit")
+        if value is not None or self.l2 is None:
+            return ttl, value
+        try:
+            ttl, value = await self.l2.get_with_ttl(key)
+        except Exception as e:
+            cache_requests_total.inc(tier="l2", outcome="error")
+            logger.warning(f"Shared cache read failed for {key}: {str(e)}")
+            return 0, None
+        cache_requests_total.inc(tier="l2", outcome="miss" if value is None else "hit")
+        if value is not None and ttl > 0:
+            await self.l1.set(key, value, ttl)
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self.get_with_ttl(key))[1]
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        await self.l1.set(key, value, expire)
+        if self.l2 is not None:
+            try:
+                await self.l2.set(key, value, expire)
+            except Exception as e:
+                logger.warning(f"Shared cache write failed for {key}: {str(e)}")
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        cleared = await self.l1.clear(namespace, key)
+        if self.l2 is not None:
+            try:
+                cleared = max(cleared, await self.l2.clear(namespace, key))
+            except Exception as e:
+                logger.warning(f"Shared cache clear failed for {namespace or key}: {str(e)}")
+        return cleared
+
+
+def _build_l2() -> Optional[Backend]:
+    if CACHE_L2 == "redis":
+        if not CACHE_REDIS_URL:
+            logger.warning("CACHE_L2=redis but CACHE_REDIS_URL is not set; using MongoDB for the shared cache")
+        else:
+            try:
+                from redis import asyncio as aioredis
+                from fastapi_cache.backends.redis import RedisBackend
+            except ImportError:
+                logger.warning("CACHE_L2=redis but the redis package is not installed; using MongoDB for the shared cache")
+            else:
+                return RedisBackend(aioredis.from_url(CACHE_REDIS_URL))
+    if CACHE_L2 == "memory":
+        return LRUBackend(tier="l2")
+    if CACHE_L2 == "none":
+        return None
+    return MongoBackend()
+
+
+_backend: Optional[TieredBackend] = None
+
+
+async def init_cache() -> TieredBackend:
+    """Build the configured tiers and install them as the fastapi-cache backend."""
+    global _backend
+    l2 = _build_l2()
+    if isinstance(l2, MongoBackend):
+        await l2.ensure_indexes()
+    _backend = TieredBackend(LRUBackend(max_ttl=CACHE_L1_TTL_SECONDS), l2)
+    FastAPICache.init(_backend, prefix=CACHE_PREFIX)
+    logger.info(f"Response cache: {CACHE_L1_MAX_BYTES // (1024 * 1024)}MB in-process L1, shared L2: {type(l2).__name__ if l2 else 'none'}")
+    return _backend
+
+
+async def invalidate(namespace: str) -> int:
+    """
+    Drop every cached response of a namespace (the `namespace` given to
+    @cache) from this worker's L1 and from the shared L2.
+    """
+    if _backend is None:
+        return 0
+    try:
+        cleared = await FastAPICache.clear(namespace=namespace)
+    except Exception as e:
+        logger.warning(f"Could not invalidate cache namespace {namespace}: {str(e)}")
+        return 0
+    cache_invalidations_total.inc(cleared, namespace=namespace)
+    logger.info(f"Invalidated {cleared} cached responses in {namespace}")
+    return cleared
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    """Hit, miss and eviction counts per tier, plus L1 occupancy."""
+    tiers: Dict[str, Dict[str, float]] = {}
+    for (tier, outcome), value in cache_requests_total.values().items():
+        tiers.setdefault(tier, {})[{"hit": "hits", "miss": "misses", "error": "errors"}[outcome]] = value
+    for (tier, reason), value in cache_evictions_total.values().items():
+        tiers.setdefault(tier, {})[f"evictions_{reason}"] = value
+    for counts in tiers.values():
+        lookups = counts.get("hits", 0) + counts.get("misses", 0)
+        counts["hit_ratio"] = round(counts.get("hits", 0) / lookups, 4) if lookups else 0.0
+    if _backend is not None:
+        tiers.setdefault("l1", {}).update(_backend.l1.stats())
+    return tiers
@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Union
+
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+@dataclass
+class StoredFile:
+    path: Path
+    size: int
+    sha256: str
+
+
+def _write_chunk(f: BinaryIO, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    f.write(chunk)
+
+
+def _commit(f: BinaryIO, temp_path: Path, dest: Path) -> None:
+    f.close()
+    os.replace(temp_path, dest)
+
+
+def _discard(f: BinaryIO, temp_path: Path) -> None:
+    f.close()
+    temp_path.unlink(missing_ok=True)
+
+
+async def save_upload(
+    file: UploadFile,
+    dest: Union[str, Path],
+    max_size: int = MAX_UPLOAD_SIZE,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> StoredFile:
+    """
+    Stream an upload to `dest` without holding it in memory.
+
+    Chunks are hashed and written off the event loop into a temp file next to
+    `dest`, which is renamed into place only once the whole upload is in, so
+    readers never see a partial file. The size limit is enforced as bytes
+    arrive rather than after the fact.
+
+    :raises UploadTooLargeError: The upload exceeds `max_size` bytes; nothing is written.
+    """
+    dest = Path(dest)
+    limit_mb = max_size / 1024 / 1024
+    if file.size is not None and file.size > max_size:
+        raise UploadTooLargeError(f"File size exceeds {limit_mb:g}MB limit")
+
+    await asyncio.to_thread(dest.parent.mkdir, parents=True, exist_ok=True)
+    temp_path = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.part")
+    f = await asyncio.to_thread(open, temp_path, "wb")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLargeError(f"File size exceeds {limit_mb:g}MB limit")
+            await asyncio.to_thread(_write_chunk, f, digest, chunk)
+        await asyncio.to_thread(_commit, f, temp_path, dest)
+    except BaseException:
+        await asyncio.shield(asyncio.to_thread(_discard, f, temp_path))
+        raise
+
+    logger.info(f"Stored upload {file.filename} at {dest} ({size} bytes, sha256 {digest.hexdigest()[:12]})")
+    return StoredFile(path=dest, size=size, sha256=digest.hexdigest())
@@ -0,0 +1,30 @@
+import asyncio
+import logging
+import os
+
+# Importing the app registers the job handlers on the shared queue
+from api.main import job_queue
+
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+
+
+async def main():
+    """
+    Standalone job worker, run with `python -m api.worker` from src/server.
+    Set AI_JOB_WORKERS=0 on the API processes to keep generation off them entirely.
+    """
+    await job_queue.ensure_indexes()
+    job_queue.start(WORKER_CONCURRENCY)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await job_queue.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Job worker stopped")
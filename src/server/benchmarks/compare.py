@@ -0,0 +1,83 @@
+"""
+Diff two load-test reports written by `benchmarks/load_test.py`.
+
+Run from src/server:
+    python -m benchmarks.compare benchmarks/results/base.json benchmarks/results/head.json
+    python -m benchmarks.compare base.json head.json --fail-over 15
+
+Exits with status 1 when any scenario's p95 latency grew by more than
+--fail-over percent, or its error count grew, so it can gate a release.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+METRICS = (
+    ("p50", lambda s: s["latency_ms"]["p50"]),
+    ("p95", lambda s: s["latency_ms"]["p95"]),
+    ("p99", lambda s: s["latency_ms"]["p99"]),
+    ("rps", lambda s: s["throughput_rps"]),
+    ("mongo/req", lambda s: s["mongo_ops_per_request"]),
+    ("errors", lambda s: s["errors"]),
+)
+
+
+def _change(base: float, head: float) -> Optional[float]:
+    if not base:
+        return None
+    return (head - base) / base * 100
+
+
+def _format_change(change: Optional[float]) -> str:
+    return "   n/a" if change is None else f"{change:+6.1f}%"
+
+
+def compare(base: Dict[str, Any], head: Dict[str, Any], fail_over: float) -> List[str]:
+    """Print the comparison table and return the regressions found."""
+    for key in ("mongo", "llm_provider", "concurrency", "mix", "env"):
+        if base["meta"].get(key) != head["meta"].get(key):
+            print(f"warning: {key} differs ({base['meta'].get(key)} vs {head['meta'].get(key)}), numbers may not be comparable")
+
+    regressions = []
+    print(f"{'scenario':<12} {'metric':<10} {'base':>10} {'head':>10} {'change':>8}")
+    base_rows = {**base["scenarios"], "overall": base["overall"]}
+    head_rows = {**head["scenarios"], "overall": head["overall"]}
+    for name in [*sorted((set(base_rows) | set(head_rows)) - {"overall"}), "overall"]:
+        if name not in base_rows or name not in head_rows:
+            print(f"{name:<12} only in {'head' if name in head_rows else 'base'}")
+            continue
+        for metric, value in METRICS:
+            before, after = value(base_rows[name]), value(head_rows[name])
+            change = _change(before, after)
+            print(f"{name:<12} {metric:<10} {before:>10} {after:>10} {_format_change(change):>8}")
+            if metric == "p95" and change is not None and change > fail_over:
+                regressions.append(f"{name}: p95 {before}ms -> {after}ms ({change:+.1f}%)")
+            if metric == "errors" and after > before:
+                regressions.append(f"{name}: errors {before} -> {after}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two load-test reports")
+    parser.add_argument("base", help="report from the previous release")
+    parser.add_argument("head", help="report from the candidate")
+    parser.add_argument("--fail-over", type=float, default=10.0, help="allowed p95 growth in percent")
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    regressions = compare(base, head, args.fail_over)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
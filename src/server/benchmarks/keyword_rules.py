@@ -0,0 +1,92 @@
+"""
+Benchmark checklist keyword matching on large `contentExtracted` payloads.
+
+Compares the original approach (lowercasing the whole content for every keyword
+of every checklist item) with the Aho–Corasick scan in checklist_validator,
+over every checklist question in the rules file.
+
+Run from src/server:
+    python -m benchmarks.keyword_rules --pages 50 --repeat 20
+    python -m benchmarks.keyword_rules --file extracted.txt --out results/keywords.json
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from api.services.checklist_validator import KEYWORD_RULES, scan_keywords, prevalidate
+
+WORDS_PER_PAGE = 500
+FILLER = (
+    "the device was evaluated according to the protocol and all samples were processed by trained operators "
+    "using the reagent lots listed in the appendix with calibration performed before each run"
+).split()
+
+
+def synthetic_content(pages: int, seed: int, keyword_density: float) -> str:
+    """Extracted-PDF-like text with rule keywords sprinkled between filler words."""
+    rng = random.Random(seed)
+    keywords = [keyword for keywords in KEYWORD_RULES.values() for keyword in keywords]
+    words: List[str] = []
+    for _ in range(pages * WORDS_PER_PAGE):
+        words.append(rng.choice(keywords) if rng.random() < keyword_density else rng.choice(FILLER))
+    return " ".join(words)
+
+
+def legacy_match(content: str, checklist: List[Dict]) -> List[bool]:
+    # The pre-automaton validate_checklist inner loop
+    results = []
+    for item in checklist:
+        validated = False
+        for keyword in KEYWORD_RULES.get(item["question"], []):
+            if keyword.lower() in content.lower():
+                validated = True
+                break
+        results.append(validated)
+    return results
+
+
+def time_it(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(timings), 3), "min_ms": round(min(timings), 3), "max_ms": round(max(timings), 3)}
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Benchmark checklist keyword matching")
+    parser.add_argument("--pages", type=int, default=50, help="size of the synthetic payload in ~500-word pages")
+    parser.add_argument("--file", default=None, help="use this extracted text instead of a synthetic payload")
+    parser.add_argument("--keyword-density", type=float, default=0.002, help="share of synthetic words that are rule keywords")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=None, help="also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    content = Path(args.file).read_text(encoding="utf-8") if args.file else synthetic_content(args.pages, args.seed, args.keyword_density)
+    checklist = [{"id": f"chk_{i}", "question": question} for i, question in enumerate(KEYWORD_RULES)]
+
+    report = {
+        "content_chars": len(content),
+        "checklist_items": len(checklist),
+        "keywords": sum(len(keywords) for keywords in KEYWORD_RULES.values()),
+        "legacy": time_it(lambda: legacy_match(content, checklist), args.repeat),
+        "scan_only": time_it(lambda: scan_keywords(content), args.repeat),
+        "prevalidate": time_it(lambda: prevalidate("E1", checklist, content), args.repeat),
+    }
+    report["speedup"] = round(report["legacy"]["median_ms"] / report["prevalidate"]["median_ms"], 1)
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""
+End-to-end load test for the FastAPI service.
+
+Boots the app in-process against mongomock (default) or a local mongod, seeds a
+corpus of submissions, checklist templates and Document Hub records, then drives
+a weighted mix of requests with fixed concurrency. Latency percentiles,
+throughput and Mongo operations per request are written as JSON so results can
+be diffed between releases with `benchmarks/compare.py`.
+
+Run from src/server, after `pip install -r benchmarks/requirements.txt`:
+    python -m benchmarks.load_test --submissions 200 --requests 2000 --concurrency 32
+    python -m benchmarks.load_test --mongo mongodb://localhost:27017 --out results/main.json
+    python -m benchmarks.load_test --mix list=5,open=5,patch=2,validate=1
+
+LLM calls go to the local stand-in (LLM_PROVIDER=local) unless --llm-provider
+says otherwise, so runs are reproducible and do not spend Groq quota. The LLM
+scheduler still enforces the per-model Groq rate limits, so LLM-bound scenarios
+queue (and eventually 429) exactly as in production; raise LLM_RATE_LIMITS to
+measure the service's own overhead instead.
+
+The chat scenario embeds the query with the real embedding model and needs an
+Atlas $vectorSearch index, so it is left out of the default mix against
+mongomock; pass it in --mix (with a real cluster) to include it.
+"""
+import argparse
+import asyncio
+import contextvars
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("benchmarks.load_test")
+
+DEFAULT_MIX = "list=3,open=4,patch=2,rta_review=1,validate=1,chat=1,documents=2"
+# Default against mongomock, which has no $vectorSearch
+MOCK_DEFAULT_MIX = "list=3,open=4,patch=2,rta_review=1,validate=1,documents=2"
+ORG_ID = "org-bench"
+PERCENTILES = (50, 95, 99)
+# Settings that change the numbers; recorded with every report so diffs compare like with like
+RECORDED_ENV = ("LLM_RATE_LIMITS", "LLM_MAX_CONCURRENCY", "LOCAL_LLM_LATENCY", "LOCAL_LLM_TOKENS_PER_SECOND", "MAX_FANOUT")
+
+# Per-request counter of Mongo operations; each request task gets its own list
+_request_ops: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("request_ops", default=None)
+_inside_op: contextvars.ContextVar[bool] = contextvars.ContextVar("inside_op", default=False)
+
+
+def _count_op() -> None:
+    ops = _request_ops.get()
+    if ops is not None:
+        ops[0] += 1
+
+
+def _install_mongomock() -> None:
+    """Route every Motor client the app creates to one shared in-memory server."""
+    import mongomock
+    import motor.motor_asyncio
+    from mongomock_motor import AsyncMongoMockClient
+
+    shared = AsyncMongoMockClient()
+
+    def client_factory(*args, **kwargs):
+        return shared
+
+    motor.motor_asyncio.AsyncIOMotorClient = client_factory
+
+    # mongomock calls its own public methods internally (find_one -> find), so only the outermost call counts
+    def counted(method):
+        def wrapper(*args, **kwargs):
+            if _inside_op.get():
+                return method(*args, **kwargs)
+            _count_op()
+            token = _inside_op.set(True)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                _inside_op.reset(token)
+        return wrapper
+
+    for name in (
+        "find", "find_one", "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+        "insert_one", "insert_many", "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+        "count_documents", "estimated_document_count", "aggregate", "distinct", "bulk_write",
+    ):
+        setattr(mongomock.collection.Collection, name, counted(getattr(mongomock.collection.Collection, name)))
+
+
+def _install_command_listener() -> None:
+    """Count commands sent to a real mongod; Motor runs them with the caller's context."""
+    from pymongo import monitoring
+
+    class OpCounter(monitoring.CommandListener):
+        def started(self, event):
+            if event.command_name not in ("getMore", "endSessions", "killCursors"):
+                _count_op()
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    monitoring.register(OpCounter())
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}, expected one of {sorted(SCENARIOS)}")
+        mix[name] = int(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    # Linear interpolation between closest ranks
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+class Corpus:
+    """Seeded data the scenarios pick their targets from."""
+
+    def __init__(self, submission_ids: List[str], subsections: List[Tuple[str, str, List[Dict]]]):
+        self.submission_ids = submission_ids
+        # (section_id, subsection_id, checklist) for every template subsection
+        self.subsections = subsections
+
+
+async def seed(submissions: int, documents: int, rng: random.Random) -> Corpus:
+    from api.models.submission import SubmissionCreate
+    from api.services.checklist_loader import seed_checklist_templates
+    from api.services.db import client
+    from api.services.submission_service import create_submission
+
+    db = client.fignos
+    await seed_checklist_templates()
+    template = await db.checklist_templates.find_one({"_id": "510k_v1"})
+    subsections = [
+        (section["id"], subsection["id"], subsection.get("checklist", []))
+        for section in template["sections"]
+        for subsection in section.get("subsections", [])
+    ]
+
+    # /validate and PATCH read checklists from checklist_prompts
+    await db.checklist_prompts.delete_many({})
+    await db.checklist_prompts.insert_many([
+        {"subsectionId": subsection_id, "submissionType": "510k", "checklist": checklist}
+        for _, subsection_id, checklist in subsections if checklist
+    ])
+
+    await db.submissions.delete_many({})
+    submission_ids = []
+    for i in range(1, submissions + 1):
+        submission_id = f"SUB-{i:03d}"
+        await create_submission(SubmissionCreate(
+            submission_title=f"Benchmark Analyzer {i} 510(k)",
+            device_name=f"Benchmark Analyzer {i}",
+            product_code=rng.choice(["JJE", "LCX", "QKO", "NBW"]),
+            device_class="class-ii",
+            predicate_device_name=f"Predicate Analyzer {i}",
+            predicate_k=f"K{rng.randint(100000, 999999)}",
+            intended_use="For the quantitative determination of analytes in human serum.",
+            clinical_setting="Hospital laboratory",
+            target_specimen="Serum",
+            target_market="US",
+            submitter_org="Benchmark Diagnostics",
+            contact_name="Load Tester",
+            contact_email="load.tester@example.com",
+            reviewer_id="reviewer-1",
+            internal_deadline=(datetime.date.today() + datetime.timedelta(days=90)).isoformat(),
+            submission_type="traditional",
+            regulatory_pathway="510k",
+        ), submission_id=submission_id)
+        submission_ids.append(submission_id)
+
+    await db.document_hub.delete_many({})
+    if documents:
+        now = datetime.datetime.utcnow().isoformat()
+        await db.document_hub.insert_many([
+            {
+                "_id": f"DOC-{i:06d}",
+                "name": f"Benchmark document {i}",
+                "type": rng.choice(["SOP", "Test Report", "Labeling", "Risk Analysis"]),
+                "section": section_id,
+                "sectionRef": subsection_id,
+                "status": rng.choice(["Draft", "Under Review", "Approved"]),
+                "fileUrl": f"/uploads/DOC-{i:06d}.docx",
+                "uploadedAt": now,
+                "uploadedBy": {"name": "Load Tester", "id": "user-bench", "orgId": ORG_ID, "roleId": "role-1", "departmentId": "dept-1"},
+                "version": "1.0",
+                "tags": ["benchmark"],
+                "orgId": ORG_ID,
+                "is_deleted": False,
+            }
+            for i, (section_id, subsection_id, _) in enumerate(rng.choices(subsections, k=documents), start=1)
+        ])
+
+    logger.info(f"Seeded {len(submission_ids)} submissions, {len(subsections)} subsections and {documents} documents")
+    return Corpus(submission_ids, subsections)
+
+
+def _content(rng: random.Random, subsection_id: str) -> str:
+    sentences = [
+        "The device is intended for the quantitative determination of analytes in human serum.",
+        "Performance was demonstrated through precision, linearity and method comparison studies.",
+        "The target population includes adult patients in hospital laboratory settings.",
+        "Technological characteristics are substantially equivalent to the predicate device.",
+        "Risk controls are verified and labeling describes limitations of the procedure.",
+    ]
+    return f"# {subsection_id}\n\n" + " ".join(rng.choices(sentences, k=rng.randint(3, 8)))
+
+
+# Each scenario returns (method, url, kwargs) for httpx
+Request = Tuple[str, str, Dict[str, Any]]
+
+
+def _list(corpus: Corpus, rng: random.Random) -> Request:
+    return "GET", "/api/submissions/", {}
+
+
+def _open(corpus: Corpus, rng: random.Random) -> Request:
+    section_id, _, _ = rng.choice(corpus.subsections)
+    return "GET", f"/api/submissions/{rng.choice(corpus.submission_ids)}/sections/{section_id}", {}
+
+
+def _patch(corpus: Corpus, rng: random.Random) -> Request:
+    section_id, subsection_id, _ = rng.choice(corpus.subsections)
+    body = {"subsectionId": subsection_id, "status": "in_progress", "content": _content(rng, subsection_id), "is_user_edited": True}
+    return "PATCH", f"/api/submissions/{rng.choice(corpus.submission_ids)}/sections/{section_id}", {"json": body}
+
+
+def _rta_review(corpus: Corpus, rng: random.Random) -> Request:
+    section_id, _, _ = rng.choice(corpus.subsections)
+    return "POST", f"/api/submissions/{rng.choice(corpus.submission_ids)}/sections/{section_id}/rta-review", {"json": {}}
+
+
+def _validate(corpus: Corpus, rng: random.Random) -> Request:
+    _, subsection_id, _ = rng.choice([s for s in corpus.subsections if s[2]])
+    return "POST", "/validate", {"json": {"content": _content(rng, subsection_id), "checklist_ids": [], "subsection_id": subsection_id}}
+
+
+def _chat(corpus: Corpus, rng: random.Random) -> Request:
+    query = rng.choice([
+        "What performance data is needed for a 510(k)?",
+        "How do I show substantial equivalence to a predicate?",
+        "What should the intended use statement include?",
+    ])
+    return "POST", "/chat", {"json": {"query": query}}
+
+
+def _documents(corpus: Corpus, rng: random.Random) -> Request:
+    params = {"orgId": ORG_ID}
+    if rng.random() < 0.5:
+        params["status"] = rng.choice(["Draft", "Under Review", "Approved"])
+    return "GET", "/api/documents/", {"params": params}
+
+
+SCENARIOS: Dict[str, Callable[[Corpus, random.Random], Request]] = {
+    "list": _list,
+    "open": _open,
+    "patch": _patch,
+    "rta_review": _rta_review,
+    "validate": _validate,
+    "chat": _chat,
+    "documents": _documents,
+}
+
+
+async def run_load(http, corpus: Corpus, mix: Dict[str, int], requests: int, concurrency: int, rng: random.Random) -> Tuple[List[Dict], float]:
+    plan = rng.choices(list(mix), weights=list(mix.values()), k=requests)
+    # Request bodies are drawn up front so every run with the same seed sends the same traffic
+    work = iter([(name, SCENARIOS[name](corpus, rng)) for name in plan])
+    samples: List[Dict] = []
+
+    async def send(name: str, request: Request) -> None:
+        method, url, kwargs = request
+        ops = [0]
+        _request_ops.set(ops)
+        started = time.perf_counter()
+        try:
+            response = await http.request(method, url, **kwargs)
+            status = response.status_code
+        except Exception as e:
+            logger.error(f"{name} {method} {url} raised {type(e).__name__}: {e}")
+            status = 0
+        samples.append({"scenario": name, "latency": time.perf_counter() - started, "status": status, "mongo_ops": ops[0]})
+
+    async def worker() -> None:
+        for name, request in work:
+            # A fresh task per request keeps each request's op counter in its own context
+            await asyncio.create_task(send(name, request))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples: List[Dict], elapsed: float) -> Dict[str, Any]:
+    def stats(group: List[Dict]) -> Dict[str, Any]:
+        latencies = sorted(s["latency"] * 1000 for s in group)
+        errors = [s for s in group if not 200 <= s["status"] < 400]
+        result = {
+            "requests": len(group),
+            "errors": len(errors),
+            "error_statuses": {str(code): sum(1 for s in errors if s["status"] == code) for code in sorted({s["status"] for s in errors})},
+            "throughput_rps": round(len(group) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+                "max": round(latencies[-1], 2) if latencies else 0.0,
+            },
+            "mongo_ops_per_request": round(sum(s["mongo_ops"] for s in group) / len(group), 2) if group else 0.0,
+        }
+        for pct in PERCENTILES:
+            result["latency_ms"][f"p{pct}"] = round(percentile(latencies, pct), 2)
+        return result
+
+    scenarios = sorted({s["scenario"] for s in samples})
+    return {
+        "overall": stats(samples),
+        "scenarios": {name: stats([s for s in samples if s["scenario"] == name]) for name in scenarios},
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    os.environ.setdefault("LLM_PROVIDER", args.llm_provider)
+    if args.mongo == "mock":
+        _install_mongomock()
+    else:
+        os.environ["MONGODB_URI"] = args.mongo
+        os.environ.setdefault("MONGODB_TLS", "false")
+        _install_command_listener()
+
+    import httpx
+    from fastapi_cache import FastAPICache
+    from fastapi_cache.backends.inmemory import InMemoryBackend
+
+    from api.main import app
+
+    # Startup would build vector indexes and job workers; the benchmark only needs the cache
+    FastAPICache.init(InMemoryBackend())
+
+    rng = random.Random(args.seed)
+    corpus = await seed(args.submissions, args.documents, rng)
+    mix = parse_mix(args.mix or (MOCK_DEFAULT_MIX if args.mongo == "mock" else DEFAULT_MIX))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=args.timeout) as http:
+        if args.warmup:
+            await run_load(http, corpus, mix, args.warmup, args.concurrency, rng)
+        samples, elapsed = await run_load(http, corpus, mix, args.requests, args.concurrency, rng)
+
+    report = {
+        "meta": {
+            "started_at": datetime.datetime.utcnow().isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mongo": "mongomock" if args.mongo == "mock" else "mongod",
+            "llm_provider": os.environ["LLM_PROVIDER"],
+            "submissions": args.submissions,
+            "documents": args.documents,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": mix,
+            "seed": args.seed,
+            "elapsed_seconds": round(elapsed, 3),
+            "env": {name: os.environ[name] for name in RECORDED_ENV if name in os.environ},
+        },
+        **summarize(samples, elapsed),
+    }
+    return report
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(f"{'scenario':<12} {'requests':>8} {'errors':>6} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'mongo/req':>9}")
+    rows = [*report["scenarios"].items(), ("overall", report["overall"])]
+    for name, stats in rows:
+        latency = stats["latency_ms"]
+        print(f"{name:<12} {stats['requests']:>8} {stats['errors']:>6} {stats['throughput_rps']:>8.1f} "
+              f"{latency['p50']:>8.1f}ms {latency['p95']:>7.1f}ms {latency['p99']:>7.1f}ms {stats['mongo_ops_per_request']:>9.1f}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test the FastAPI service in-process")
+    parser.add_argument("--submissions", type=int, default=50, help="submissions to seed")
+    parser.add_argument("--documents", type=int, default=200, help="Document Hub records to seed")
+    parser.add_argument("--requests", type=int, default=500, help="measured requests")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests sent first")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument(
+        "--mix",
+        default=None,
+        help=f"weighted scenarios, one of {sorted(SCENARIOS)} (default {DEFAULT_MIX}, without chat against mongomock)",
+    )
+    parser.add_argument("--mongo", default="mock", help="'mock' for mongomock, or a mongodb:// URI (the database is wiped)")
+    parser.add_argument("--llm-provider", default="local", help="LLM_PROVIDER used when it is not already set")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the corpus and the request plan")
+    parser.add_argument("--out", default=None, help="write the JSON report here (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--verbose", action="store_true", help="keep the service's INFO logging")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if not args.verbose:
+        # The service logs every prompt and result at INFO, which would dominate the measurement
+        logging.disable(logging.INFO)
+    report = asyncio.run(main(args))
+    out = Path(args.out) if args.out else Path(__file__).parent / "results" / f"{datetime.datetime.utcnow():%Y%m%dT%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    _print_report(report)
+    print(f"Report written to {out}", file=sys.stderr)
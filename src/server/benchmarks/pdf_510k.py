@@ -0,0 +1,132 @@
+"""
+Benchmark 510(k) summary PDF field extraction over a folder of real PDFs.
+
+Compares the original parse_510k_pdf approach (pdfplumber over every page,
+then one regex search per field over the whole text) with pdf_510k_extractor
+(front pages only, one combined label scan), and reports where the two
+disagree on a field. Neither side calls the LLM. Some differences are
+expected: the original joined pages without a separator, so a value at the
+end of a page ran into the next one, and it only read K numbers written as
+"Re: K123456".
+
+Run from src/server:
+    python -m benchmarks.pdf_510k --dir ~/510k-summaries --repeat 3
+    python -m benchmarks.pdf_510k --dir ~/510k-summaries --out benchmarks/results/pdf_510k.json
+"""
+import argparse
+import io
+import json
+import re
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pdfplumber
+
+from api.ai.engines.pdf_510k_extractor import PDF_510K_FRONT_PAGES, PDF_510K_MAX_PAGES, _read_and_parse, parse_fields
+
+BLOCK_END = r"(?:\n\n|Enclosure|\Z|510\(k\)|Substantial Equivalence)"
+
+
+def legacy_read(data: bytes) -> str:
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        return "".join(page.extract_text() or "" for page in pdf.pages)
+
+
+def legacy_fields(text: str) -> Dict[str, str]:
+    # The pre-extractor parse_510k_pdf regexes, minus the LLM fallback
+    patterns = {
+        "device_name": (r"(?:Trade/Device Name|Device Name|Trade Name):\s*(.+?)(?:\n|$)", re.IGNORECASE),
+        "k_number": (r"(?:Re:\s*K(\d{6})|K\d{6})", re.IGNORECASE),
+        "product_code": (r"Product Code[s]?:\s*([\w;,\s]+?)(?:\n|$)", re.IGNORECASE),
+        "regulation_number": (r"(?:Regulation Number|CFR Number|Regulation No\.|21 CFR)\s*:?\s*(\d{3}\.\d{4}|\d{2}\.\d{3}\.\d{4})(?:\s|$|\n)", re.IGNORECASE),
+        "manufacturer": (r"(?:Applicant|Manufacturer):\s*(.+?)(?:\n|$|510\(k\))", re.IGNORECASE),
+        "clearance_date": (r"(?:Decision Date|Clearance Date|Date of Decision):\s*(\w{3}\s+\d{1,2},\s+\d{4})", re.IGNORECASE),
+        "indications_for_use": (rf"(?:Statement of Indications? for Use|Indications? for Use)\s*:?\s*(.+?){BLOCK_END}", re.IGNORECASE | re.DOTALL),
+        "intended_use": (rf"(?:Intended Use|Intended Purpose|Intended Use Statement)\s*:?\s*(.+?){BLOCK_END}", re.IGNORECASE | re.DOTALL),
+        "technology": (rf"(?:Technological Characteristics|Technology|Device Description)\s*:?\s*(.+?){BLOCK_END}", re.IGNORECASE | re.DOTALL),
+        "performance_claims": (rf"(?:Performance Data|Performance Claims|Clinical Performance|Test Results)\s*:?\s*(.+?){BLOCK_END}", re.IGNORECASE | re.DOTALL),
+    }
+    fields = {}
+    for name, (pattern, flags) in patterns.items():
+        match = re.search(pattern, text, flags)
+        if match and match.group(1):
+            value = match.group(1).strip()
+            if name == "k_number":
+                value = f"K{value}"
+            elif name == "product_code":
+                value = value.rstrip(";")
+            elif name == "indications_for_use":
+                value = re.sub(r"\(Division Sign-off\).*", "", value, flags=re.DOTALL).strip()
+            fields[name] = value
+    return fields
+
+
+def legacy_parse(data: bytes) -> Tuple[str, Dict[str, str]]:
+    text = legacy_read(data)
+    return text, legacy_fields(text)
+
+
+def time_it(fn: Callable[[], object], repeat: int) -> Tuple[float, object]:
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Benchmark 510(k) PDF field extraction")
+    parser.add_argument("--dir", required=True, help="folder of 510(k) summary PDFs")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default=None, help="also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    files = sorted(Path(args.dir).expanduser().glob("*.pdf"))
+    if not files:
+        parser.error(f"no PDFs in {args.dir}")
+
+    rows = []
+    for path in files:
+        data = path.read_bytes()
+        legacy_ms, (text, old_fields) = time_it(lambda: legacy_parse(data), args.repeat)
+        new_ms, (page_count, pages_read, _, new_fields) = time_it(
+            lambda: _read_and_parse(data, PDF_510K_FRONT_PAGES, PDF_510K_MAX_PAGES), args.repeat
+        )
+        # Scan cost alone, both over the same full text
+        legacy_scan_ms, _ = time_it(lambda: legacy_fields(text), args.repeat)
+        scan_ms, _ = time_it(lambda: parse_fields(text), args.repeat)
+        differing = sorted(name for name in set(old_fields) | set(new_fields) if old_fields.get(name) != new_fields.get(name))
+        rows.append({
+            "file": path.name,
+            "pages": page_count,
+            "pages_read": pages_read,
+            "legacy_ms": round(legacy_ms, 1),
+            "extractor_ms": round(new_ms, 1),
+            "legacy_scan_ms": round(legacy_scan_ms, 3),
+            "scan_ms": round(scan_ms, 3),
+            "fields_legacy": len(old_fields),
+            "fields_extractor": len(new_fields),
+            "differing_fields": differing,
+        })
+        print(f"{path.name:<40} {page_count:>4}p read {pages_read:>3}  legacy {legacy_ms:8.1f}ms  extractor {new_ms:8.1f}ms  differ {differing or '-'}")
+
+    report = {
+        "files": len(rows),
+        "legacy_median_ms": round(statistics.median(r["legacy_ms"] for r in rows), 1),
+        "extractor_median_ms": round(statistics.median(r["extractor_ms"] for r in rows), 1),
+        "files_with_differences": sum(1 for r in rows if r["differing_fields"]),
+        "rows": rows,
+    }
+    report["speedup"] = round(report["legacy_median_ms"] / report["extractor_median_ms"], 1) if report["extractor_median_ms"] else None
+    print(json.dumps({key: value for key, value in report.items() if key != "rows"}, indent=2))
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
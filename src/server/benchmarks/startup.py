@@ -0,0 +1,94 @@
+"""
+Benchmark process startup: how long `import api.main` takes and how much
+memory the process holds afterwards, in fresh interpreters. With --warm the
+lazily loaded components (embedding model, chat models) are then built one by
+one, to show what warm-up costs and what a worker that never needs them saves.
+
+Each run is a new subprocess, so module caches do not carry over; the first
+run may include cold disk reads. Mongo is not contacted during import.
+
+Run from src/server:
+    python -m benchmarks.startup --repeat 5
+    python -m benchmarks.startup --repeat 3 --warm --out benchmarks/results/startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Runs in the child; prints one JSON line
+_PROBE = r"""
+import json, resource, sys, time
+started = time.perf_counter()
+import api.main
+from api.services import components
+result = {"import_seconds": time.perf_counter() - started, "rss_after_import_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+if "--warm" in sys.argv:
+    loads = {}
+    for name in components.names():
+        began = time.perf_counter()
+        components.get(name).get()
+        loads[name] = time.perf_counter() - began
+    result["load_seconds"] = loads
+    result["rss_after_warm_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps(result))
+"""
+
+
+def run_once(warm: bool) -> Dict[str, Any]:
+    env = {**os.environ}
+    env.setdefault("LLM_PROVIDER", "local")
+    env.setdefault("MONGODB_TLS", "false")
+    completed = subprocess.run(
+        [sys.executable, "-c", _PROBE, *(["--warm"] if warm else [])],
+        capture_output=True, text=True, env=env, check=False,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Benchmark API process startup time and memory")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh processes to start")
+    parser.add_argument("--warm", action="store_true", help="also build every lazily loaded component")
+    parser.add_argument("--out", default=None, help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for i in range(args.repeat):
+        run = run_once(args.warm)
+        runs.append(run)
+        line = f"run {i + 1}: import {run['import_seconds']:.2f}s, {run['rss_after_import_mb']:.0f}MB"
+        if args.warm:
+            line += f"; warm {sum(run['load_seconds'].values()):.2f}s, {run['rss_after_warm_mb']:.0f}MB"
+        print(line)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "llm_provider": os.environ.get("LLM_PROVIDER", "local"),
+        "runs": len(runs),
+        "import_median_seconds": round(statistics.median(r["import_seconds"] for r in runs), 3),
+        "rss_after_import_median_mb": round(statistics.median(r["rss_after_import_mb"] for r in runs), 1),
+    }
+    if args.warm:
+        report["load_median_seconds"] = {
+            name: round(statistics.median(r["load_seconds"][name] for r in runs), 3) for name in runs[0]["load_seconds"]
+        }
+        report["rss_after_warm_median_mb"] = round(statistics.median(r["rss_after_warm_mb"] for r in runs), 1)
+    print(json.dumps(report, indent=2))
+    report["raw"] = runs
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()